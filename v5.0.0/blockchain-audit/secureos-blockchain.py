@@ -4,16 +4,152 @@ SecureOS v5.0.0 - Blockchain-Based Audit System
 Immutable, tamper-proof security event logging using distributed ledger technology
 """
 
+import os
 import sys
+import csv
+import gzip
 import json
+import mmap
+import zlib
+import struct
 import hashlib
+import hmac
 import time
+import queue
+import random
+import resource
+import tempfile
+import signal
+import socket
 import argparse
+import contextlib
+import subprocess
+import threading
+import socketserver
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 import sqlite3
+from collections import OrderedDict
+
+# Ed25519 host keys for signed sealing need the cryptography package; the
+# stdlib HMAC signer works without it
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+except ImportError:
+    Ed25519PrivateKey = None
+
+
+# Bump when the layout of the derived index tables changes so that existing
+# databases are re-indexed on the next start.
+INDEX_VERSION = 2
+
+# Output formats supported by export_compliance_report
+REPORT_FORMATS = ['json', 'ndjson', 'csv']
+
+# Archive segment file layout: magic, big-endian u32 header length, JSON
+# header (block index and anchor hashes), then zlib-compressed block records
+SEGMENT_MAGIC = b'SOSSEG1\n'
+SEGMENT_VERSION = 3
+
+# Block encodings. JSON blocks hash json.dumps(sort_keys=True) of the block
+# and are stored as events_json; binary blocks hash and store one canonical
+# byte string (see Block.encode)
+BLOCK_ENCODING_JSON = 0
+BLOCK_ENCODING_BINARY = 1
+BLOCK_MAGIC = b'SOSB'
+
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+
+# Block sealing modes. Proof-of-work blocks carry a hash with `difficulty`
+# leading zeros; signed blocks carry a host-key signature over their hash,
+# seal mode and key id (see _seal_message)
+SEAL_POW = 'pow'
+SEAL_SIGNED = 'signed'
+SEAL_MODES = [SEAL_POW, SEAL_SIGNED]
+
+# Host key algorithms for signed sealing. Post-quantum algorithms are refused
+# until QuantumCryptoEngine can actually verify their signatures (its
+# placeholder verify accepts any 32-byte value)
+CLASSICAL_SIGNERS = ['ed25519', 'hmac-sha256']
+
+# Columns selected whenever a block row is turned back into a Block
+BLOCK_COLUMNS = ('idx, timestamp, events_json, previous_hash, nonce, hash, encoding, block_blob, '
+                 'seal, seal_key, signature')
+
+# Unix socket served by the ingestion daemon (`secureos-blockchain serve`)
+DEFAULT_SOCKET_PATH = '/run/secureos/blockchain.sock'
+
+# Replication stream: frames of a one-byte kind, a big-endian u32 length and
+# a payload. A replica's locator ('L') is answered with a header ('H'), the
+# public host keys its blocks are signed with ('K') and zlib-compressed block
+# batches ('B'), closed by an end frame ('E'). Over a pipe the replica then
+# acknowledges with 'A'.
+SYNC_VERSION = 1
+
+
+def _index_key(value) -> Optional[str]:
+    """Normalize a scalar event value into its event_index key"""
+    # Keys may collide (1, 1.0, True and "1" share a key); search re-checks
+    # candidates against the original query so collisions only widen the scan.
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return None
+
+
+def _to_epoch(value) -> Optional[int]:
+    """Normalize an ISO-8601 string or numeric timestamp to integer epoch seconds"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, str) or not value:
+        return None
+    
+    # fromisoformat() only accepts a trailing 'Z' from Python 3.11 on
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        # Naive timestamps are local time, as written by datetime.now()
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+
+def _event_text(value) -> str:
+    """Flatten event values into a single string for full-text indexing"""
+    if isinstance(value, dict):
+        return ' '.join(_event_text(v) for v in value.values())
+    if isinstance(value, list):
+        return ' '.join(_event_text(v) for v in value)
+    if value is None:
+        return ''
+    return str(value)
+
+
+def _write_frame(f, kind: bytes, payload: bytes):
+    """Write one replication frame"""
+    f.write(kind + _U32.pack(len(payload)) + payload)
+
+
+def _read_frame(f) -> Tuple[bytes, bytes]:
+    """Read one replication frame as (kind, payload)"""
+    head = f.read(5)
+    if len(head) != 5:
+        raise ValueError("Replication stream ended unexpectedly")
+    length = _U32.unpack_from(head, 1)[0]
+    payload = f.read(length)
+    if len(payload) != length:
+        raise ValueError("Replication stream ended unexpectedly")
+    return head[:1], payload
 
 
 @dataclass
@@ -25,9 +161,18 @@ class Block:
     previous_hash: str
     nonce: int = 0
     hash: str = ""
+    encoding: int = BLOCK_ENCODING_JSON
+    seal: str = SEAL_POW
+    seal_key: str = ""
+    signature: str = ""
     
     def calculate_hash(self) -> str:
         """Calculate SHA-256 hash of the block"""
+        if self.encoding == BLOCK_ENCODING_BINARY:
+            # Blocks read from storage hash the exact bytes that were stored
+            encoded = self.__dict__.get('_encoded') or self.encode()
+            return hashlib.sha256(encoded).hexdigest()
+        
         block_data = {
             'index': self.index,
             'timestamp': self.timestamp,
@@ -41,15 +186,356 @@ class Block:
     def mine_block(self, difficulty: int = 4):
         """Proof of work - find hash with leading zeros"""
         target = '0' * difficulty
+        
+        if self.encoding == BLOCK_ENCODING_BINARY:
+            # The nonce is the last field, so the rest is hashed only once
+            prefix_hash = hashlib.sha256(self._encode_prefix())
+            nonce = self.nonce
+            while True:
+                nonce += 1
+                candidate = prefix_hash.copy()
+                candidate.update(_U64.pack(nonce))
+                digest = candidate.hexdigest()
+                if digest.startswith(target):
+                    break
+            self.nonce = nonce
+            self.hash = digest
+            return
+        
         while not self.hash.startswith(target):
             self.nonce += 1
             self.hash = self.calculate_hash()
+    
+    def _encode_prefix(self) -> bytes:
+        """Canonical encoding of every field except the trailing nonce"""
+        # Layout (integers big-endian, lengths u32):
+        #   magic, u8 encoding version, u64 index,
+        #   len + timestamp, len + previous_hash,
+        #   u32 event count, then len + canonical JSON for each event,
+        #   u64 nonce
+        # Events stay canonical JSON (sorted keys, no whitespace) so they are
+        # produced and parsed by the C json module rather than Python code.
+        timestamp = self.timestamp.encode()
+        previous_hash = self.previous_hash.encode()
+        parts = [
+            BLOCK_MAGIC,
+            bytes((BLOCK_ENCODING_BINARY,)),
+            _U64.pack(self.index),
+            _U32.pack(len(timestamp)), timestamp,
+            _U32.pack(len(previous_hash)), previous_hash,
+            _U32.pack(len(self.events))
+        ]
+        for event in self.events:
+            record = json.dumps(event, sort_keys=True, separators=(',', ':'),
+                                ensure_ascii=False).encode()
+            parts.append(_U32.pack(len(record)))
+            parts.append(record)
+        return b''.join(parts)
+    
+    def encode(self) -> bytes:
+        """Canonical binary encoding used for both hashing and storage"""
+        return self._encode_prefix() + _U64.pack(self.nonce)
+    
+    @classmethod
+    def decode(cls, data: bytes, block_hash: str = "") -> 'Block':
+        """Rebuild a block from its binary encoding"""
+        data = bytes(data)
+        if data[:4] != BLOCK_MAGIC:
+            raise ValueError("Not a binary-encoded block")
+        if data[4] != BLOCK_ENCODING_BINARY:
+            raise ValueError(f"Unsupported block encoding version: {data[4]}")
+        
+        pos = 5
+        index = _U64.unpack_from(data, pos)[0]
+        pos += 8
+        
+        fields = []
+        for _ in range(2):
+            length = _U32.unpack_from(data, pos)[0]
+            pos += 4
+            fields.append(data[pos:pos + length].decode())
+            pos += length
+        
+        count = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        records = []
+        for _ in range(count):
+            length = _U32.unpack_from(data, pos)[0]
+            pos += 4
+            records.append(data[pos:pos + length])
+            pos += length
+        
+        nonce = _U64.unpack_from(data, pos)[0]
+        if pos + 8 != len(data):
+            raise ValueError("Trailing data after encoded block")
+        
+        events = json.loads(b'[' + b','.join(records) + b']')
+        if len(events) != count:
+            raise ValueError("Malformed event record in encoded block")
+        
+        block = cls(
+            index=index,
+            timestamp=fields[0],
+            events=events,
+            previous_hash=fields[1],
+            nonce=nonce,
+            hash=block_hash,
+            encoding=BLOCK_ENCODING_BINARY
+        )
+        block._encoded = data
+        return block
+    
+    def to_blob(self, compress: bool = True) -> bytes:
+        """Storage form of a binary block, optionally zlib-compressed"""
+        encoded = self.encode()
+        return zlib.compress(encoded) if compress else encoded
+    
+    @classmethod
+    def from_blob(cls, blob: bytes, block_hash: str = "") -> 'Block':
+        """Inverse of to_blob; raw encodings are recognized by their magic"""
+        if bytes(blob[:4]) != BLOCK_MAGIC:
+            blob = zlib.decompress(blob)
+        return cls.decode(blob, block_hash)
+    
+    def to_record(self) -> bytes:
+        """Length-prefixed seal metadata and encoding, as shipped in replication batches"""
+        meta = json.dumps({
+            'hash': self.hash,
+            'encoding': self.encoding,
+            'seal': self.seal,
+            'seal_key': self.seal_key,
+            'signature': self.signature
+        }).encode()
+        if self.encoding == BLOCK_ENCODING_BINARY:
+            data = self.__dict__.get('_encoded') or self.encode()
+        else:
+            data = json.dumps(asdict(self)).encode()
+        return _U32.pack(len(meta)) + meta + _U32.pack(len(data)) + data
+    
+    @classmethod
+    def iter_records(cls, data: bytes) -> Iterator['Block']:
+        """Decode a run of to_record() records"""
+        pos = 0
+        while pos < len(data):
+            length = _U32.unpack_from(data, pos)[0]
+            meta = json.loads(data[pos + 4:pos + 4 + length])
+            pos += 4 + length
+            length = _U32.unpack_from(data, pos)[0]
+            record = data[pos + 4:pos + 4 + length]
+            pos += 4 + length
+            
+            if meta['encoding'] == BLOCK_ENCODING_BINARY:
+                block = cls.decode(record, meta['hash'])
+            else:
+                block = cls(**json.loads(record))
+            block.hash = meta['hash']
+            block.seal = meta['seal']
+            block.seal_key = meta['seal_key']
+            block.signature = meta['signature']
+            yield block
+
+
+class ArchiveSegment:
+    """Read-only view of a sealed, compressed range of old blocks"""
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic_len = len(SEGMENT_MAGIC)
+        if self._map[:magic_len] != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError(f"Not an audit archive segment: {self.path}")
+        
+        header_len = struct.unpack('>I', self._map[magic_len:magic_len + 4])[0]
+        self._data_start = magic_len + 4 + header_len
+        self.header = json.loads(self._map[magic_len + 4:self._data_start])
+        if self.header.get('version') != SEGMENT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported archive segment version {self.header.get('version')}: {self.path}")
+        
+        # index -> (offset, length, hash, encoding, seal) of the compressed block
+        # record; only signed blocks carry a seal entry
+        self._records = {
+            entry[0]: (entry[1], entry[2], entry[4], entry[5], entry[6] if len(entry) > 6 else None)
+            for entry in self.header['blocks']
+        }
+    
+    @staticmethod
+    def write(path: Path, blocks: List[Block]) -> str:
+        """Seal blocks into a new immutable segment file, returning its SHA-256"""
+        records = []
+        for block in blocks:
+            if block.encoding == BLOCK_ENCODING_BINARY:
+                records.append(zlib.compress(block.encode(), 9))
+            else:
+                records.append(zlib.compress(json.dumps(asdict(block)).encode(), 9))
+        
+        index = []
+        offset = 0
+        for block, record in zip(blocks, records):
+            entry = [block.index, offset, len(record), block.timestamp, block.hash, block.encoding]
+            if block.seal != SEAL_POW:
+                entry.append([block.seal, block.seal_key, block.signature])
+            index.append(entry)
+            offset += len(record)
+        
+        header = json.dumps({
+            'version': SEGMENT_VERSION,
+            'first_index': blocks[0].index,
+            'last_index': blocks[-1].index,
+            'anchor_hash': blocks[0].previous_hash,
+            'last_hash': blocks[-1].hash,
+            'event_count': sum(len(block.events) for block in blocks),
+            'sealed_at': datetime.now().isoformat(),
+            'blocks': index
+        }).encode()
+        
+        # Write to a temporary file and rename so a crash never leaves a
+        # half-written segment in place
+        digest = hashlib.sha256()
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            for part in [SEGMENT_MAGIC, struct.pack('>I', len(header)), header, *records]:
+                f.write(part)
+                digest.update(part)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+        
+        return digest.hexdigest()
+    
+    def read_block(self, index: int) -> Optional[Block]:
+        """Decode a single block from the segment"""
+        if index not in self._records:
+            return None
+        
+        offset, length, block_hash, encoding, seal = self._records[index]
+        start = self._data_start + offset
+        data = zlib.decompress(self._map[start:start + length])
+        if encoding != BLOCK_ENCODING_BINARY:
+            return Block(**json.loads(data))
+        
+        block = Block.decode(data, block_hash)
+        if seal:
+            block.seal, block.seal_key, block.signature = seal
+        return block
+    
+    def iter_blocks(self) -> Iterator[Block]:
+        """Decode the blocks of the segment in chain order"""
+        for entry in self.header['blocks']:
+            yield self.read_block(entry[0])
+    
+    def sha256(self) -> str:
+        """SHA-256 of the whole segment file"""
+        digest = hashlib.sha256()
+        for offset in range(0, len(self._map), 1 << 20):
+            digest.update(self._map[offset:offset + (1 << 20)])
+        return digest.hexdigest()
+    
+    def close(self):
+        """Release the mapping and file handle"""
+        self._map.close()
+        self._file.close()
+
+
+def _check_signer_algorithm(algorithm: str):
+    """Refuse host key algorithms whose signatures cannot be verified"""
+    if algorithm not in CLASSICAL_SIGNERS:
+        raise ValueError(f"{algorithm} host keys are not supported for sealing "
+                         f"(use one of: {', '.join(CLASSICAL_SIGNERS)})")
+
+
+class BlockSigner:
+    """Host key used to seal blocks in signed mode
+    
+    Keys live in `<keys_dir>/<key_id>/` (metadata.json, public.key,
+    secret.key).
+    """
+    
+    def __init__(self, keys_dir: Path, key_id: str):
+        self.key_id = key_id
+        self.key_dir = Path(keys_dir) / key_id
+        
+        with open(self.key_dir / 'metadata.json', 'r') as f:
+            self.metadata = json.load(f)
+        self.algorithm = self.metadata['algorithm']
+        _check_signer_algorithm(self.algorithm)
+        if self.algorithm == 'ed25519' and Ed25519PrivateKey is None:
+            raise RuntimeError("ed25519 host keys require the cryptography package")
+        
+        with open(self.key_dir / 'public.key', 'rb') as f:
+            self.public_key = f.read()
+        # Verifying hosts may only hold the public half
+        secret_path = self.key_dir / 'secret.key'
+        self.secret_key = secret_path.read_bytes() if secret_path.exists() else None
+    
+    @staticmethod
+    def generate(keys_dir: Path, key_id: str, algorithm: str) -> 'BlockSigner':
+        """Create and store a new host key"""
+        _check_signer_algorithm(algorithm)
+        if algorithm == 'ed25519':
+            if Ed25519PrivateKey is None:
+                raise RuntimeError("ed25519 host keys require the cryptography package")
+            private_key = Ed25519PrivateKey.generate()
+            secret_key = private_key.private_bytes(
+                serialization.Encoding.Raw, serialization.PrivateFormat.Raw,
+                serialization.NoEncryption()
+            )
+            public_key = private_key.public_key().public_bytes(
+                serialization.Encoding.Raw, serialization.PublicFormat.Raw
+            )
+        else:
+            # Symmetric: the "public" half only identifies the key
+            secret_key = os.urandom(32)
+            public_key = hashlib.sha256(secret_key).digest()
+        
+        key_dir = Path(keys_dir) / key_id
+        key_dir.mkdir(parents=True, exist_ok=True)
+        with open(key_dir / 'metadata.json', 'w') as f:
+            json.dump({
+                'key_id': key_id,
+                'algorithm': algorithm,
+                'created_at': datetime.now().isoformat()
+            }, f, indent=2)
+        with open(key_dir / 'public.key', 'wb') as f:
+            f.write(public_key)
+        
+        # Secret key readable only by its owner
+        fd = os.open(key_dir / 'secret.key', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(secret_key)
+        
+        return BlockSigner(keys_dir, key_id)
+    
+    def sign(self, message: bytes) -> bytes:
+        """Sign a message with the host key"""
+        if self.secret_key is None:
+            raise RuntimeError(f"Secret key for {self.key_id} is not available on this host")
+        if self.algorithm == 'ed25519':
+            return Ed25519PrivateKey.from_private_bytes(self.secret_key).sign(message)
+        return hmac.new(self.secret_key, message, hashlib.sha256).digest()
+    
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        """Check a signature made with this key"""
+        if self.algorithm == 'ed25519':
+            try:
+                Ed25519PublicKey.from_public_bytes(self.public_key).verify(signature, message)
+                return True
+            except InvalidSignature:
+                return False
+        if self.secret_key is None:
+            raise RuntimeError(f"Secret key for {self.key_id} is not available on this host")
+        return hmac.compare_digest(hmac.new(self.secret_key, message, hashlib.sha256).digest(), signature)
 
 
 class BlockchainAuditLog:
     """Blockchain-based immutable audit logging system"""
     
-    def __init__(self, db_path: str = "/var/lib/secureos/blockchain/audit.db"):
+    def __init__(self, db_path: str = "/var/lib/secureos/blockchain/audit.db", replica: bool = False):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
@@ -57,13 +543,46 @@ class BlockchainAuditLog:
         self.pending_events: List[Dict] = []
         self.difficulty = 4  # Mining difficulty
         self.block_size = 100  # Max events per block
+        self.verbose = True  # Print mining progress and success messages
+        self.block_encoding = BLOCK_ENCODING_BINARY  # Encoding for new blocks
+        self.compress_blocks = True  # zlib-compress stored binary blocks
+        
+        # Old blocks are sealed into compressed segment files next to the database
+        self.segments_dir = self.db_path.with_suffix('.segments')
+        self.segment_size = 10000  # Max blocks per archive segment
+        self._segments: Dict[int, ArchiveSegment] = {}
+        
+        # _lock guards chain/pending state; _mining_lock serializes block
+        # production so mining can run outside _lock in a background thread
+        self._lock = threading.RLock()
+        self._mining_lock = threading.Lock()
+        
+        # Host keys for signed sealing (see configure_sealing)
+        self.keys_dir = self.db_path.parent / 'keys'
+        self._signers: Dict[str, BlockSigner] = {}
+        
+        # Event fields maintained in the secondary search index
+        self.indexed_fields = ['type', 'user', 'severity', 'source', 'status', 'action', 'host']
+        self.fts_enabled = True  # Full-text index over event values (needs SQLite FTS5)
         
         # Initialize database
         self._init_database()
         
         # Load existing chain or create genesis block
         self._load_chain()
-        if not self.chain:
+        self._load_seal_config()
+        self._sync_event_index()
+        
+        # Replicas only hold blocks received from their source (read_sync_stream)
+        if replica and not self.replica:
+            if self.chain:
+                raise ValueError(f"{self.db_path} holds a local chain and cannot be used as a replica")
+            conn = sqlite3.connect(str(self.db_path))
+            self._set_meta(conn.cursor(), 'replica', 1)
+            conn.commit()
+            conn.close()
+            self.replica = True
+        if not self.chain and not self.replica:
             self._create_genesis_block()
     
     def _init_database(self):
@@ -71,6 +590,9 @@ class BlockchainAuditLog:
         conn = sqlite3.connect(str(self.db_path))
         cursor = conn.cursor()
         
+        # WAL lets readers proceed while the daemon's writer and miner commit
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS blocks (
                 idx INTEGER PRIMARY KEY,
@@ -79,10 +601,31 @@ class BlockchainAuditLog:
                 previous_hash TEXT NOT NULL,
                 nonce INTEGER NOT NULL,
                 hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                encoding INTEGER NOT NULL DEFAULT 0,
+                block_blob BLOB,
+                seal TEXT NOT NULL DEFAULT 'pow',
+                seal_key TEXT,
+                signature TEXT
             )
         ''')
         
+        # Databases created before binary blocks lack the encoding columns
+        cursor.execute('PRAGMA table_info(blocks)')
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'encoding' not in columns:
+            cursor.execute('ALTER TABLE blocks ADD COLUMN encoding INTEGER NOT NULL DEFAULT 0')
+        if 'block_blob' not in columns:
+            cursor.execute('ALTER TABLE blocks ADD COLUMN block_blob BLOB')
+        
+        # ...and, before signed sealing, the seal columns
+        if 'seal' not in columns:
+            cursor.execute(f"ALTER TABLE blocks ADD COLUMN seal TEXT NOT NULL DEFAULT '{SEAL_POW}'")
+        if 'seal_key' not in columns:
+            cursor.execute('ALTER TABLE blocks ADD COLUMN seal_key TEXT')
+        if 'signature' not in columns:
+            cursor.execute('ALTER TABLE blocks ADD COLUMN signature TEXT')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS pending_events (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -99,6 +642,67 @@ class BlockchainAuditLog:
             CREATE INDEX IF NOT EXISTS idx_block_timestamp ON blocks(timestamp)
         ''')
         
+        # Sealed archive segments; their blocks are no longer in `blocks`
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                first_idx INTEGER PRIMARY KEY,
+                last_idx INTEGER NOT NULL,
+                file_name TEXT NOT NULL,
+                file_sha256 TEXT NOT NULL,
+                anchor_hash TEXT NOT NULL,
+                last_hash TEXT NOT NULL,
+                event_count INTEGER NOT NULL,
+                sealed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chain_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        
+        # Secondary index: one row per indexed (field, value) of every event
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_index (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                block_idx INTEGER NOT NULL,
+                event_pos INTEGER NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_event_field_value
+            ON event_index(field, value, block_idx, event_pos)
+        ''')
+        
+        # Per-event timestamps as epoch seconds, for time-range scans
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_timestamps (
+                ts INTEGER NOT NULL,
+                block_idx INTEGER NOT NULL,
+                event_pos INTEGER NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_event_timestamp
+            ON event_timestamps(ts, block_idx, event_pos)
+        ''')
+        
+        if self.fts_enabled:
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5(
+                        content, block_idx UNINDEXED, event_pos UNINDEXED
+                    )
+                ''')
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5
+                self.fts_enabled = False
+        
         conn.commit()
         conn.close()
     
@@ -107,10 +711,23 @@ class BlockchainAuditLog:
         conn = sqlite3.connect(str(self.db_path))
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM blocks ORDER BY idx ASC')
-        rows = cursor.fetchall()
+        # Only hot blocks live in the database; sealed ones stay in segments
+        cursor.execute(f'SELECT {BLOCK_COLUMNS} FROM blocks ORDER BY idx ASC')
+        for row in cursor:
+            self.chain.append(self._row_to_block(row))
         
-        for row in rows:
+        # Load pending events
+        cursor.execute('SELECT event_json FROM pending_events')
+        for row in cursor.fetchall():
+            self.pending_events.append(json.loads(row[0]))
+        
+        conn.close()
+    
+    def _row_to_block(self, row) -> Block:
+        """Build a Block from a row of BLOCK_COLUMNS"""
+        if row[6] == BLOCK_ENCODING_BINARY:
+            block = Block.from_blob(row[7], row[5])
+        else:
             block = Block(
                 index=row[0],
                 timestamp=row[1],
@@ -119,14 +736,134 @@ class BlockchainAuditLog:
                 nonce=row[4],
                 hash=row[5]
             )
-            self.chain.append(block)
         
-        # Load pending events
-        cursor.execute('SELECT event_json FROM pending_events')
-        for row in cursor.fetchall():
-            self.pending_events.append(json.loads(row[0]))
+        block.seal = row[8]
+        block.seal_key = row[9] or ""
+        block.signature = row[10] or ""
+        return block
+    
+    def _segment_rows(self, cursor) -> List[tuple]:
+        """List sealed segments as (first_idx, last_idx, file_name, file_sha256,
+        anchor_hash, last_hash, event_count) rows in chain order"""
+        cursor.execute('''
+            SELECT first_idx, last_idx, file_name, file_sha256, anchor_hash, last_hash, event_count
+            FROM segments ORDER BY first_idx ASC
+        ''')
+        return cursor.fetchall()
+    
+    def _open_segment(self, first_idx: int, file_name: str) -> ArchiveSegment:
+        """Open (and cache) the reader for a sealed segment"""
+        segment = self._segments.get(first_idx)
+        if segment is not None and segment.path.name != file_name:
+            self._close_segment(first_idx)  # Replaced by a different segment file
+            segment = None
+        if segment is None:
+            segment = ArchiveSegment(self.segments_dir / file_name)
+            self._segments[first_idx] = segment
+        return segment
+    
+    def _close_segment(self, first_idx: int):
+        """Drop the cached reader of a segment, releasing its mapping"""
+        segment = self._segments.pop(first_idx, None)
+        if segment is not None:
+            segment.close()
+    
+    def close(self):
+        """Release the cached segment mappings"""
+        for first_idx in list(self._segments):
+            self._close_segment(first_idx)
+    
+    def _get_block(self, conn, index: int) -> Optional[Block]:
+        """Fetch a block by index from the database or, if sealed, its segment"""
+        cursor = conn.execute(f'SELECT {BLOCK_COLUMNS} FROM blocks WHERE idx = ?', (index,))
+        row = cursor.fetchone()
+        if row is not None:
+            return self._row_to_block(row)
         
+        cursor.execute(
+            'SELECT first_idx, file_name FROM segments WHERE first_idx <= ? AND last_idx >= ?',
+            (index, index)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return self._open_segment(row[0], row[1]).read_block(index)
+    
+    def iter_blocks(self, start: int = 0) -> Iterator[Block]:
+        """Yield the blocks of the chain from index `start` on, sealed segments first"""
+        conn = sqlite3.connect(str(self.db_path))
+        segments = self._segment_rows(conn.cursor())
         conn.close()
+        
+        for row in segments:
+            if row[1] < start:
+                continue
+            for block in self._open_segment(row[0], row[2]).iter_blocks():
+                if block.index >= start:
+                    yield block
+        
+        for block in list(self.chain):
+            if block.index >= start:
+                yield block
+    
+    def get_genesis_block(self) -> Optional[Block]:
+        """Return block 0, wherever it is stored"""
+        if self.chain and self.chain[0].index == 0:
+            return self.chain[0]
+        
+        conn = sqlite3.connect(str(self.db_path))
+        block = self._get_block(conn, 0)
+        conn.close()
+        return block
+    
+    def archive_blocks(self, keep: int = 1000) -> int:
+        """Seal all but the newest `keep` blocks into compressed segment files"""
+        with self._mining_lock:
+            # The chain tip always stays hot so new blocks can link to it
+            keep = max(keep, 1)
+            to_archive = self.chain[:-keep]
+            if not to_archive:
+                return 0
+        
+            self.segments_dir.mkdir(parents=True, exist_ok=True)
+        
+            conn = sqlite3.connect(str(self.db_path))
+            cursor = conn.cursor()
+        
+            for start in range(0, len(to_archive), self.segment_size):
+                blocks = to_archive[start:start + self.segment_size]
+                file_name = f"segment-{blocks[0].index:010d}-{blocks[-1].index:010d}.seg"
+                self._close_segment(blocks[0].index)
+                file_sha256 = ArchiveSegment.write(self.segments_dir / file_name, blocks)
+            
+                # Register the segment and drop its blocks in one transaction
+                cursor.execute('''
+                    INSERT INTO segments (first_idx, last_idx, file_name, file_sha256,
+                                          anchor_hash, last_hash, event_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    blocks[0].index,
+                    blocks[-1].index,
+                    file_name,
+                    file_sha256,
+                    blocks[0].previous_hash,
+                    blocks[-1].hash,
+                    sum(len(block.events) for block in blocks)
+                ))
+                cursor.execute(
+                    'DELETE FROM blocks WHERE idx BETWEEN ? AND ?',
+                    (blocks[0].index, blocks[-1].index)
+                )
+                conn.commit()
+                print(f"Sealed blocks {blocks[0].index}-{blocks[-1].index} into {file_name}")
+        
+            # Give the freed pages back to the filesystem
+            conn.execute('VACUUM')
+            conn.close()
+        
+            with self._lock:
+                self.chain = self.chain[len(to_archive):]
+            return len(to_archive)
     
     def _create_genesis_block(self):
         """Create the first block in the chain"""
@@ -138,220 +875,1478 @@ class BlockchainAuditLog:
                 'message': 'SecureOS Blockchain Audit Log Initialized',
                 'version': '5.0.0'
             }],
-            previous_hash='0'
+            previous_hash='0',
+            encoding=self.block_encoding
         )
-        genesis_block.mine_block(self.difficulty)
+        self._seal_block(genesis_block)
         
         self.chain.append(genesis_block)
         self._save_block(genesis_block)
     
-    def _save_block(self, block: Block):
-        """Save block to database"""
+    def _save_block(self, block: Block, consumed_pending: int = 0):
+        """Save block to database, dropping the oldest `consumed_pending` pending events"""
         conn = sqlite3.connect(str(self.db_path))
         cursor = conn.cursor()
+        self._insert_block(cursor, block)
+        
+        # Pending events are mined in FIFO order, so the block holds the
+        # oldest rows; events queued meanwhile stay pending
+        if consumed_pending:
+            cursor.execute('''
+                DELETE FROM pending_events WHERE id IN (
+                    SELECT id FROM pending_events ORDER BY id ASC LIMIT ?
+                )
+            ''', (consumed_pending,))
+        
+        conn.commit()
+        conn.close()
+    
+    def _insert_block(self, cursor, block: Block):
+        """Insert a block row and index its events, within the caller's transaction"""
+        # Binary blocks keep their events only in the blob; the remaining
+        # columns are duplicated for the hash and timestamp indexes
+        if block.encoding == BLOCK_ENCODING_BINARY:
+            events_json = ''
+            block_blob = block.to_blob(self.compress_blocks)
+        else:
+            events_json = json.dumps(block.events)
+            block_blob = None
         
         cursor.execute('''
-            INSERT INTO blocks (idx, timestamp, events_json, previous_hash, nonce, hash)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO blocks (idx, timestamp, events_json, previous_hash, nonce, hash,
+                                encoding, block_blob, seal, seal_key, signature)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             block.index,
             block.timestamp,
-            json.dumps(block.events),
+            events_json,
             block.previous_hash,
             block.nonce,
-            block.hash
+            block.hash,
+            block.encoding,
+            block_blob,
+            block.seal,
+            block.seal_key or None,
+            block.signature or None
         ))
         
-        conn.commit()
+        # Keep the search index in step with the chain
+        self._index_block(cursor, block)
+        self._set_meta(cursor, 'event_index_height', block.index)
+    
+    def _get_meta(self, cursor, key: str) -> Optional[str]:
+        """Read a value from the chain_meta table"""
+        cursor.execute('SELECT value FROM chain_meta WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def _set_meta(self, cursor, key: str, value):
+        """Write a value to the chain_meta table"""
+        cursor.execute(
+            'INSERT OR REPLACE INTO chain_meta (key, value) VALUES (?, ?)',
+            (key, str(value))
+        )
+    
+    def _load_seal_config(self):
+        """Read the sealing mode and host key from chain_meta"""
+        conn = sqlite3.connect(str(self.db_path))
+        cursor = conn.cursor()
+        self.seal_mode = self._get_meta(cursor, 'seal_mode') or SEAL_POW
+        self.seal_key_id = self._get_meta(cursor, 'seal_key_id')
+        
+        # Replicas check proof of work against their source's difficulty
+        self.replica = self._get_meta(cursor, 'replica') == '1'
+        difficulty = self._get_meta(cursor, 'difficulty')
+        if difficulty is not None:
+            self.difficulty = int(difficulty)
         conn.close()
     
-    def add_event(self, event: Dict) -> bool:
-        """Add security event to pending events"""
-        # Add timestamp if not present
-        if 'timestamp' not in event:
-            event['timestamp'] = datetime.now().isoformat()
+    def configure_sealing(self, mode: str, key_id: str = 'host', algorithm: Optional[str] = None):
+        """Switch the sealing mode for new blocks, generating the host key if needed"""
+        if mode not in SEAL_MODES:
+            raise ValueError(f"Unknown seal mode: {mode}")
+        
+        with self._mining_lock:
+            if mode == SEAL_POW:
+                # Verification rejects proof-of-work blocks after signed ones,
+                # otherwise signed blocks could be silently re-mined
+                if any(block.seal != SEAL_POW for block in self.chain):
+                    raise ValueError("Chain already contains signed blocks; cannot return to proof of work")
+                key_id = None
+            elif (self.keys_dir / key_id / 'metadata.json').exists() or algorithm is None:
+                # Raises for keys of an unsupported algorithm
+                self._get_signer(key_id)
+            else:
+                self._signers[key_id] = BlockSigner.generate(self.keys_dir, key_id, algorithm)
+            
+            conn = sqlite3.connect(str(self.db_path))
+            cursor = conn.cursor()
+            self._set_meta(cursor, 'seal_mode', mode)
+            if key_id:
+                self._set_meta(cursor, 'seal_key_id', key_id)
+            else:
+                cursor.execute("DELETE FROM chain_meta WHERE key = 'seal_key_id'")
+            conn.commit()
+            conn.close()
+            
+            self.seal_mode = mode
+            self.seal_key_id = key_id
+    
+    def _get_signer(self, key_id: str) -> BlockSigner:
+        """Load (and cache) a host key"""
+        signer = self._signers.get(key_id)
+        if signer is None:
+            signer = BlockSigner(self.keys_dir, key_id)
+            self._signers[key_id] = signer
+        return signer
+    
+    @staticmethod
+    def _seal_message(block: Block) -> bytes:
+        """Bytes a signed block's signature covers: its hash and its seal metadata"""
+        # The metadata is not part of the block hash; signing it too means a
+        # block's seal mode or key id cannot be swapped after the fact
+        return b'\0'.join([b'SOSSEAL1', bytes.fromhex(block.hash), block.seal.encode(), block.seal_key.encode()])
+    
+    def _seal_block(self, block: Block):
+        """Seal a block according to the configured mode"""
+        if self.seal_mode == SEAL_SIGNED:
+            # One hash and one signature: no search for a nonce
+            signer = self._get_signer(self.seal_key_id)
+            block.hash = block.calculate_hash()
+            block.seal = SEAL_SIGNED
+            block.seal_key = signer.key_id
+            block.signature = signer.sign(self._seal_message(block)).hex()
+        else:
+            block.mine_block(self.difficulty)
+    
+    def _verify_seal(self, block: Block) -> Optional[str]:
+        """Check a block's seal against its declared mode, returning the problem if any"""
+        if block.seal == SEAL_POW:
+            if not block.hash.startswith('0' * self.difficulty):
+                return "has invalid proof of work"
+            return None
         
-        # Add to pending events
-        self.pending_events.append(event)
+        if block.seal != SEAL_SIGNED:
+            return f"has unknown seal mode {block.seal!r}"
         
-        # Save to database
+        try:
+            signer = self._get_signer(block.seal_key)
+            valid = signer.verify(self._seal_message(block), bytes.fromhex(block.signature))
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            return f"signature cannot be checked ({block.seal_key}: {e})"
+        return None if valid else "has an invalid signature"
+    
+    def _index_block(self, cursor, block: Block):
+        """Add the events of a block to the secondary search indexes"""
+        rows = []
+        ts_rows = []
+        fts_rows = []
+        block_ts = _to_epoch(block.timestamp)
+        
+        for pos, event in enumerate(block.events):
+            # Events without a usable timestamp fall back to their block's
+            ts = _to_epoch(event.get('timestamp'))
+            if ts is None:
+                ts = block_ts
+            if ts is not None:
+                ts_rows.append((ts, block.index, pos))
+            
+            for field in self.indexed_fields:
+                if field in event:
+                    key = _index_key(event[field])
+                    if key is not None:
+                        rows.append((field, key, block.index, pos))
+            
+            if self.fts_enabled:
+                fts_rows.append((_event_text(event), block.index, pos))
+        
+        cursor.executemany(
+            'INSERT INTO event_index (field, value, block_idx, event_pos) VALUES (?, ?, ?, ?)',
+            rows
+        )
+        cursor.executemany(
+            'INSERT INTO event_timestamps (ts, block_idx, event_pos) VALUES (?, ?, ?)',
+            ts_rows
+        )
+        if fts_rows:
+            cursor.executemany(
+                'INSERT INTO event_fts (content, block_idx, event_pos) VALUES (?, ?, ?)',
+                fts_rows
+            )
+    
+    def _sync_event_index(self):
+        """Bring the search indexes up to date with the loaded chain"""
         conn = sqlite3.connect(str(self.db_path))
         cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO pending_events (event_json) VALUES (?)',
-            (json.dumps(event),)
-        )
+        
+        signature = json.dumps({
+            'version': INDEX_VERSION,
+            'fields': sorted(self.indexed_fields),
+            'fts': self.fts_enabled
+        }, sort_keys=True)
+        
+        height = self._get_meta(cursor, 'event_index_height')
+        if self._get_meta(cursor, 'event_index_signature') != signature:
+            # Indexed fields or layout changed - rebuild from scratch
+            cursor.execute('DELETE FROM event_index')
+            cursor.execute('DELETE FROM event_timestamps')
+            if self.fts_enabled:
+                cursor.execute('DELETE FROM event_fts')
+            self._set_meta(cursor, 'event_index_signature', signature)
+            height = None
+        
+        start = int(height) + 1 if height is not None else 0
+        if self.chain and start < self.chain[0].index:
+            # Rebuilding after archival - sealed blocks need indexing too
+            blocks = self.iter_blocks()
+        else:
+            blocks = self.chain
+        
+        for block in blocks:
+            if block.index >= start:
+                self._index_block(cursor, block)
+        
+        if self.chain:
+            self._set_meta(cursor, 'event_index_height', self.chain[-1].index)
+        
         conn.commit()
         conn.close()
+    
+    def add_event(self, event: Dict) -> bool:
+        """Add security event to pending events"""
+        return self.add_events([event])
+    
+    def add_events(self, events: List[Dict], mine: bool = True) -> bool:
+        """Add a batch of security events to pending events in one transaction"""
+        # Add timestamp if not present
+        for event in events:
+            if 'timestamp' not in event:
+                event['timestamp'] = datetime.now().isoformat()
+        
+        if self.replica:
+            raise ValueError(f"{self.db_path} is a replica; events are only added at its source")
+        
+        with self._lock:
+            # Save to database
+            conn = sqlite3.connect(str(self.db_path))
+            cursor = conn.cursor()
+            cursor.executemany(
+                'INSERT INTO pending_events (event_json) VALUES (?)',
+                [(json.dumps(event),) for event in events]
+            )
+            conn.commit()
+            conn.close()
+            
+            # Add to pending events
+            self.pending_events.extend(events)
+            block_ready = len(self.pending_events) >= self.block_size
         
         # Mine new block if we have enough events
-        if len(self.pending_events) >= self.block_size:
+        if mine and block_ready:
             return self.mine_pending_block()
         
         return True
     
     def mine_pending_block(self) -> bool:
         """Mine a new block with pending events"""
-        if not self.pending_events:
+        with self._mining_lock:
+            with self._lock:
+                if not self.pending_events:
+                    return False
+                
+                # Create new block
+                new_block = Block(
+                    index=self.chain[-1].index + 1,
+                    timestamp=datetime.now().isoformat(),
+                    events=self.pending_events[:self.block_size],
+                    previous_hash=self.chain[-1].hash,
+                    encoding=self.block_encoding
+                )
+            
+            # Seal the block (proof of work or signature) without blocking new events
+            if self.verbose:
+                print(f"{'Signing' if self.seal_mode == SEAL_SIGNED else 'Mining'} block {new_block.index}...")
+            start_time = time.time()
+            self._seal_block(new_block)
+            elapsed = time.time() - start_time
+            if self.verbose:
+                print(f"Block sealed in {elapsed:.2f} seconds - Hash: {new_block.hash}")
+            
+            with self._lock:
+                # Store the block and clear its events from pending atomically
+                self._save_block(new_block, consumed_pending=len(new_block.events))
+                self.chain.append(new_block)
+                self.pending_events = self.pending_events[len(new_block.events):]
+        
+        return True
+    
+    def verify_chain(self, incremental: bool = False) -> bool:
+        """Verify integrity of the blockchain
+        
+        A full verification checks every block and segment. With
+        incremental=True only blocks added since the last successful
+        verification are checked, starting from the recorded checkpoint
+        block, whose hash must still match.
+        """
+        conn = sqlite3.connect(str(self.db_path))
+        cursor = conn.cursor()
+        checkpoint = None
+        if incremental:
+            height = self._get_meta(cursor, 'verified_height')
+            if height is not None:
+                checkpoint = (int(height), self._get_meta(cursor, 'verified_hash'))
+        conn.close()
+        
+        if checkpoint is None and not self._verify_segments():
             return False
         
-        # Create new block
-        new_block = Block(
-            index=len(self.chain),
-            timestamp=datetime.now().isoformat(),
-            events=self.pending_events[:self.block_size],
-            previous_hash=self.chain[-1].hash
-        )
+        start = checkpoint[0] if checkpoint else 0
+        previous_block = None
+        count = 0
+        for current_block in self.iter_blocks(start):
+            count += 1
+            if previous_block is None:
+                if checkpoint and (current_block.index, current_block.hash) != checkpoint:
+                    print(f"❌ Block {start} no longer matches the verified checkpoint!")
+                    return False
+                previous_block = current_block
+                continue
+            
+            problem = self._check_block(previous_block, current_block)
+            if problem:
+                print(f"❌ {problem}!")
+                return False
+            
+            previous_block = current_block
+        
+        if previous_block is not None:
+            conn = sqlite3.connect(str(self.db_path))
+            cursor = conn.cursor()
+            self._set_meta(cursor, 'verified_height', previous_block.index)
+            self._set_meta(cursor, 'verified_hash', previous_block.hash)
+            conn.commit()
+            conn.close()
+        
+        if self.verbose and checkpoint:
+            print(f"✅ Blockchain verified - {count - 1} blocks since block {start} are valid")
+        elif self.verbose:
+            print(f"✅ Blockchain verified - All {count} blocks are valid")
+        return True
+    
+    def _check_block(self, previous_block: Optional[Block], block: Block) -> Optional[str]:
+        """Check a block against its predecessor (None for genesis), returning the problem if any"""
+        i = block.index
+        expected_index = previous_block.index + 1 if previous_block else 0
+        expected_previous = previous_block.hash if previous_block else '0'
+        
+        # Verify blocks are contiguous (nothing dropped at a segment boundary)
+        if i != expected_index:
+            return f"Block {expected_index} is missing"
         
-        # Mine the block (proof of work)
-        print(f"Mining block {new_block.index}...")
-        start_time = time.time()
-        new_block.mine_block(self.difficulty)
-        elapsed = time.time() - start_time
-        print(f"Block mined in {elapsed:.2f} seconds - Hash: {new_block.hash}")
+        # Verify current block's hash
+        if block.hash != block.calculate_hash():
+            return f"Block {i} has been tampered with"
         
-        # Add to chain
-        self.chain.append(new_block)
-        self._save_block(new_block)
+        # Verify link to previous block
+        if block.previous_hash != expected_previous:
+            return f"Block {i} has invalid previous hash"
         
-        # Clear mined events from pending
-        self.pending_events = self.pending_events[self.block_size:]
+        # Verify the seal (proof of work or signature) it declares
+        problem = self._verify_seal(block)
+        if problem:
+            return f"Block {i} {problem}"
+        
+        # Once blocks are signed, a proof-of-work block means re-mining
+        if previous_block and block.seal == SEAL_POW and previous_block.seal != SEAL_POW:
+            return f"Block {i} downgrades a signed chain to proof of work"
+        
+        return None
+    
+    def sync_locator(self) -> List[List]:
+        """Sample [index, hash] pairs from the tip back to genesis, densest near the tip"""
+        if not self.chain:
+            return []
+        
+        indexes = []
+        index = self.chain[-1].index
+        step = 1
+        while index > 0:
+            indexes.append(index)
+            if len(indexes) >= 10:
+                step *= 2
+            index -= step
+        indexes.append(0)
         
-        # Clear from database
+        conn = sqlite3.connect(str(self.db_path))
+        locator = []
+        for index in indexes:
+            block = self._get_block(conn, index)
+            if block is not None:
+                locator.append([index, block.hash])
+        conn.close()
+        return locator
+    
+    def find_common_ancestor(self, locator: List[List]) -> Optional[int]:
+        """Newest locator entry that is also part of this chain"""
+        conn = sqlite3.connect(str(self.db_path))
+        try:
+            for index, block_hash in locator:
+                block = self._get_block(conn, index)
+                if block is not None and block.hash == block_hash:
+                    return index
+        finally:
+            conn.close()
+        return None
+    
+    def check_replicable(self):
+        """Raise ValueError if the chain holds blocks a replica could not verify"""
+        # HMAC host keys are symmetric: a replica would need the secret itself
         conn = sqlite3.connect(str(self.db_path))
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM pending_events')
-        for event in self.pending_events:
-            cursor.execute(
-                'INSERT INTO pending_events (event_json) VALUES (?)',
-                (json.dumps(event),)
-            )
-        conn.commit()
+        cursor.execute('SELECT DISTINCT seal_key FROM blocks WHERE seal_key IS NOT NULL')
+        key_ids = {row[0] for row in cursor.fetchall()}
+        for row in self._segment_rows(cursor):
+            key_ids.update(entry[6][1] for entry in self._open_segment(row[0], row[2]).header['blocks']
+                           if len(entry) > 6)
         conn.close()
         
-        return True
+        for key_id in sorted(key_ids):
+            if self._get_signer(key_id).algorithm == 'hmac-sha256':
+                raise ValueError(f"Blocks sealed with HMAC host key {key_id} cannot be replicated: "
+                                 f"replicas cannot verify them without the secret key (use ed25519)")
+    
+    def write_sync_stream(self, f, locator: List[List], batch_size: int = 500) -> Dict:
+        """Send a replica with the given locator the blocks it is missing"""
+        self.check_replicable()
+        ancestor = self.find_common_ancestor(locator)
+        tip = self.chain[-1]
+        _write_frame(f, b'H', json.dumps({
+            'version': SYNC_VERSION,
+            'ancestor': ancestor,
+            'tip': tip.index,
+            'tip_hash': tip.hash,
+            'difficulty': self.difficulty
+        }).encode())
+        
+        stats = {'ancestor': ancestor, 'blocks': 0, 'batches': 0, 'bytes': 0}
+        sent_keys = set()
+        batch = []
+        
+        def flush():
+            payload = zlib.compress(b''.join(batch), 6)
+            _write_frame(f, b'B', payload)
+            stats['batches'] += 1
+            stats['bytes'] += len(payload)
+            batch.clear()
+        
+        start = 0 if ancestor is None else ancestor + 1
+        for block in self.iter_blocks(start):
+            if block.index > tip.index:
+                break
+            
+            # Public keys go ahead of the first batch that needs them
+            if block.seal_key and block.seal_key not in sent_keys:
+                signer = self._get_signer(block.seal_key)
+                _write_frame(f, b'K', json.dumps({
+                    'key_id': signer.key_id,
+                    'algorithm': signer.algorithm,
+                    'public_key': signer.public_key.hex()
+                }).encode())
+                sent_keys.add(block.seal_key)
+            
+            batch.append(block.to_record())
+            stats['blocks'] += 1
+            if len(batch) >= batch_size:
+                flush()
+        
+        if batch:
+            flush()
+        _write_frame(f, b'E', b'')
+        f.flush()
+        return stats
+    
+    def read_sync_stream(self, f) -> Dict:
+        """Append the blocks of a replication stream, verifying each batch before storing it"""
+        kind, payload = _read_frame(f)
+        if kind != b'H':
+            raise ValueError("Replication stream does not start with a header")
+        header = json.loads(payload)
+        if header.get('version') != SYNC_VERSION:
+            raise ValueError(f"Unsupported replication stream version: {header.get('version')}")
+        
+        with self._mining_lock:
+            previous_block = self.chain[-1] if self.chain else None
+            if header['ancestor'] != (previous_block.index if previous_block else None):
+                raise ValueError(f"Replica diverges from its source after block {header['ancestor']}")
+            
+            # The source's difficulty only applies if it is as strict as the
+            # replica's own, and stays fixed once blocks have been received;
+            # every proof-of-work block is then checked against it
+            if self.replica:
+                difficulty = header.get('difficulty')
+                if not isinstance(difficulty, int) or difficulty < self.difficulty:
+                    raise ValueError(f"Source difficulty {difficulty!r} is below the replica's {self.difficulty}")
+                if previous_block is not None and difficulty != self.difficulty:
+                    raise ValueError(f"Source difficulty changed from {self.difficulty} to {difficulty}")
+                self.difficulty = difficulty
+            
+            received = 0
+            while True:
+                kind, payload = _read_frame(f)
+                if kind == b'E':
+                    break
+                if kind == b'K':
+                    self._trust_key(json.loads(payload))
+                    continue
+                if kind != b'B':
+                    raise ValueError(f"Unexpected replication frame {kind!r}")
+                
+                blocks = list(Block.iter_records(zlib.decompress(payload)))
+                for block in blocks:
+                    problem = self._check_block(previous_block, block)
+                    if problem:
+                        raise ValueError(problem)
+                    previous_block = block
+                
+                # One transaction per verified batch
+                conn = sqlite3.connect(str(self.db_path))
+                cursor = conn.cursor()
+                for block in blocks:
+                    self._insert_block(cursor, block)
+                if self.replica:
+                    self._set_meta(cursor, 'difficulty', self.difficulty)
+                conn.commit()
+                conn.close()
+                
+                with self._lock:
+                    self.chain.extend(blocks)
+                received += len(blocks)
+        
+        tip = self.chain[-1] if self.chain else None
+        return {
+            'received': received,
+            'tip': tip.index if tip else None,
+            'tip_hash': tip.hash if tip else None
+        }
     
-    def verify_chain(self) -> bool:
-        """Verify integrity of the entire blockchain"""
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
+    def _trust_key(self, key: Dict):
+        """Store a source host's public key on first sight; later copies must match"""
+        key_id = key['key_id']
+        if not key_id or '/' in key_id or key_id.startswith('.'):
+            raise ValueError(f"Invalid host key id: {key_id!r}")
+        
+        _check_signer_algorithm(key['algorithm'])
+        if key['algorithm'] == 'hmac-sha256':
+            raise ValueError(f"Host key {key_id} is an HMAC key; HMAC-sealed blocks cannot be replicated")
+        key_dir = self.keys_dir / key_id
+        public_key = bytes.fromhex(key['public_key'])
+        if (key_dir / 'public.key').exists():
+            if (key_dir / 'public.key').read_bytes() != public_key:
+                raise ValueError(f"Host key {key_id} does not match the key stored for it")
+            return
+        
+        key_dir.mkdir(parents=True, exist_ok=True)
+        with open(key_dir / 'metadata.json', 'w') as f:
+            json.dump({
+                'key_id': key_id,
+                'algorithm': key['algorithm'],
+                'received_at': datetime.now().isoformat()
+            }, f, indent=2)
+        with open(key_dir / 'public.key', 'wb') as f:
+            f.write(public_key)
+    
+    def _verify_segments(self) -> bool:
+        """Check sealed segment files against the anchors recorded at sealing time"""
+        conn = sqlite3.connect(str(self.db_path))
+        segments = self._segment_rows(conn.cursor())
+        conn.close()
+        
+        previous_last_hash = None
+        for first_idx, last_idx, file_name, file_sha256, anchor_hash, last_hash, _ in segments:
+            try:
+                segment = self._open_segment(first_idx, file_name)
+            except (OSError, ValueError) as e:
+                print(f"❌ Segment {file_name} is unreadable: {e}")
+                return False
             
-            # Verify current block's hash
-            if current_block.hash != current_block.calculate_hash():
-                print(f"❌ Block {i} has been tampered with!")
+            if segment.sha256() != file_sha256:
+                print(f"❌ Segment {file_name} has been modified!")
                 return False
             
-            # Verify link to previous block
-            if current_block.previous_hash != previous_block.hash:
-                print(f"❌ Block {i} has invalid previous hash!")
+            header = segment.header
+            if (header['first_index'], header['last_index'], header['anchor_hash'], header['last_hash']) != \
+                    (first_idx, last_idx, anchor_hash, last_hash):
+                print(f"❌ Segment {file_name} does not match its recorded anchors!")
                 return False
             
-            # Verify proof of work
-            if not current_block.hash.startswith('0' * self.difficulty):
-                print(f"❌ Block {i} has invalid proof of work!")
+            # Consecutive segments must chain onto each other
+            if previous_last_hash is not None and anchor_hash != previous_last_hash:
+                print(f"❌ Segment {file_name} does not link to the previous segment!")
                 return False
+            previous_last_hash = last_hash
         
-        print(f"✅ Blockchain verified - All {len(self.chain)} blocks are valid")
         return True
     
-    def search_events(self, query: Dict) -> List[Dict]:
+    def search_events(self, query: Dict, text: Optional[str] = None) -> List[Dict]:
         """Search for events matching criteria"""
-        results = []
+        return list(self.iter_search_events(query, text))
+    
+    def iter_search_events(self, query: Dict, text: Optional[str] = None) -> Iterator[Dict]:
+        """Yield events matching criteria, using the secondary indexes when possible"""
+        if text and not self.fts_enabled:
+            raise ValueError("Full-text search requires SQLite FTS5")
         
-        for block in self.chain:
-            for event in block.events:
-                match = True
-                for key, value in query.items():
-                    if key not in event or event[key] != value:
-                        match = False
-                        break
-                
-                if match:
-                    results.append({
+        # Build one candidate set per indexed field (and the FTS query) and
+        # let SQLite intersect them; other fields are checked per event.
+        clauses = []
+        params = []
+        for key, value in query.items():
+            index_key = _index_key(value)
+            if key in self.indexed_fields and index_key is not None:
+                clauses.append(
+                    'SELECT block_idx, event_pos FROM event_index WHERE field = ? AND value = ?'
+                )
+                params.extend([key, index_key])
+        
+        if text:
+            clauses.append('SELECT block_idx, event_pos FROM event_fts WHERE event_fts MATCH ?')
+            params.append(text)
+        
+        conn = sqlite3.connect(str(self.db_path))
+        try:
+            if clauses:
+                candidates = conn.execute(
+                    ' INTERSECT '.join(clauses) + ' ORDER BY block_idx, event_pos',
+                    params
+                )
+                events = self._iter_candidate_events(conn, candidates)
+            else:
+                events = self._iter_all_events(conn)
+            
+            for block, event in events:
+                if all(key in event and event[key] == value for key, value in query.items()):
+                    yield {
                         'block_index': block.index,
                         'block_hash': block.hash,
                         'block_timestamp': block.timestamp,
                         'event': event
-                    })
+                    }
+        finally:
+            conn.close()
+    
+    def _iter_candidate_events(self, conn, candidates, cache_size: int = 8) -> Iterator:
+        """Resolve (block_idx, event_pos) pairs into events, keeping few blocks decoded"""
+        decoded = OrderedDict()
         
-        return results
+        for block_idx, event_pos in candidates:
+            if block_idx in decoded:
+                decoded.move_to_end(block_idx)
+            else:
+                block = self._get_block(conn, block_idx)
+                if block is None:
+                    continue
+                decoded[block_idx] = block
+                if len(decoded) > cache_size:
+                    decoded.popitem(last=False)
+            
+            block = decoded[block_idx]
+            if event_pos < len(block.events):
+                yield block, block.events[event_pos]
+    
+    def _iter_all_events(self, conn) -> Iterator:
+        """Stream every event of the stored chain, one block decoded at a time"""
+        for row in self._segment_rows(conn.cursor()):
+            for block in self._open_segment(row[0], row[2]).iter_blocks():
+                for event in block.events:
+                    yield block, event
+        
+        cursor = conn.execute(f'SELECT {BLOCK_COLUMNS} FROM blocks ORDER BY idx ASC')
+        for row in cursor:
+            block = self._row_to_block(row)
+            for event in block.events:
+                yield block, event
     
     def get_events_by_timerange(self, start: str, end: str) -> List[Dict]:
         """Get all events within a time range"""
-        results = []
-        
-        for block in self.chain:
-            if start <= block.timestamp <= end:
-                for event in block.events:
-                    results.append({
-                        'block_index': block.index,
-                        'block_hash': block.hash,
-                        'block_timestamp': block.timestamp,
-                        'event': event
-                    })
+        return list(self.iter_events_by_timerange(start, end))
+    
+    def iter_events_by_timerange(self, start: str, end: str) -> Iterator[Dict]:
+        """Yield events whose own timestamp lies within [start, end], oldest first"""
+        start_ts = _to_epoch(start)
+        end_ts = _to_epoch(end)
+        if start_ts is None or end_ts is None:
+            raise ValueError(f"Invalid time range: {start} - {end}")
         
-        return results
+        conn = sqlite3.connect(str(self.db_path))
+        try:
+            candidates = conn.execute('''
+                SELECT block_idx, event_pos FROM event_timestamps
+                WHERE ts BETWEEN ? AND ?
+                ORDER BY ts, block_idx, event_pos
+            ''', (start_ts, end_ts))
+            
+            for block, event in self._iter_candidate_events(conn, candidates):
+                yield {
+                    'block_index': block.index,
+                    'block_hash': block.hash,
+                    'block_timestamp': block.timestamp,
+                    'event': event
+                }
+        finally:
+            conn.close()
     
-    def export_compliance_report(self, start_date: str, end_date: str, output_file: str):
-        """Export compliance report for auditing"""
-        events = self.get_events_by_timerange(start_date, end_date)
+    def export_compliance_report(self, start_date: str, end_date: str, output_file: str,
+                                 fmt: str = 'json', compress: Optional[bool] = None) -> Dict:
+        """Export compliance report for auditing, streaming events to disk"""
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unsupported report format: {fmt}")
+        
+        # Compress when asked to, or when the file name says so
+        if compress is None:
+            compress = output_file.endswith('.gz')
         
-        report = {
+        header = {
             'report_type': 'SecureOS Blockchain Audit Compliance Report',
             'generated_at': datetime.now().isoformat(),
             'period_start': start_date,
-            'period_end': end_date,
-            'total_events': len(events),
-            'blockchain_verified': self.verify_chain(),
-            'events': events,
-            'blockchain_info': {
-                'total_blocks': len(self.chain),
-                'difficulty': self.difficulty,
-                'genesis_hash': self.chain[0].hash if self.chain else None,
-                'latest_hash': self.chain[-1].hash if self.chain else None
-            }
+            'period_end': end_date
         }
         
-        with open(output_file, 'w') as f:
-            json.dumps(report, f, indent=2)
+        counts = {'total_events': 0, 'events_by_type': {}}
+        
+        def counted(events):
+            for result in events:
+                counts['total_events'] += 1
+                event_type = str(result['event'].get('type', 'unknown'))
+                counts['events_by_type'][event_type] = counts['events_by_type'].get(event_type, 0) + 1
+                yield result
+        
+        def trailer():
+            genesis = self.get_genesis_block()
+            return {
+                'total_events': counts['total_events'],
+                'events_by_type': counts['events_by_type'],
+                'blockchain_verified': self.verify_chain(),
+                'blockchain_info': {
+                    'total_blocks': self.chain[-1].index + 1 if self.chain else 0,
+                    'difficulty': self.difficulty,
+                    'genesis_hash': genesis.hash if genesis else None,
+                    'latest_hash': self.chain[-1].hash if self.chain else None
+                }
+            }
+        
+        events = counted(self.iter_events_by_timerange(start_date, end_date))
+        
+        if compress:
+            f = gzip.open(output_file, 'wt', encoding='utf-8', newline='')
+        else:
+            f = open(output_file, 'w', encoding='utf-8', newline='')
+        
+        with f:
+            if fmt == 'ndjson':
+                summary = self._write_ndjson_report(f, header, events, trailer)
+            elif fmt == 'csv':
+                summary = self._write_csv_report(f, header, events, trailer)
+            else:
+                summary = self._write_json_report(f, header, events, trailer)
+        
+        if self.verbose:
+            print(f"Compliance report exported to {output_file} ({counts['total_events']} events)")
+        return summary
+    
+    def _write_json_report(self, f, header: Dict, events: Iterator[Dict], trailer) -> Dict:
+        """Write a report as a single JSON object, emitting events as they arrive"""
+        f.write('{\n')
+        for key, value in header.items():
+            f.write(f'  {json.dumps(key)}: {json.dumps(value)},\n')
+        
+        f.write('  "events": [')
+        first = True
+        for result in events:
+            f.write('\n    ' if first else ',\n    ')
+            f.write(json.dumps(result))
+            first = False
+        f.write('\n  ]' if not first else ']')
+        
+        summary = trailer()
+        for key, value in summary.items():
+            f.write(f',\n  {json.dumps(key)}: {json.dumps(value)}')
+        f.write('\n}\n')
+        
+        return summary
+    
+    def _write_ndjson_report(self, f, header: Dict, events: Iterator[Dict], trailer) -> Dict:
+        """Write a report as newline-delimited JSON: header, events, trailer"""
+        f.write(json.dumps({'record': 'header', **header}) + '\n')
+        for result in events:
+            f.write(json.dumps({'record': 'event', **result}) + '\n')
+        
+        summary = trailer()
+        f.write(json.dumps({'record': 'trailer', **summary}) + '\n')
+        
+        return summary
+    
+    def _write_csv_report(self, f, header: Dict, events: Iterator[Dict], trailer) -> Dict:
+        """Write a report as CSV with the header and trailer as '#' comment lines"""
+        for key, value in header.items():
+            f.write(f'# {key}: {value}\n')
+        
+        writer = csv.writer(f)
+        writer.writerow(['block_index', 'block_hash', 'block_timestamp',
+                         'event_timestamp', 'event_type', 'event_json'])
+        for result in events:
+            event = result['event']
+            writer.writerow([
+                result['block_index'],
+                result['block_hash'],
+                result['block_timestamp'],
+                event.get('timestamp', ''),
+                event.get('type', ''),
+                json.dumps(event, sort_keys=True)
+            ])
+        
+        summary = trailer()
+        for key, value in summary.items():
+            f.write(f'# {key}: {json.dumps(value)}\n')
         
-        print(f"Compliance report exported to {output_file}")
+        return summary
     
     def get_stats(self) -> Dict:
         """Get blockchain statistics"""
+        conn = sqlite3.connect(str(self.db_path))
+        segments = self._segment_rows(conn.cursor())
+        conn.close()
+        
         total_events = sum(len(block.events) for block in self.chain)
+        total_events += sum(row[6] for row in segments)
+        genesis = self.get_genesis_block()
         
         return {
-            'total_blocks': len(self.chain),
+            'total_blocks': self.chain[-1].index + 1 if self.chain else 0,
             'total_events': total_events,
             'pending_events': len(self.pending_events),
+            'archived_blocks': sum(row[1] - row[0] + 1 for row in segments),
+            'archive_segments': len(segments),
             'difficulty': self.difficulty,
-            'genesis_timestamp': self.chain[0].timestamp if self.chain else None,
+            'seal_mode': self.seal_mode,
+            'seal_key_id': self.seal_key_id,
+            'replica': self.replica,
+            'genesis_timestamp': genesis.timestamp if genesis else None,
             'latest_block_hash': self.chain[-1].hash if self.chain else None,
             'chain_valid': self.verify_chain()
         }
 
 
+class AuditIngestDaemon:
+    """Resident ingestion service for the audit chain
+    
+    Producers connect to a Unix socket and send newline-delimited JSON
+    envelopes of the form {"id": <any>, "event": {...}}. Events are written
+    to pending_events in batches; once a batch is committed every envelope
+    that carried an "id" is acknowledged with {"id": <id>, "ok": true}.
+    Envelopes without an "id" are fire-and-forget. Blocks are mined by a
+    background worker, so ingestion never waits for proof of work.
+    """
+    
+    def __init__(self, blockchain: BlockchainAuditLog, socket_path: str = DEFAULT_SOCKET_PATH,
+                 batch_size: int = 1000, batch_interval: float = 0.01,
+                 mine_interval: float = 5.0):
+        self.blockchain = blockchain
+        self.socket_path = Path(socket_path)
+        self.batch_size = batch_size  # Max events per write transaction
+        self.batch_interval = batch_interval  # Max seconds to wait while filling a batch
+        self.mine_interval = mine_interval  # Mine partial blocks this often
+        
+        self._queue: queue.Queue = queue.Queue()
+        self._wake_miner = threading.Event()
+        self._stopping = threading.Event()
+        self._server = None
+        self._threads: List[threading.Thread] = []
+        self.stats = {'events_received': 0, 'events_committed': 0, 'batches': 0,
+                      'blocks_mined': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()  # Connection, writer and miner threads all count
+    
+    def _count(self, name: str, amount: int = 1):
+        """Add to one of the shared stats counters"""
+        with self._stats_lock:
+            self.stats[name] += amount
+    
+    def serve_forever(self):
+        """Run the socket server until SIGTERM/SIGINT"""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        
+        daemon = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon._handle_connection(self.request, self.rfile)
+        
+        self._server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o660)
+        
+        for target in (self._writer_loop, self._miner_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        
+        def stop(signum, frame):
+            # shutdown() blocks until serve_forever returns, so call it elsewhere
+            threading.Thread(target=self.shutdown, daemon=True).start()
+        
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        
+        print(f"Audit ingestion daemon listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._stopping.set()
+            self._wake_miner.set()
+            for thread in self._threads:
+                thread.join()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            with self._stats_lock:
+                stats = dict(self.stats)
+            print(f"Audit ingestion daemon stopped: {json.dumps(stats)}")
+    
+    def shutdown(self):
+        """Stop accepting connections and let the worker threads drain"""
+        if self._server is not None:
+            self._server.shutdown()
+    
+    def _handle_connection(self, sock, rfile):
+        """Read envelopes from one producer and queue them for the writer"""
+        # A producer that stops reading acks must not stall the writer
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, struct.pack('ll', 5, 0))
+        send_lock = threading.Lock()
+        
+        def reply(message: Dict) -> bool:
+            try:
+                with send_lock:
+                    sock.sendall((json.dumps(message) + '\n').encode())
+                return True
+            except OSError:
+                return False
+        
+        while not self._stopping.is_set():
+            try:
+                line = rfile.readline()
+            except OSError:
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+            
+            try:
+                envelope = json.loads(line)
+                if not isinstance(envelope, dict):
+                    raise ValueError('envelope must be a JSON object')
+                if envelope.get('info'):
+                    # Lets clients check which database the daemon writes to
+                    reply({'id': envelope.get('id'), 'ok': True, 'db': str(self.blockchain.db_path.resolve())})
+                    continue
+                event = envelope['event']
+                if not isinstance(event, dict):
+                    raise ValueError('event must be a JSON object')
+            except (ValueError, KeyError, TypeError) as e:
+                self._count('errors')
+                reply({'id': None, 'ok': False, 'error': f'Invalid envelope: {e}'})
+                continue
+            
+            self._count('events_received')
+            ack = reply if 'id' in envelope else None
+            self._queue.put((envelope.get('id'), event, ack))
+    
+    def _writer_loop(self):
+        """Commit queued events in batches and acknowledge them"""
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            
+            # Fill the batch until it is full or the batch window closes
+            deadline = time.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            # Any failure is reported to the producers; the writer keeps
+            # running so later batches are still acknowledged
+            try:
+                self.blockchain.add_events([event for _, event, _ in batch], mine=False)
+                result = {'ok': True}
+                self._count('events_committed', len(batch))
+                self._count('batches')
+            except Exception as e:
+                result = {'ok': False, 'error': str(e)}
+                self._count('errors')
+                print(f"❌ Writing {len(batch)} events failed: {e}")
+            
+            for event_id, _, ack in batch:
+                if ack is not None:
+                    ack({'id': event_id, **result})
+            
+            if len(self.blockchain.pending_events) >= self.blockchain.block_size:
+                self._wake_miner.set()
+    
+    def _miner_loop(self):
+        """Mine full blocks as they fill up, and partial ones every mine_interval"""
+        while not self._stopping.is_set():
+            woken = self._wake_miner.wait(timeout=self.mine_interval)
+            self._wake_miner.clear()
+            if self._stopping.is_set():
+                break
+            
+            try:
+                while len(self.blockchain.pending_events) >= self.blockchain.block_size:
+                    self.blockchain.mine_pending_block()
+                    self._count('blocks_mined')
+                
+                # Don't let a quiet period leave events unsealed indefinitely
+                if not woken and self.blockchain.pending_events:
+                    if self.blockchain.mine_pending_block():
+                        self._count('blocks_mined')
+            except Exception as e:
+                self._count('errors')
+                print(f"❌ Mining failed: {e}")
+
+
+class AuditClient:
+    """Client for the audit ingestion daemon"""
+    
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = 10.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(str(socket_path))
+        self._rfile = self.sock.makefile('rb')
+        self._next_id = 0
+    
+    def log(self, event: Dict, wait: bool = True) -> bool:
+        """Send an event; with wait=True, block until the daemon has committed it"""
+        if not wait:
+            self.sock.sendall((json.dumps({'event': event}) + '\n').encode())
+            return True
+        
+        return self.log_many([event])
+    
+    def database(self) -> str:
+        """Resolved path of the database the daemon writes to"""
+        request_id = self._next_id
+        self._next_id += 1
+        self.sock.sendall((json.dumps({'id': request_id, 'info': True}) + '\n').encode())
+        while True:
+            line = self._rfile.readline()
+            if not line:
+                raise ConnectionError("Audit daemon closed the connection")
+            reply = json.loads(line)
+            if reply.get('id') == request_id:
+                return reply.get('db', '')
+    
+    def log_many(self, events: List[Dict]) -> bool:
+        """Send a batch of events pipelined and wait for all acknowledgements"""
+        first_id = self._next_id
+        payload = []
+        for event in events:
+            payload.append(json.dumps({'id': self._next_id, 'event': event}) + '\n')
+            self._next_id += 1
+        self.sock.sendall(''.join(payload).encode())
+        
+        ok = True
+        pending = set(range(first_id, self._next_id))
+        while pending:
+            line = self._rfile.readline()
+            if not line:
+                raise ConnectionError("Audit daemon closed the connection")
+            reply = json.loads(line)
+            pending.discard(reply.get('id'))
+            ok = ok and reply.get('ok', False)
+        
+        return ok
+    
+    def close(self):
+        """Close the connection"""
+        self._rfile.close()
+        self.sock.close()
+
+
+def replicate_to_command(blockchain: BlockchainAuditLog, command: str, batch_size: int = 500) -> Dict:
+    """Push missing blocks to a replica served by a command's stdin/stdout
+    
+    The command is typically `ssh <host> secureos-blockchain sync-receive`;
+    it sends its locator, receives the stream and acknowledges the result.
+    """
+    proc = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        kind, payload = _read_frame(proc.stdout)
+        if kind != b'L':
+            raise ValueError("Replica did not send its locator")
+        
+        try:
+            stats = blockchain.write_sync_stream(proc.stdin, json.loads(payload), batch_size)
+        except BrokenPipeError:
+            # The replica stopped reading; its acknowledgement says why
+            stats = {}
+        proc.stdin.close()
+        
+        kind, payload = _read_frame(proc.stdout)
+        if kind != b'A':
+            raise ValueError("Replica did not acknowledge the stream")
+        return {**stats, **json.loads(payload)}
+    finally:
+        if not proc.stdin.closed:
+            proc.stdin.close()
+        proc.wait()
+
+
+def serve_replica(blockchain: BlockchainAuditLog, rfile, wfile) -> Dict:
+    """Replica side of replicate_to_command"""
+    _write_frame(wfile, b'L', json.dumps(blockchain.sync_locator()).encode())
+    wfile.flush()
+    
+    try:
+        result = {'ok': True, **blockchain.read_sync_stream(rfile)}
+    except ValueError as e:
+        result = {'ok': False, 'error': str(e)}
+    
+    _write_frame(wfile, b'A', json.dumps(result).encode())
+    wfile.flush()
+    return result
+
+
+def _current_rss_kb() -> int:
+    """Current resident set size of this process in KB (Linux)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _flatten_metrics(data: Dict, prefix: str = '') -> Dict[str, float]:
+    """Flatten nested benchmark results into dotted metric names"""
+    metrics = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(_flatten_metrics(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def run_benchmark(blocks: int = 1000, events_per_block: int = 100, difficulty: int = 2,
+                  difficulty_levels: List[int] = None, baseline: Optional[Dict] = None,
+                  seed: int = 42) -> Dict:
+    """Benchmark BlockchainAuditLog on a synthetic chain in a temporary database"""
+    difficulty_levels = difficulty_levels or [1, 2, 3, 4]
+    rng = random.Random(seed)
+    
+    event_types = ['login', 'logout', 'sudo', 'file_access', 'firewall_block',
+                   'service_restart', 'malware_detected', 'config_change']
+    severities = ['low', 'medium', 'high', 'critical']
+    hosts = [f'host-{i:02d}' for i in range(20)]
+    users = [f'user{i:03d}' for i in range(200)]
+    
+    # Events are spread over one year so time-range queries can be narrow
+    period_start = datetime(2025, 1, 1).timestamp()
+    period_seconds = 365 * 24 * 3600
+    total_events = blocks * events_per_block
+    step = period_seconds / max(total_events, 1)
+    
+    def synthetic_event(n: int) -> Dict:
+        return {
+            'type': rng.choice(event_types),
+            'severity': rng.choice(severities),
+            'user': rng.choice(users),
+            'host': rng.choice(hosts),
+            'timestamp': datetime.fromtimestamp(period_start + n * step).isoformat(),
+            'message': f'synthetic audit event {n} pid={rng.randint(1, 65535)}'
+        }
+    
+    def timed(func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, time.perf_counter() - start
+    
+    results = {
+        'benchmark': 'secureos-blockchain',
+        'timestamp': datetime.now().isoformat(),
+        'parameters': {
+            'blocks': blocks,
+            'events_per_block': events_per_block,
+            'difficulty': difficulty,
+            'difficulty_levels': difficulty_levels
+        }
+    }
+    
+    with tempfile.TemporaryDirectory(prefix='secureos-bench-') as tmp_dir:
+        blockchain = BlockchainAuditLog(db_path=str(Path(tmp_dir) / 'audit.db'))
+        blockchain.difficulty = difficulty
+        blockchain.block_size = events_per_block
+        blockchain.verbose = False
+        
+        # Ingest: batched pending writes, then mining + block storage
+        ingest_time = 0.0
+        mine_time = 0.0
+        for n in range(blocks):
+            batch = [synthetic_event(n * events_per_block + k) for k in range(events_per_block)]
+            _, elapsed = timed(blockchain.add_events, batch, mine=False)
+            ingest_time += elapsed
+            _, elapsed = timed(blockchain.mine_pending_block)
+            mine_time += elapsed
+        
+        results['ingest'] = {
+            'events': total_events,
+            'pending_write_events_per_sec': total_events / ingest_time if ingest_time else 0.0,
+            'mine_and_store_blocks_per_sec': blocks / mine_time if mine_time else 0.0,
+            'end_to_end_events_per_sec': total_events / (ingest_time + mine_time),
+            'database_bytes': blockchain.db_path.stat().st_size
+        }
+        
+        # Mining time versus difficulty on a full block
+        sample_events = [synthetic_event(k) for k in range(events_per_block)]
+        mining = {}
+        for level in difficulty_levels:
+            samples = []
+            for attempt in range(3):
+                block = Block(
+                    index=attempt + 1,
+                    timestamp=datetime.now().isoformat(),
+                    events=sample_events,
+                    previous_hash=hashlib.sha256(str(attempt).encode()).hexdigest(),
+                    encoding=blockchain.block_encoding
+                )
+                _, elapsed = timed(block.mine_block, level)
+                samples.append((elapsed, block.nonce))
+            mean_seconds = sum(sample[0] for sample in samples) / len(samples)
+            mean_hashes = sum(sample[1] for sample in samples) / len(samples)
+            mining[f'difficulty_{level}'] = {
+                'mean_seconds': mean_seconds,
+                'mean_hashes': mean_hashes,
+                'hashes_per_sec': mean_hashes / mean_seconds if mean_seconds else 0.0
+            }
+        results['mining'] = mining
+        
+        # Full verification, then incremental verification of new blocks only
+        chain_blocks = blockchain.chain[-1].index + 1
+        valid, elapsed = timed(blockchain.verify_chain)
+        results['verify_full'] = {
+            'valid': valid,
+            'seconds': elapsed,
+            'blocks_per_sec': chain_blocks / elapsed if elapsed else 0.0
+        }
+        
+        new_blocks = max(blocks // 100, 1)
+        for n in range(new_blocks):
+            blockchain.add_events(
+                [synthetic_event(total_events + n * events_per_block + k) for k in range(events_per_block)],
+                mine=False
+            )
+            blockchain.mine_pending_block()
+        valid, elapsed = timed(blockchain.verify_chain, incremental=True)
+        results['verify_incremental'] = {
+            'valid': valid,
+            'new_blocks': new_blocks,
+            'seconds': elapsed,
+            'blocks_per_sec': new_blocks / elapsed if elapsed else 0.0
+        }
+        
+        # Search latency: time to first result and to the full result set
+        queries = {
+            'indexed_field': ({'type': 'malware_detected'}, None),
+            'indexed_pair': ({'type': 'sudo', 'user': users[7]}, None),
+            'unindexed_field': ({'message': 'synthetic audit event 12345 pid=1'}, None),
+            'full_text': ({}, 'synthetic AND critical') if blockchain.fts_enabled else None
+        }
+        search = {}
+        for name, query in queries.items():
+            if query is None:
+                continue
+            start = time.perf_counter()
+            first = None
+            count = 0
+            for _ in blockchain.iter_search_events(*query):
+                if first is None:
+                    first = time.perf_counter() - start
+                count += 1
+            total = time.perf_counter() - start
+            search[name] = {
+                'results': count,
+                'first_result_ms': (first if first is not None else total) * 1000,
+                'total_ms': total * 1000
+            }
+        results['search'] = search
+        
+        # Time-range latency for a narrow and a wide window
+        timerange = {}
+        for name, days in (('one_hour', 1 / 24), ('one_day', 1), ('thirty_days', 30)):
+            window_start = datetime.fromtimestamp(period_start + period_seconds / 2)
+            window_end = datetime.fromtimestamp(window_start.timestamp() + days * 24 * 3600)
+            count, elapsed = timed(
+                lambda: sum(1 for _ in blockchain.iter_events_by_timerange(
+                    window_start.isoformat(), window_end.isoformat()))
+            )
+            timerange[name] = {
+                'results': count,
+                'total_ms': elapsed * 1000,
+                'events_per_sec': count / elapsed if elapsed else 0.0
+            }
+        results['timerange'] = timerange
+        
+        # Export throughput over the whole period (includes chain verification)
+        export_file = Path(tmp_dir) / 'report.ndjson.gz'
+        summary, elapsed = timed(
+            blockchain.export_compliance_report,
+            datetime.fromtimestamp(period_start).isoformat(),
+            datetime.fromtimestamp(period_start + period_seconds).isoformat(),
+            str(export_file),
+            fmt='ndjson'
+        )
+        results['export'] = {
+            'events': summary['total_events'],
+            'seconds': elapsed,
+            'events_per_sec': summary['total_events'] / elapsed if elapsed else 0.0,
+            'output_bytes': export_file.stat().st_size
+        }
+        blockchain.close()
+    
+    # ru_maxrss is reported in KB on Linux
+    results['memory'] = {
+        'current_rss_kb': _current_rss_kb(),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    
+    if baseline:
+        current = _flatten_metrics(results)
+        previous = _flatten_metrics(baseline)
+        comparison = {}
+        for name, value in current.items():
+            if name.startswith('parameters.') or name not in previous:
+                continue
+            before = previous[name]
+            comparison[name] = {
+                'baseline': before,
+                'current': value,
+                'change_pct': (value - before) / before * 100 if before else None
+            }
+        results['baseline_comparison'] = comparison
+    
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser(description='SecureOS Blockchain Audit System')
-    parser.add_argument('command', choices=['init', 'add', 'mine', 'verify', 'search', 'export', 'stats'])
+    parser.add_argument('command', choices=['init', 'add', 'mine', 'verify', 'search', 'export', 'stats',
+                                            'archive', 'serve', 'benchmark', 'seal',
+                                            'sync-locator', 'sync-send', 'sync-receive'])
     parser.add_argument('--event', type=str, help='Event JSON data')
     parser.add_argument('--query', type=str, help='Search query JSON')
+    parser.add_argument('--text', type=str, help='Full-text search expression (FTS5 syntax)')
     parser.add_argument('--start', type=str, help='Start date for time range')
     parser.add_argument('--end', type=str, help='End date for time range')
     parser.add_argument('--output', type=str, help='Output file for export')
+    parser.add_argument('--format', type=str, choices=REPORT_FORMATS, default='json',
+                       help='Export format')
+    parser.add_argument('--gzip', action='store_true',
+                       help='Gzip-compress the export (implied by a .gz output file)')
+    parser.add_argument('--keep', type=int, default=1000,
+                       help='Number of newest blocks to keep unarchived')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET_PATH,
+                       help='Ingestion daemon socket path')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Verify only blocks added since the last verification')
+    parser.add_argument('--blocks', type=int, default=1000, help='Benchmark chain length')
+    parser.add_argument('--events-per-block', type=int, default=100, help='Benchmark block size')
+    parser.add_argument('--difficulty', type=int, default=2, help='Benchmark mining difficulty')
+    parser.add_argument('--baseline', type=str, help='Previous benchmark JSON to compare against')
+    parser.add_argument('--mode', choices=SEAL_MODES, help='Sealing mode for new blocks')
+    parser.add_argument('--key-id', type=str, default='host', help='Host key used for signed sealing')
+    parser.add_argument('--algorithm', type=str,
+                       help=f"Host key algorithm when generating a key ({', '.join(CLASSICAL_SIGNERS)})")
+    parser.add_argument('--locator', type=str, help='Replica locator file for sync-send')
+    parser.add_argument('--remote', type=str,
+                       help='Command serving the replica for sync-send, e.g. "ssh log01 secureos-blockchain sync-receive"')
+    parser.add_argument('--input', type=str, help='Replication stream file for sync-receive')
     parser.add_argument('--db', type=str, default='/var/lib/secureos/blockchain/audit.db', 
                        help='Database path')
     
     args = parser.parse_args()
     
+    # Hand events to the ingestion daemon when it is running on the same
+    # database, which avoids loading the chain (and possibly mining) for
+    # every single event
+    if args.command == 'add' and args.event and Path(args.socket).exists():
+        try:
+            client = AuditClient(args.socket)
+            if client.database() == str(Path(args.db).resolve()):
+                ok = client.log(json.loads(args.event))
+                client.close()
+                print("Event added via audit daemon" if ok else "Error: audit daemon rejected event")
+                sys.exit(0 if ok else 1)
+            client.close()  # The daemon serves another database
+        except OSError:
+            pass  # Daemon not reachable - fall back to direct access
+    
+    # The benchmark builds its own chain in a temporary database
+    if args.command == 'benchmark':
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        
+        # stdout carries only the JSON results; diagnostics go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_benchmark(blocks=args.blocks, events_per_block=args.events_per_block,
+                                    difficulty=args.difficulty, baseline=baseline)
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+            print(f"Benchmark results written to {args.output}")
+        else:
+            print(output)
+        return
+    
+    # Over a pipe, sync-receive speaks the replication protocol on stdout
+    channel = None
+    if args.command == 'sync-receive' and not args.input:
+        channel = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    
     # Initialize blockchain
-    blockchain = BlockchainAuditLog(db_path=args.db)
+    try:
+        blockchain = BlockchainAuditLog(db_path=args.db,
+                                        replica=args.command in ('sync-locator', 'sync-receive'))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     
+    try:
+        _run_command(blockchain, args, channel)
+    finally:
+        blockchain.close()
+
+
+def _run_command(blockchain: BlockchainAuditLog, args, channel):
+    """Run one CLI command against an open chain"""
     if args.command == 'init':
         print("Blockchain audit system initialized")
-        print(f"Genesis block: {blockchain.chain[0].hash}")
+        print(f"Genesis block: {blockchain.get_genesis_block().hash}")
     
     elif args.command == 'add':
         if not args.event:
@@ -359,7 +2354,11 @@ def main():
             sys.exit(1)
         
         event = json.loads(args.event)
-        blockchain.add_event(event)
+        try:
+            blockchain.add_event(event)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
         print(f"Event added. Pending events: {len(blockchain.pending_events)}")
     
     elif args.command == 'mine':
@@ -369,27 +2368,113 @@ def main():
             print("No pending events to mine")
     
     elif args.command == 'verify':
-        blockchain.verify_chain()
+        if not blockchain.verify_chain(incremental=args.incremental):
+            sys.exit(1)
     
     elif args.command == 'search':
-        if not args.query:
-            print("Error: --query required")
+        if not args.query and not args.text:
+            print("Error: --query or --text required")
             sys.exit(1)
         
-        query = json.loads(args.query)
-        results = blockchain.search_events(query)
-        print(json.dumps(results, indent=2))
+        query = json.loads(args.query) if args.query else {}
+        
+        # Stream results as a JSON array instead of collecting them first
+        count = 0
+        print('[')
+        for result in blockchain.iter_search_events(query, args.text):
+            if count:
+                print(',')
+            print(json.dumps(result, indent=2), end='')
+            count += 1
+        print('\n]' if count else ']')
     
     elif args.command == 'export':
         if not args.start or not args.end or not args.output:
             print("Error: --start, --end, and --output required")
             sys.exit(1)
         
-        blockchain.export_compliance_report(args.start, args.end, args.output)
+        blockchain.export_compliance_report(args.start, args.end, args.output,
+                                            fmt=args.format, compress=args.gzip or None)
     
     elif args.command == 'stats':
         stats = blockchain.get_stats()
         print(json.dumps(stats, indent=2))
+    
+    elif args.command == 'serve':
+        AuditIngestDaemon(blockchain, socket_path=args.socket).serve_forever()
+    
+    elif args.command == 'archive':
+        archived = blockchain.archive_blocks(keep=args.keep)
+        print(f"Archived {archived} blocks into {blockchain.segments_dir}")
+    
+    elif args.command == 'seal':
+        if args.mode:
+            try:
+                blockchain.configure_sealing(args.mode, key_id=args.key_id, algorithm=args.algorithm)
+            except (ValueError, RuntimeError) as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            except FileNotFoundError:
+                print(f"❌ Host key {args.key_id} not found; pass --algorithm to generate it")
+                sys.exit(1)
+        
+        if blockchain.seal_mode == SEAL_SIGNED:
+            print(f"Sealing mode: {blockchain.seal_mode} (host key {blockchain.seal_key_id})")
+        else:
+            print(f"Sealing mode: {blockchain.seal_mode} (difficulty {blockchain.difficulty})")
+    
+    elif args.command == 'sync-locator':
+        locator = json.dumps(blockchain.sync_locator())
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(locator + '\n')
+            print(f"Replica locator written to {args.output}")
+        else:
+            print(locator)
+    
+    elif args.command == 'sync-send':
+        # Refuse before anything is sent or written
+        try:
+            blockchain.check_replicable()
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        
+        if args.remote:
+            result = replicate_to_command(blockchain, args.remote)
+            if not result.get('ok'):
+                print(f"❌ Replica rejected the stream: {result.get('error')}")
+                sys.exit(1)
+            print(f"Replicated {result['received']} blocks; replica tip is block {result['tip']}")
+        else:
+            if not args.output:
+                print("Error: --remote or --output required")
+                sys.exit(1)
+            
+            # Without a locator the replica is new and receives the whole chain
+            locator = []
+            if args.locator:
+                with open(args.locator, 'r') as f:
+                    locator = json.load(f)
+            with open(args.output, 'wb') as f:
+                stats = blockchain.write_sync_stream(f, locator)
+            print(f"Wrote {stats['blocks']} blocks in {stats['batches']} batches "
+                  f"({stats['bytes']} bytes) to {args.output}")
+    
+    elif args.command == 'sync-receive':
+        if channel is not None:
+            result = serve_replica(blockchain, sys.stdin.buffer, channel)
+        else:
+            try:
+                with open(args.input, 'rb') as f:
+                    result = {'ok': True, **blockchain.read_sync_stream(f)}
+            except ValueError as e:
+                result = {'ok': False, 'error': str(e)}
+        
+        if not result['ok']:
+            print(f"❌ Replication failed: {result['error']}")
+            sys.exit(1)
+        print(f"Received {result['received']} blocks; replica tip is block {result['tip']}")
 
 
 if __name__ == '__main__':
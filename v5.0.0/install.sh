@@ -180,7 +180,26 @@ if [ "$INSTALL_BLOCKCHAIN" = true ]; then
     # Initialize blockchain
     /usr/local/bin/secureos-blockchain init
     
+    # Create systemd service for the audit ingestion daemon
+    cat > /etc/systemd/system/secureos-blockchain.service << EOF
+[Unit]
+Description=SecureOS Blockchain Audit Ingestion Daemon
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/local/bin/secureos-blockchain serve
+Restart=on-failure
+RuntimeDirectory=secureos
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    
+    systemctl daemon-reload
+    
     echo -e "${GREEN}✓ Blockchain Audit System installed${NC}"
+    echo -e "${YELLOW}  To enable the ingestion daemon: systemctl enable --now secureos-blockchain${NC}"
 fi
 
 # Install Quantum Cryptography
@@ -238,6 +257,7 @@ if [ "$INSTALL_SANDBOX" = true ]; then
     
     # Install sandbox dependencies
     apt-get install -y firejail docker.io qemu-system-x86
+    apt-get install -y python3-numpy  # Vectorized entropy profiling (optional)
     
     # Copy sandbox engine
     cp v5.0.0/malware-sandbox/secureos-sandbox.py /opt/secureos/v5.0.0/
@@ -4,16 +4,2358 @@ SecureOS v5.0.0 - Advanced Malware Sandbox
 Hardware-isolated malware analysis and detonation chamber
 """
 
+import io
 import os
+import re
+import bz2
 import sys
+import gzip
 import json
+import lzma
+import zlib
+import math
+import codecs
+import fcntl
+import shutil
+import mmap
+import signal
 import time
+import random
 import hashlib
+import marshal
+import sqlite3
+import stat
+import struct
+import resource
+import tarfile
+import zipfile
 import argparse
+import multiprocessing
+import tempfile
+import selectors
 import subprocess
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+# NumPy vectorizes byte histograms and entropy; without it the same
+# results are computed in pure Python, much more slowly
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Samples are read in chunks of this size, so memory use does not depend
+# on the size of the sample
+SCAN_CHUNK_SIZE = 1 << 20
+
+# Version of the analysis pipeline (static checks and scoring). Cached verdicts
+# from another engine version or rule set are not reused
+ENGINE_VERSION = 4
+
+# Printable ASCII runs reported as strings (same minimum length as before)
+MIN_STRING_LENGTH = 5
+MAX_STRING_LENGTH = 4096
+_PRINTABLE_RUN = re.compile(rb'[\t\x20-\x7e]{%d,}' % MIN_STRING_LENGTH)
+
+SUSPICIOUS_KEYWORDS = [
+    'password', 'admin', 'cmd.exe', 'powershell', 'http://',
+    'https://', 'eval', 'exec', 'system', 'shell', 'exploit',
+    'payload', 'backdoor', 'rootkit', 'keylog'
+]
+
+
+# Entropy profile: windows of ENTROPY_WINDOW bytes advancing by half a
+# window. Overlapping windows at or above HIGH_ENTROPY_THRESHOLD merge into
+# high-entropy regions (packed or encrypted payloads)
+ENTROPY_WINDOW = 64 * 1024
+HIGH_ENTROPY_THRESHOLD = 7.2
+MAX_PROFILE_POINTS = 256
+MAX_ENTROPY_REGIONS = 64
+
+
+def _byte_histogram(data: bytes):
+    """Counts of each byte value in data"""
+    if np is not None:
+        return np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    counts = [0] * 256
+    for value, count in Counter(data).items():
+        counts[value] = count
+    return counts
+
+
+def _block_histograms(data: bytes, block: int):
+    """Byte histograms of the whole `block`-sized pieces of data, one row per piece"""
+    count = len(data) // block
+    if np is not None:
+        values = np.frombuffer(data, dtype=np.uint8, count=count * block).reshape(count, block)
+        return np.array([np.bincount(row, minlength=256) for row in values]).reshape(count, 256)
+    return [_byte_histogram(data[i * block:(i + 1) * block]) for i in range(count)]
+
+
+def _histogram_entropy(histogram, total: int) -> float:
+    """Shannon entropy in bits per byte from 256 byte counts"""
+    if not total:
+        return 0.0
+    
+    if np is not None:
+        counts = np.asarray(histogram, dtype=np.float64)
+        p = counts[counts > 0] / total
+        return float(-(p * np.log2(p)).sum())
+    
+    entropy = 0.0
+    for count in histogram:
+        if count:
+            p = count / total
+            entropy -= p * math.log2(p)
+    return entropy
+
+
+class EntropyProfile:
+    """Whole-stream byte histogram plus a sliding-window entropy profile
+    
+    Fed chunk by chunk; memory stays bounded however long the stream is.
+    """
+    
+    def __init__(self, window: int = ENTROPY_WINDOW, threshold: float = HIGH_ENTROPY_THRESHOLD):
+        self.block = window // 2
+        self.threshold = threshold
+        self.histogram = np.zeros(256, dtype=np.int64) if np is not None else [0] * 256
+        self.size = 0
+        
+        self.windows = 0
+        self.min_entropy = None
+        self.max_entropy = 0.0
+        self.profile = []  # Max window entropy per `span` consecutive windows
+        self.span = 1
+        self.regions = []
+        self.region_count = 0
+        self.high_entropy_bytes = 0
+        
+        self._pending = b''  # Tail shorter than a block
+        self._previous = None  # Histogram of the last whole block
+        self._blocks = 0
+        self._bucket = 0.0
+        self._bucket_windows = 0
+        self._region = None
+    
+    def update(self, chunk: bytes):
+        """Add the next chunk of the stream"""
+        self.size += len(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        rows = _block_histograms(data, self.block)
+        count = len(rows)
+        self._pending = data[count * self.block:]
+        if not count:
+            return
+        
+        # Each window is a pair of adjacent blocks
+        first_block = self._blocks - 1 if self._previous is not None else self._blocks
+        if np is not None:
+            self.histogram += rows.sum(axis=0)
+            if self._previous is not None:
+                rows = np.vstack([self._previous[None, :], rows])
+            pairs = rows[:-1] + rows[1:]
+            p = pairs / (2 * self.block)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                entropies = -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1)
+            entropies = entropies.tolist()
+        else:
+            for row in rows:
+                self.histogram = [a + b for a, b in zip(self.histogram, row)]
+            if self._previous is not None:
+                rows = [self._previous] + rows
+            entropies = [
+                _histogram_entropy([a + b for a, b in zip(rows[i], rows[i + 1])], 2 * self.block)
+                for i in range(len(rows) - 1)
+            ]
+        
+        for i, entropy in enumerate(entropies):
+            self._add_window((first_block + i) * self.block, 2 * self.block, entropy)
+        
+        self._previous = rows[-1]
+        self._blocks += count
+    
+    def _add_window(self, offset: int, length: int, entropy: float):
+        """Record one window in the profile and region list"""
+        self.windows += 1
+        self.max_entropy = max(self.max_entropy, entropy)
+        self.min_entropy = entropy if self.min_entropy is None else min(self.min_entropy, entropy)
+        
+        # Halve the profile resolution whenever it gets too long
+        self._bucket = max(self._bucket, entropy) if self._bucket_windows else entropy
+        self._bucket_windows += 1
+        if self._bucket_windows == self.span:
+            self.profile.append(round(self._bucket, 3))
+            self._bucket_windows = 0
+            if len(self.profile) == 2 * MAX_PROFILE_POINTS:
+                self.profile = [max(a, b) for a, b in zip(self.profile[::2], self.profile[1::2])]
+                self.span *= 2
+        
+        if entropy < self.threshold:
+            return
+        
+        region = self._region
+        if region is not None and offset <= region['offset'] + region['length']:
+            end = offset + length
+            self.high_entropy_bytes += end - (region['offset'] + region['length'])
+            region['length'] = end - region['offset']
+            region['entropy'] = round(max(region['entropy'], entropy), 3)
+            return
+        
+        self._region = {'offset': offset, 'length': length, 'entropy': round(entropy, 3)}
+        self.high_entropy_bytes += length
+        self.region_count += 1
+        if len(self.regions) < MAX_ENTROPY_REGIONS:
+            self.regions.append(self._region)
+    
+    def entropy(self) -> float:
+        """Entropy of everything fed so far"""
+        if self._pending:
+            return _histogram_entropy(
+                [a + b for a, b in zip(self.histogram, _byte_histogram(self._pending))], self.size
+            )
+        return _histogram_entropy(self.histogram, self.size)
+    
+    def finish(self) -> Dict:
+        """Close the stream and summarize the profile"""
+        total_entropy = self.entropy()
+        
+        # The trailing partial block pairs with the last whole block; a stream
+        # shorter than a window is a single window
+        if self._pending or self._blocks == 1:
+            tail = _byte_histogram(self._pending)
+            if self._previous is not None:
+                tail = [a + b for a, b in zip(self._previous, tail)]
+            length = len(self._pending) + (self.block if self._previous is not None else 0)
+            offset = (self._blocks - 1) * self.block if self._previous is not None else 0
+            if length:
+                self._add_window(offset, length, _histogram_entropy(tail, length))
+            self._pending = b''
+        
+        if self._bucket_windows:
+            self.profile.append(round(self._bucket, 3))
+            self._bucket_windows = 0
+        
+        return {
+            'entropy': total_entropy,
+            'window': 2 * self.block,
+            'step': self.block,
+            'windows': self.windows,
+            'min_entropy': round(self.min_entropy or 0.0, 3),
+            'max_entropy': round(self.max_entropy, 3),
+            'profile': self.profile,
+            'profile_span': self.span,
+            'high_entropy_threshold': self.threshold,
+            'high_entropy_regions': self.regions,
+            'high_entropy_region_count': self.region_count,
+            'high_entropy_bytes': self.high_entropy_bytes
+        }
+
+
+# Similarity digest in the style of TLSH: every 5-byte window adds six byte
+# triplets (the newest byte and two earlier ones) to 128 hashed buckets, and
+# each bucket count is encoded in two bits by the quartile it falls in.
+# Variants of one sample keep most bucket codes, so their digests are close
+# (see fuzzy_distance)
+FUZZY_BUCKETS = 128
+FUZZY_MIN_SIZE = 50
+FUZZY_TRIPLETS = [(1, 2), (1, 3), (2, 3), (2, 4), (1, 4), (3, 4)]
+FUZZY_MULTIPLIER = 0x9E3779B1
+
+# Digests are indexed in bands of FUZZY_BAND_CODES bucket codes; reports
+# sharing any band with a digest are the candidates for its nearest neighbours
+FUZZY_BAND_CODES = 6
+FUZZY_BANDS = FUZZY_BUCKETS // FUZZY_BAND_CODES
+
+
+class FuzzyHash:
+    """Streaming similarity digest of a byte stream"""
+    
+    def __init__(self):
+        self.counts = np.zeros(FUZZY_BUCKETS, dtype=np.int64) if np is not None else [0] * FUZZY_BUCKETS
+        self.size = 0
+        self._tail = b''  # Last 4 bytes, the start of windows spanning chunks
+        self._buffers = None
+    
+    def update(self, chunk: bytes):
+        """Add the next chunk of the stream"""
+        self.size += len(chunk)
+        data = self._tail + chunk
+        self._tail = data[-4:]
+        if len(data) < 5:
+            return
+        
+        # A triplet is the 32-bit key salt|newest|earlier|earlier; the top
+        # 7 bits of its product with FUZZY_MULTIPLIER pick the bucket
+        if np is not None:
+            self._update_vectorized(data)
+            return
+        
+        counts = self.counts
+        for i in range(4, len(data)):
+            newest = data[i] << 16
+            for salt, (b, c) in enumerate(FUZZY_TRIPLETS, 1):
+                key = salt << 24 | newest | data[i - b] << 8 | data[i - c]
+                counts[(key * FUZZY_MULTIPLIER & 0xFFFFFFFF) >> 25] += 1
+    
+    def _update_vectorized(self, data: bytes):
+        # Working arrays are reused across chunks; allocating fresh ones for
+        # every chunk costs more than the arithmetic
+        n = len(data)
+        if self._buffers is None or len(self._buffers[0]) != n:
+            self._buffers = (np.empty(n, dtype=np.uint32), np.empty(n - 4, dtype=np.uint32),
+                             np.empty(n - 4, dtype=np.uint32), np.empty(n - 4, dtype=np.uint32))
+        values, newest, key, previous = self._buffers
+        
+        np.copyto(values, np.frombuffer(data, dtype=np.uint8))
+        window = [values[4 - k:n - k] for k in range(5)]  # Byte k back from the newest
+        np.left_shift(window[0], 16, out=newest)
+        multiplier = np.uint32(FUZZY_MULTIPLIER)
+        for salt, (b, c) in enumerate(FUZZY_TRIPLETS, 1):
+            np.left_shift(window[b], 8, out=key)
+            key |= window[c]
+            key |= newest
+            key |= salt << 24
+            key *= multiplier
+            key >>= 25
+            
+            # bincount is the slow step, so pairs of buckets are counted as one 14-bit value
+            if salt % 2:
+                key, previous = previous, key
+                continue
+            previous <<= 7
+            previous |= key
+            pairs = np.bincount(previous, minlength=FUZZY_BUCKETS ** 2).reshape(FUZZY_BUCKETS, FUZZY_BUCKETS)
+            self.counts += pairs.sum(axis=1) + pairs.sum(axis=0)
+
+    def hexdigest(self) -> Optional[str]:
+        """Digest string, or None when the stream is too short or too uniform to compare"""
+        counts = [int(count) for count in self.counts]
+        if self.size < FUZZY_MIN_SIZE or sum(1 for count in counts if count) <= FUZZY_BUCKETS // 2:
+            return None
+        
+        ordered = sorted(counts)
+        q1, q2, q3 = (ordered[FUZZY_BUCKETS * k // 4 - 1] for k in (1, 2, 3))
+        if not q3:
+            return None
+        
+        body = bytearray(FUZZY_BUCKETS // 4)
+        for i, count in enumerate(counts):
+            code = 0 if count <= q1 else 1 if count <= q2 else 2 if count <= q3 else 3
+            body[i // 4] |= code << (2 * (i % 4))
+        
+        length = min(int(math.log(self.size) / math.log(1.5)), 255)
+        return f"F1{length:02x}{q1 * 100 // q3 % 16:x}{q2 * 100 // q3 % 16:x}{body.hex()}"
+
+
+_FUZZY_BYTE_DISTANCE = None
+
+
+def _fuzzy_codes(digest: str) -> List[int]:
+    """The bucket codes of a digest"""
+    body = bytes.fromhex(digest[6:])
+    return [(byte >> shift) & 3 for byte in body for shift in (0, 2, 4, 6)]
+
+
+def fuzzy_distance(first: str, second: str) -> int:
+    """Distance between two digests; 0 for identical, under about 50 for close variants"""
+    global _FUZZY_BYTE_DISTANCE
+    if _FUZZY_BYTE_DISTANCE is None:
+        # Codes differing by 3 (lowest vs highest quartile) count double
+        code_distance = [[abs(x - y) if abs(x - y) < 3 else 6 for y in range(4)] for x in range(4)]
+        _FUZZY_BYTE_DISTANCE = [
+            sum(code_distance[(x >> shift) & 3][(y >> shift) & 3] for shift in (0, 2, 4, 6))
+            for x in range(256) for y in range(256)
+        ]
+    
+    def header_distance(x: int, y: int, modulus: int, scale: int) -> int:
+        diff = abs(x - y)
+        diff = min(diff, modulus - diff)
+        return diff if diff <= 1 else (diff - 1) * scale
+    
+    distance = header_distance(int(first[2:4], 16), int(second[2:4], 16), 256, 12)
+    distance += header_distance(int(first[4], 16), int(second[4], 16), 16, 12)
+    distance += header_distance(int(first[5], 16), int(second[5], 16), 16, 12)
+    table = _FUZZY_BYTE_DISTANCE
+    return distance + sum(table[x << 8 | y] for x, y in zip(bytes.fromhex(first[6:]), bytes.fromhex(second[6:])))
+
+
+def _fuzzy_bands(digest: str) -> List[int]:
+    """LSH bucket keys of a digest, one per band of bucket codes"""
+    codes = _fuzzy_codes(digest)
+    keys = []
+    for band in range(FUZZY_BANDS):
+        key = band
+        for code in codes[band * FUZZY_BAND_CODES:(band + 1) * FUZZY_BAND_CODES]:
+            key = key << 2 | code
+        keys.append(key)
+    return keys
+
+
+# Executable headers (ELF and PE) are parsed in-process from a memoryview
+# over the mapped file. Only the bytes a field needs are read, and tables
+# are parsed when first asked for
+MAX_SECTIONS = 96
+MAX_IMPORTS = 2048
+MAX_IMPORT_LIBRARIES = 256
+MAX_DYNAMIC_ENTRIES = 1024  # .dynamic entries read per section
+MAX_SYMBOLS = 65536  # .dynsym entries read per section
+MAX_NAME_LENGTH = 256
+
+# Imports that are flagged when an executable uses any of them
+SUSPICIOUS_IMPORTS = {
+    'process_injection': ['CreateRemoteThread', 'WriteProcessMemory', 'VirtualAllocEx', 'NtUnmapViewOfSection',
+                          'QueueUserAPC', 'SetThreadContext', 'process_vm_writev'],
+    'anti_debugging': ['CheckRemoteDebuggerPresent', 'NtQueryInformationProcess', 'ptrace'],
+    'keylogging': ['SetWindowsHookExA', 'SetWindowsHookExW', 'GetAsyncKeyState', 'GetKeyboardState']
+}
+
+# Leading bytes of other common formats, as (offset, magic, description)
+FILE_MAGIC = [
+    (0, b'%PDF-', 'PDF document'),
+    (0, b'PK\x03\x04', 'Zip archive data'),
+    (0, b'\x1f\x8b', 'gzip compressed data'),
+    (0, b'BZh', 'bzip2 compressed data'),
+    (0, b'\xfd7zXZ\x00', 'XZ compressed data'),
+    (0, b"7z\xbc\xaf'\x1c", '7-zip archive data'),
+    (0, b'Rar!\x1a\x07', 'RAR archive data'),
+    (257, b'ustar', 'POSIX tar archive'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'Composite Document File V2 Document'),
+    (0, b'\xcf\xfa\xed\xfe', 'Mach-O 64-bit executable'),
+    (0, b'\xce\xfa\xed\xfe', 'Mach-O executable'),
+    (0, b'\xca\xfe\xba\xbe', 'Mach-O universal binary'),
+    (0, b'\x89PNG\r\n\x1a\n', 'PNG image data'),
+    (0, b'\xff\xd8\xff', 'JPEG image data'),
+    (0, b'GIF8', 'GIF image data')
+]
+
+PE_MACHINES = {0x14c: 'Intel 80386', 0x8664: 'x86-64', 0x1c0: 'ARM', 0x1c4: 'ARMv7', 0xaa64: 'Aarch64'}
+ELF_MACHINES = {3: 'Intel 80386', 8: 'MIPS', 20: 'PowerPC', 21: 'PowerPC64', 40: 'ARM', 62: 'x86-64',
+                183: 'ARM aarch64', 243: 'RISC-V'}
+ELF_TYPES = {1: 'relocatable', 2: 'executable', 3: 'shared object', 4: 'core file'}
+
+
+def _c_string(view: memoryview, offset: int) -> str:
+    """NUL-terminated string at offset, at most MAX_NAME_LENGTH bytes"""
+    if not 0 <= offset < len(view):
+        raise ValueError(f"string offset {offset:#x} outside the file")
+    raw = bytes(view[offset:offset + MAX_NAME_LENGTH])
+    return raw.split(b'\0', 1)[0].decode('latin-1')
+
+
+def _region_entropy(view: memoryview, offset: int, size: int) -> float:
+    """Entropy of size bytes at offset, clipped to the end of the file"""
+    region = view[offset:offset + size]
+    entropy = _histogram_entropy(_byte_histogram(region), len(region))
+    region.release()
+    return round(entropy, 3)
+
+
+def _permissions(readable: bool, writable: bool, executable: bool) -> str:
+    return ('r' if readable else '-') + ('w' if writable else '-') + ('x' if executable else '-')
+
+
+class ExecutableImage:
+    """Headers of an executable, parsed lazily from a memoryview"""
+    
+    format = None
+    
+    def __init__(self, view: memoryview):
+        self.view = view
+        self._sections = None
+        self._imports = None
+    
+    @staticmethod
+    def parse(view: memoryview) -> Optional['ExecutableImage']:
+        """The parser for view's format, or None if it is not ELF or PE"""
+        if view[:4] == b'\x7fELF':
+            return ELFImage(view)
+        if view[:2] == b'MZ' and len(view) >= 0x40:
+            pe_offset = struct.unpack_from('<I', view, 0x3c)[0]
+            if view[pe_offset:pe_offset + 4] == b'PE\0\0':
+                return PEImage(view, pe_offset)
+        return None
+    
+    @property
+    def sections(self) -> List[Dict]:
+        if self._sections is None:
+            self._sections = self._parse_sections()
+        return self._sections
+    
+    @property
+    def imports(self) -> Tuple[List[str], List[str]]:
+        """Imported libraries and imported function names"""
+        if self._imports is None:
+            self._imports = self._parse_imports()
+        return self._imports
+    
+    def overlay(self) -> Optional[Dict]:
+        """Data appended after everything the headers describe"""
+        end = self._image_end()
+        if end >= len(self.view):
+            return None
+        return {'offset': end, 'size': len(self.view) - end,
+                'entropy': _region_entropy(self.view, end, len(self.view) - end)}
+    
+    def summary(self) -> Dict:
+        """Everything parsed, with the entropy of each section"""
+        libraries, imports = self.imports
+        sections = []
+        for section in self.sections:
+            section = dict(section)
+            section['entropy'] = _region_entropy(self.view, section['offset'], section['size'])
+            sections.append(section)
+        return {
+            'format': self.format,
+            'machine': self.machine(),
+            'entry_point': self.entry_point(),
+            'sections': sections,
+            'libraries': libraries,
+            'imports': imports,
+            'overlay': self.overlay()
+        }
+
+
+class PEImage(ExecutableImage):
+    """Windows PE/COFF image"""
+    
+    format = 'PE'
+    
+    def __init__(self, view: memoryview, pe_offset: int):
+        super().__init__(view)
+        (self.machine_id, self.section_count, self.timestamp, _, _,
+         optional_size, self.characteristics) = struct.unpack_from('<HHIIIHH', view, pe_offset + 4)
+        self.optional_offset = pe_offset + 24
+        self.magic = struct.unpack_from('<H', view, self.optional_offset)[0]
+        self.pe32_plus = self.magic == 0x20b
+        self.section_table = self.optional_offset + optional_size
+    
+    def machine(self) -> str:
+        return PE_MACHINES.get(self.machine_id, f'machine {self.machine_id:#x}')
+    
+    def entry_point(self) -> int:
+        return struct.unpack_from('<I', self.view, self.optional_offset + 16)[0]
+    
+    def subsystem(self) -> int:
+        return struct.unpack_from('<H', self.view, self.optional_offset + 68)[0]
+    
+    def file_type(self) -> str:
+        kind = 'PE32+' if self.pe32_plus else 'PE32'
+        role = '(DLL)' if self.characteristics & 0x2000 else 'executable'
+        subsystem = {2: ' (GUI)', 3: ' (console)'}.get(self.subsystem(), '')
+        return f"{kind} {role}{subsystem} {self.machine()}, for MS Windows"
+    
+    def data_directory(self, index: int) -> Tuple[int, int]:
+        """RVA and size of a data directory entry"""
+        count_offset = self.optional_offset + (108 if self.pe32_plus else 92)
+        if index >= struct.unpack_from('<I', self.view, count_offset)[0]:
+            return 0, 0
+        return struct.unpack_from('<II', self.view, count_offset + 4 + 8 * index)
+    
+    def _parse_sections(self) -> List[Dict]:
+        sections = []
+        for i in range(min(self.section_count, MAX_SECTIONS)):
+            offset = self.section_table + 40 * i
+            name = bytes(self.view[offset:offset + 8]).split(b'\0', 1)[0].decode('latin-1')
+            (virtual_size, virtual_address, raw_size, raw_offset,
+             _, _, _, _, flags) = struct.unpack_from('<IIIIIIHHI', self.view, offset + 8)
+            sections.append({
+                'name': name,
+                'offset': raw_offset,
+                'size': raw_size,
+                'virtual_address': virtual_address,
+                'virtual_size': virtual_size,
+                'permissions': _permissions(bool(flags & 0x40000000), bool(flags & 0x80000000),
+                                            bool(flags & 0x20000000))
+            })
+        return sections
+    
+    def rva_to_offset(self, rva: int) -> int:
+        for section in self.sections:
+            start = section['virtual_address']
+            if start <= rva < start + max(section['virtual_size'], section['size']):
+                return rva - start + section['offset']
+        raise ValueError(f"RVA {rva:#x} is outside every section")
+    
+    def _parse_imports(self) -> Tuple[List[str], List[str]]:
+        rva, _ = self.data_directory(1)
+        libraries, imports = [], []
+        if not rva:
+            return libraries, imports
+        
+        entry_size, ordinal_flag = (8, 1 << 63) if self.pe32_plus else (4, 1 << 31)
+        thunk_format = '<Q' if self.pe32_plus else '<I'
+        descriptor = self.rva_to_offset(rva)
+        while len(libraries) < MAX_IMPORT_LIBRARIES:
+            lookup, _, _, name_rva, address = struct.unpack_from('<IIIII', self.view, descriptor)
+            if not name_rva:
+                break
+            libraries.append(_c_string(self.view, self.rva_to_offset(name_rva)))
+            thunk = self.rva_to_offset(lookup or address)
+            while len(imports) < MAX_IMPORTS:
+                value = struct.unpack_from(thunk_format, self.view, thunk)[0]
+                if not value:
+                    break
+                if value & ordinal_flag:
+                    imports.append(f"{libraries[-1]}#{value & 0xffff}")
+                else:
+                    imports.append(_c_string(self.view, self.rva_to_offset(value & 0x7fffffff) + 2))
+                thunk += entry_size
+            descriptor += 20
+        return libraries, imports
+    
+    def summary(self) -> Dict:
+        summary = super().summary()
+        summary['dll'] = bool(self.characteristics & 0x2000)
+        summary['subsystem'] = self.subsystem()
+        summary['timestamp'] = self.timestamp
+        return summary
+    
+    def _image_end(self) -> int:
+        end = self.section_table + 40 * self.section_count
+        for section in self.sections:
+            if section['size']:
+                end = max(end, section['offset'] + section['size'])
+        return end
+
+
+class ELFImage(ExecutableImage):
+    """ELF object, executable or shared library"""
+    
+    format = 'ELF'
+    
+    def __init__(self, view: memoryview):
+        super().__init__(view)
+        self.is64 = view[4] == 2
+        self.order = '>' if view[5] == 2 else '<'
+        if self.is64:
+            (self.type_id, self.machine_id, _, self.entry, self.phoff, self.shoff, _, _,
+             self.phentsize, self.phnum, self.shentsize, self.shnum,
+             self.shstrndx) = struct.unpack_from(self.order + 'HHIQQQIHHHHHH', view, 16)
+        else:
+            (self.type_id, self.machine_id, _, self.entry, self.phoff, self.shoff, _, _,
+             self.phentsize, self.phnum, self.shentsize, self.shnum,
+             self.shstrndx) = struct.unpack_from(self.order + 'HHIIIIIHHHHHH', view, 16)
+    
+    def machine(self) -> str:
+        return ELF_MACHINES.get(self.machine_id, f'machine {self.machine_id}')
+    
+    def entry_point(self) -> int:
+        return self.entry
+    
+    def segments(self) -> List[Tuple[int, int, int]]:
+        """Type, file offset and file size of each program header"""
+        layout = 'IIQQQQQQ' if self.is64 else 'IIIIIIII'
+        segments = []
+        for i in range(self.phnum):
+            segment = struct.unpack_from(self.order + layout, self.view, self.phoff + i * self.phentsize)
+            segments.append((segment[0], segment[2], segment[5]) if self.is64 else segment[:2] + segment[4:5])
+        return segments
+    
+    def kind(self) -> str:
+        # Position-independent executables are shared objects flagged DF_1_PIE
+        if self.type_id == 3 and any(tag == 0x6ffffffb and value & 0x08000000 for tag, value in self.dynamic()):
+            return 'pie executable'
+        return ELF_TYPES.get(self.type_id, f'type {self.type_id}')
+    
+    def file_type(self) -> str:
+        return (f"ELF {64 if self.is64 else 32}-bit {'MSB' if self.order == '>' else 'LSB'} "
+                f"{self.kind()}, {self.machine()}")
+    
+    def dynamic(self) -> List[Tuple[int, int]]:
+        """Tag and value of each .dynamic entry"""
+        layout, entry_size = ('qQ', 16) if self.is64 else ('iI', 8)
+        entries = []
+        for section in self.sections:
+            if section['type'] != 6:  # SHT_DYNAMIC
+                continue
+            stride = self._entry_stride(section, entry_size)
+            end = section['offset'] + min(section['size'], stride * MAX_DYNAMIC_ENTRIES)
+            for offset in range(section['offset'], end, stride):
+                tag, value = struct.unpack_from(self.order + layout, self.view, offset)
+                if tag == 0:
+                    break
+                entries.append((tag, value))
+        return entries
+    
+    def _entry_stride(self, section: Dict, entry_size: int) -> int:
+        """Distance between table entries; an entsize smaller than an entry is malformed"""
+        if not section['entsize']:
+            return entry_size
+        if section['entsize'] < entry_size:
+            raise ValueError(f"entsize {section['entsize']} below {entry_size}-byte entries")
+        return section['entsize']
+    
+    def _section_headers(self) -> List[Tuple]:
+        layout = 'IIQQQQIIQQ' if self.is64 else 'IIIIIIIIII'
+        return [struct.unpack_from(self.order + layout, self.view, self.shoff + i * self.shentsize)
+                for i in range(min(self.shnum, MAX_SECTIONS))]
+    
+    def _parse_sections(self) -> List[Dict]:
+        headers = self._section_headers()
+        names = headers[self.shstrndx][4] if 0 < self.shstrndx < len(headers) else None
+        sections = []
+        for name, kind, flags, address, offset, size, link, _, _, entsize in headers[1:]:
+            sections.append({
+                'name': _c_string(self.view, names + name) if names is not None else '',
+                'offset': offset,
+                'size': 0 if kind == 8 else size,  # SHT_NOBITS (.bss) has no file data
+                'virtual_address': address,
+                'virtual_size': size,
+                'permissions': _permissions(bool(flags & 0x2), bool(flags & 0x1), bool(flags & 0x4)),
+                'type': kind,
+                'link': link,
+                'entsize': entsize
+            })
+        return sections
+    
+    def _parse_imports(self) -> Tuple[List[str], List[str]]:
+        """Needed libraries from .dynamic and undefined symbols from .dynsym"""
+        sections = [None] + self.sections
+        libraries, imports = [], []
+        for section in self.sections:
+            if section['type'] not in (6, 11) or not 0 < section['link'] < len(sections):
+                continue
+            strings = sections[section['link']]['offset']
+            if section['type'] == 6:  # SHT_DYNAMIC: DT_NEEDED entries
+                needed = [value for tag, value in self.dynamic() if tag == 1]
+                libraries.extend(_c_string(self.view, strings + value) for value in needed[:MAX_IMPORT_LIBRARIES])
+            else:  # SHT_DYNSYM: undefined symbols are resolved from other objects
+                stride = self._entry_stride(section, 24 if self.is64 else 16)
+                index_offset = 6 if self.is64 else 14
+                end = section['offset'] + min(section['size'], stride * MAX_SYMBOLS)
+                for offset in range(section['offset'] + stride, end, stride):
+                    if len(imports) >= MAX_IMPORTS:
+                        break
+                    name = struct.unpack_from(self.order + 'I', self.view, offset)[0]
+                    index = struct.unpack_from(self.order + 'H', self.view, offset + index_offset)[0]
+                    if name and index == 0:
+                        imports.append(_c_string(self.view, strings + name))
+        return libraries, imports
+    
+    def summary(self) -> Dict:
+        summary = super().summary()
+        for section in summary['sections']:
+            for key in ('type', 'link', 'entsize'):
+                del section[key]
+        summary['type'] = self.kind()
+        return summary
+    
+    def _image_end(self) -> int:
+        end = self.shoff + self.shentsize * self.shnum
+        for section in self.sections:
+            end = max(end, section['offset'] + section['size'])
+        for _, offset, size in self.segments():
+            end = max(end, offset + size)
+        return end
+
+
+def _describe_data(view: memoryview) -> str:
+    """file(1)-style description of data that is not ELF or PE"""
+    if not len(view):
+        return 'empty'
+    for offset, magic, description in FILE_MAGIC:
+        if view[offset:offset + len(magic)] == magic:
+            return description
+    if view[:2] == b'MZ':
+        return 'MS-DOS executable'
+    
+    head = bytes(view[:65536])
+    if b'\0' in head:
+        return 'data'
+    try:
+        head.decode('ascii')
+        encoding = 'ASCII'
+    except UnicodeDecodeError:
+        try:
+            # The sample may end in the middle of a multibyte character
+            head.decode('utf-8') if len(view) <= len(head) else head[:-4].decode('utf-8')
+            encoding = 'Unicode'
+        except UnicodeDecodeError:
+            return 'data'
+    
+    if head.startswith(b'#!'):
+        command = head[2:].split(b'\n', 1)[0].split()
+        if command:
+            interpreter = os.path.basename(command[0].decode('latin-1'))
+            if interpreter == 'env' and len(command) > 1:
+                interpreter = command[1].decode('latin-1')
+            return f"{interpreter} script, {encoding} text executable"
+    return f"{encoding} text"
+
+
+def inspect_executable(file_path: Path) -> Tuple[str, Optional[Dict]]:
+    """File type description and, for ELF and PE files, the parsed headers"""
+    with open(file_path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return 'empty', None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    view = memoryview(mapped)
+    try:
+        image = ExecutableImage.parse(view)
+        if image is None:
+            return _describe_data(view), None
+        file_type = image.file_type()
+        try:
+            return file_type, image.summary()
+        except (struct.error, ValueError, IndexError) as e:
+            return file_type, {'format': image.format, 'error': f"malformed headers: {e}"}
+    except (struct.error, ValueError, IndexError):
+        return _describe_data(view), None
+    finally:
+        image = None
+        view.release()
+        mapped.close()
+
+
+# Archive samples (zip, tar, gzip/bzip2/xz) are unpacked recursively as
+# streams; members go through the static pipeline without being written out.
+# Limits stop decompression bombs: nesting depth, member count, bytes
+# decompressed over all layers, and how far one layer may expand its input
+ARCHIVE_MAX_DEPTH = 3
+ARCHIVE_MAX_MEMBERS = 1000
+ARCHIVE_MAX_BYTES = 1 << 30
+ARCHIVE_MAX_RATIO = 100
+ARCHIVE_RATIO_GRACE = 1 << 20  # Small inputs may expand further than the ratio
+ARCHIVE_SPOOL_BYTES = 8 << 20  # Nested zips need seeking; larger ones spool to a temporary file
+ARCHIVE_DECOMPRESSORS = {
+    'gzip': (lambda stream: gzip.GzipFile(fileobj=stream, mode='rb'), ('.gz', '.tgz')),
+    'bzip2': (lambda stream: bz2.BZ2File(stream), ('.bz2', '.tbz2')),
+    'xz': (lambda stream: lzma.LZMAFile(stream), ('.xz', '.txz'))
+}
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError, zlib.error, lzma.LZMAError,
+                  RuntimeError, NotImplementedError, ValueError)
+
+
+class ArchiveLimitExceeded(Exception):
+    """Unpacking stopped at one of the archive limits"""
+
+
+def _archive_kind(head: bytes) -> Optional[str]:
+    """Archive format of data starting with head, if any"""
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return 'zip'
+    if head[257:262] == b'ustar':
+        return 'tar'
+    if head[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if head[:3] == b'BZh':
+        return 'bzip2'
+    if head[:6] == b'\xfd7zXZ\x00':
+        return 'xz'
+    return None
+
+
+class ArchiveBudget:
+    """Members and bytes used so far by one archive sample"""
+    
+    def __init__(self):
+        self.members = []
+        self.bytes = 0
+        self.errors = []
+    
+    def add_member(self, record: Dict):
+        if len(self.members) >= ARCHIVE_MAX_MEMBERS:
+            raise ArchiveLimitExceeded(f"more than {ARCHIVE_MAX_MEMBERS} members")
+        self.members.append(record)
+    
+    def consume(self, count: int):
+        self.bytes += count
+        if self.bytes > ARCHIVE_MAX_BYTES:
+            raise ArchiveLimitExceeded(f"more than {ARCHIVE_MAX_BYTES >> 20} MB decompressed")
+
+
+class _BoundedReader(io.RawIOBase):
+    """Read-only stream that stops once more than limit bytes come out of it"""
+    
+    def __init__(self, stream, limit: int, label: str, budget: Optional[ArchiveBudget] = None):
+        self.stream = stream
+        self.limit = limit
+        self.label = label
+        self.budget = budget
+        self.count = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        self.count += len(data)
+        if self.count > self.limit:
+            raise ArchiveLimitExceeded(f"{self.label} expands more than {ARCHIVE_MAX_RATIO}x")
+        if self.budget is not None:
+            self.budget.consume(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _describe_head(head: bytes) -> str:
+    """File type from the first bytes of a stream"""
+    view = memoryview(head)
+    image = None
+    try:
+        image = ExecutableImage.parse(view)
+        if image is not None:
+            return image.file_type()
+    except (struct.error, ValueError, IndexError):
+        if image is not None:
+            return f"{image.format} executable"  # Headers continue past the head
+    return _describe_data(view)
+
+
+# Signature rules use a subset of the YARA language (see RuleSet). Rule files
+# are read from these directories; the built-in rules apply when none exist
+DEFAULT_RULE_DIRS = ['/etc/secureos/v5/sandbox-rules']
+RULE_FILE_SUFFIXES = ['.yar', '.yara']
+
+BUILTIN_RULES = '''
+rule suspicious_api {
+    strings:
+        $ = "CreateRemoteThread"
+        $ = "WriteProcessMemory"
+        $ = "VirtualAllocEx"
+    condition:
+        any of them
+}
+
+rule network_indicators {
+    strings:
+        $ = "URLDownloadToFile"
+        $ = "InternetOpen"
+        $ = "HttpSendRequest"
+    condition:
+        any of them
+}
+
+rule persistence {
+    meta:
+        severity = "high"
+    strings:
+        $ = "RegSetValue"
+        $ = "CreateService"
+        $ = "WinExec"
+    condition:
+        any of them
+}
+
+rule credential_theft {
+    meta:
+        severity = "high"
+    strings:
+        $ = "LsaEnumerateLogonSessions"
+        $ = "SamConnect"
+        $ = "mimikatz"
+    condition:
+        any of them
+}
+'''
+
+RULE_SEVERITIES = ['low', 'medium', 'high', 'critical']
+
+# Below this many literals, one bytes.find per literal is faster than the trie
+DIRECT_SEARCH_LIMIT = 32
+# Longest match of a /regex/ string that is still found across chunk boundaries
+MAX_REGEX_MATCH = 1024
+# Upper bound used for open-ended hex jumps such as [4-]
+MAX_HEX_JUMP = 256
+# Offsets reported per matched string
+MAX_MATCH_OFFSETS = 10
+
+# Compiled rule sets are cached in marshal format (plain data only, nothing
+# executable), one file per distinct set of rule sources
+RULE_CACHE_MAGIC = b'SOSRULES'
+RULE_CACHE_VERSION = 1
+
+
+class RuleSyntaxError(ValueError):
+    """Rule source that cannot be parsed"""
+
+
+class UnsupportedRule(RuleSyntaxError):
+    """Valid YARA that uses features outside the supported subset"""
+
+
+class Pattern:
+    """One rule string: a byte literal, or a regular expression for hex and regex strings"""
+    
+    def __init__(self, label: str, literal: Optional[bytes] = None, regex: Optional[bytes] = None,
+                 flags: int = 0, nocase: bool = False, fullword: bool = False,
+                 max_length: int = 0, atom: Optional[Tuple[bytes, int, int]] = None):
+        self.label = label  # How the string is shown in reports
+        self.literal = literal
+        self.regex = regex
+        self.flags = flags
+        self.nocase = nocase
+        self.fullword = fullword
+        self.max_length = len(literal) if literal is not None else max_length
+        # Literal run inside a regex pattern with its possible offsets from the
+        # match start; the trie finds it and the regex only verifies candidates
+        self.atom = atom
+
+
+def _build_trie(literals) -> Dict:
+    """Prefix trie of byte strings; a None key marks the end of a literal"""
+    root = {}
+    for literal in literals:
+        node = root
+        for byte in literal:
+            node = node.setdefault(byte, {})
+        node[None] = True
+    return root
+
+
+def _trie_expression(node: Dict) -> bytes:
+    """Regular expression matching the longest trie literal at a position"""
+    branches = [re.escape(bytes([byte])) + _trie_expression(child)
+                for byte, child in sorted((k, v) for k, v in node.items() if k is not None)]
+    if not branches:
+        return b''
+    expression = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+    if None in node:
+        expression = b'(?:' + expression + b')?'
+    return expression
+
+
+class _LiteralGroup:
+    """Literals searched together, all case-sensitive or all case-insensitive"""
+    
+    def __init__(self, literals: Dict[bytes, List[int]], nocase: bool, expression: Optional[bytes] = None):
+        self.literals = literals  # Literal (lowercased when nocase) -> pattern ids
+        self.nocase = nocase
+        self.trie = None
+        self.expression = None
+        self.regex = None
+        if len(literals) > DIRECT_SEARCH_LIMIT:
+            self._compile(expression)
+    
+    def _compile(self, expression: Optional[bytes] = None):
+        # The expression is cached with compiled rule sets; the trie is cheap to rebuild
+        self.trie = _build_trie(self.literals)
+        self.expression = expression or _trie_expression(self.trie)
+        self.regex = re.compile(self.expression)
+    
+    def find(self, data: bytes):
+        """Yield (start, literal) for every occurrence, overlapping ones included"""
+        if not self.literals:
+            return
+        if self.nocase:
+            data = data.lower()
+        
+        if self.regex is None:
+            for literal in self.literals:
+                start = data.find(literal)
+                while start != -1:
+                    yield start, literal
+                    start = data.find(literal, start + 1)
+            return
+        
+        # The expression stops at each position where some literal starts and
+        # matches the longest one; walking the trie along that match yields
+        # the shorter literals ending inside it. Searching again from the next
+        # byte keeps the regex engine's fast skip to candidate first bytes
+        search = self.regex.search
+        trie = self.trie
+        start = 0
+        while True:
+            match = search(data, start)
+            if match is None:
+                return
+            start = match.start()
+            text = match.group()
+            node = trie
+            for i, byte in enumerate(text):
+                node = node[byte]
+                if None in node:
+                    yield start, text[:i + 1]
+            start += 1
+    
+    def search(self, data: bytes) -> bool:
+        """Whether any literal occurs in data"""
+        if not self.literals:
+            return False
+        if self.regex is None:
+            self._compile()
+        return self.regex.search(data.lower() if self.nocase else data) is not None
+
+
+def _is_fullword(data: bytes, start: int, end: int) -> bool:
+    """Whether data[start:end] is not preceded or followed by an alphanumeric byte"""
+    return ((start == 0 or not data[start - 1:start].isalnum()) and
+            (end == len(data) or not data[end:end + 1].isalnum()))
+
+
+class PatternMatcher:
+    """Finds all occurrences of many patterns in a single pass over raw bytes
+    
+    Literals are merged into a prefix trie compiled to one regular expression
+    per case mode (the job an Aho-Corasick automaton does in YARA), so the
+    cost grows with the input size rather than with the number of patterns.
+    """
+    
+    def __init__(self, patterns: List[Pattern], expressions: Optional[List[bytes]] = None):
+        self.patterns = patterns
+        self.compiled = {}  # Pattern id -> compiled regex for hex/regex strings
+        self.expressions = []  # Regex patterns without an atom, run on their own
+        exact = {}
+        nocase = {}
+        for pattern_id, pattern in enumerate(patterns):
+            if pattern.literal is not None:
+                if pattern.nocase:
+                    nocase.setdefault(pattern.literal.lower(), []).append(pattern_id)
+                else:
+                    exact.setdefault(pattern.literal, []).append(pattern_id)
+                continue
+            if pattern.atom:
+                exact.setdefault(pattern.atom[0], []).append(pattern_id)
+            else:
+                self.expressions.append(pattern_id)
+        
+        expressions = expressions or [None, None]
+        self.groups = [_LiteralGroup(exact, False, expressions[0]), _LiteralGroup(nocase, True, expressions[1])]
+        # Bytes carried from one chunk to the next so matches spanning them are found
+        self.overlap = max([pattern.max_length for pattern in patterns] or [1]) - 1
+    
+    def regex(self, pattern_id: int):
+        """Compiled expression of a hex or regex pattern
+        
+        Compiled on first use: most atom-filtered patterns never need verifying.
+        """
+        regex = self.compiled.get(pattern_id)
+        if regex is None:
+            pattern = self.patterns[pattern_id]
+            regex = self.compiled[pattern_id] = re.compile(pattern.regex, pattern.flags)
+        return regex
+    
+    def scanner(self) -> 'PatternScanner':
+        """Streaming scan state for one input"""
+        return PatternScanner(self)
+    
+    def scan(self, data: bytes) -> Dict[int, List]:
+        """Match a complete buffer"""
+        scanner = self.scanner()
+        scanner.feed(data)
+        return scanner.hits
+    
+    def search(self, data: bytes) -> bool:
+        """Whether any literal pattern occurs in data (for short inputs)"""
+        return any(group.search(data) for group in self.groups)
+
+
+class PatternScanner:
+    """Matches of a PatternMatcher over a stream fed chunk by chunk"""
+    
+    def __init__(self, matcher: PatternMatcher):
+        self.matcher = matcher
+        self.hits = {}  # Pattern id -> [count, first offsets, last offset]
+        self._tail = b''
+        self._base = 0  # Stream offset of the start of the current window
+    
+    def feed(self, chunk: bytes):
+        """Scan the next chunk of the stream"""
+        matcher = self.matcher
+        patterns = matcher.patterns
+        window = self._tail + chunk if self._tail else chunk
+        # Matches ending inside the carried tail were reported with the previous chunk
+        fresh = len(self._tail)
+        
+        for group in matcher.groups:
+            for start, literal in group.find(window):
+                for pattern_id in group.literals[literal]:
+                    pattern = patterns[pattern_id]
+                    if pattern.literal is None:
+                        self._verify(pattern_id, window, start, fresh)
+                        continue
+                    end = start + len(literal)
+                    if end > fresh and (not pattern.fullword or _is_fullword(window, start, end)):
+                        self._hit(pattern_id, start)
+        
+        for pattern_id in matcher.expressions:
+            fullword = patterns[pattern_id].fullword
+            for match in matcher.regex(pattern_id).finditer(window):
+                if match.end() > fresh and (not fullword or _is_fullword(window, *match.span())):
+                    self._hit(pattern_id, match.start())
+        
+        keep = min(matcher.overlap, len(window))
+        self._base += len(window) - keep
+        self._tail = window[len(window) - keep:] if keep else b''
+    
+    def _verify(self, pattern_id: int, window: bytes, atom_start: int, fresh: int):
+        """Check a regex pattern around one occurrence of its atom"""
+        pattern = self.matcher.patterns[pattern_id]
+        regex = self.matcher.regex(pattern_id)
+        _, min_offset, max_offset = pattern.atom
+        for offset in range(min_offset, max_offset + 1):
+            start = atom_start - offset
+            if start < 0:
+                break
+            match = regex.match(window, start)
+            if (match and match.end() > fresh and
+                    (not pattern.fullword or _is_fullword(window, start, match.end()))):
+                self._hit(pattern_id, start)
+                break
+    
+    def _hit(self, pattern_id: int, start: int):
+        offset = self._base + start
+        hit = self.hits.get(pattern_id)
+        if hit is None:
+            self.hits[pattern_id] = [1, [offset], offset]
+        elif hit[2] != offset:  # An atom can occur twice within one match
+            hit[0] += 1
+            if len(hit[1]) < MAX_MATCH_OFFSETS:
+                hit[1].append(offset)
+            hit[2] = offset
+
+
+_HEX_TOKEN = re.compile(r'\s*(?:(\[\s*(\d*)\s*(-?)\s*(\d*)\s*\])|(~?[0-9A-Fa-f?]{2})|([(|)]))')
+
+
+def _compile_hex(body: str) -> Tuple[bytes, int, Optional[Tuple[bytes, int, int]]]:
+    """Translate a hex string body into (regex, max length, atom)"""
+    tokens = []
+    pos = 0
+    body = body.strip()
+    while pos < len(body):
+        match = _HEX_TOKEN.match(body, pos)
+        if match is None:
+            raise RuleSyntaxError(f"invalid hex string near '{body[pos:pos + 10]}'")
+        tokens.append(match)
+        pos = match.end()
+    
+    def element(token) -> Tuple[bytes, int, int, Optional[int]]:
+        """(regex, min length, max length, literal byte)"""
+        if token.group(1):
+            low = int(token.group(2) or 0)
+            if token.group(3):
+                high = int(token.group(4)) if token.group(4) else low + MAX_HEX_JUMP
+            else:
+                high = low
+            if high < low:
+                raise RuleSyntaxError(f"invalid jump {token.group(1)}")
+            return b'.{%d,%d}' % (low, high), low, high, None
+        
+        text = token.group(5).upper()
+        negate = text.startswith('~')
+        text = text.lstrip('~')
+        if '?' not in text:
+            value = int(text, 16)
+            if negate:
+                return b'[^' + re.escape(bytes([value])) + b']', 1, 1, None
+            return re.escape(bytes([value])), 1, 1, value
+        if text == '??':
+            if negate:
+                raise RuleSyntaxError("'~??' matches nothing")
+            return b'.', 1, 1, None
+        if text[1] == '?':
+            values = [int(text[0], 16) * 16 + low for low in range(16)]
+        else:
+            values = [high * 16 + int(text[1], 16) for high in range(16)]
+        return ((b'[^' if negate else b'[') + b''.join(re.escape(bytes([v])) for v in values) + b']',
+                1, 1, None)
+    
+    def sequence(index: int, nested: bool):
+        """Parse elements up to '|' or ')' (nested) or the end"""
+        elements = []
+        while index < len(tokens):
+            token = tokens[index]
+            if token.group(6) in ('|', ')'):
+                if not nested:
+                    raise RuleSyntaxError(f"unexpected '{token.group(6)}' in hex string")
+                break
+            if token.group(6) == '(':
+                alternatives = []
+                index += 1
+                while True:
+                    items, index = sequence(index, True)
+                    if not items:
+                        raise RuleSyntaxError("empty alternative in hex string")
+                    alternatives.append(items)
+                    if index >= len(tokens):
+                        raise RuleSyntaxError("unclosed '(' in hex string")
+                    index += 1
+                    if tokens[index - 1].group(6) == ')':
+                        break
+                elements.append((
+                    b'(?:' + b'|'.join(b''.join(e[0] for e in items) for items in alternatives) + b')',
+                    min(sum(e[1] for e in items) for items in alternatives),
+                    max(sum(e[2] for e in items) for items in alternatives),
+                    None
+                ))
+                continue
+            elements.append(element(token))
+            index += 1
+        return elements, index
+    
+    elements, _ = sequence(0, False)
+    if not elements or elements[0][0].startswith(b'.{') or elements[-1][0].startswith(b'.{'):
+        raise RuleSyntaxError("hex strings must start and end with a byte")
+    
+    # The longest run of fixed bytes becomes the atom
+    atom = None
+    run_start = None
+    min_offset = max_offset = 0
+    run_offsets = (0, 0)
+    for i, (_, low, high, value) in enumerate(elements + [(b'', 0, 0, None)]):
+        if value is not None:
+            if run_start is None:
+                run_start = i
+                run_offsets = (min_offset, max_offset)
+        elif run_start is not None:
+            run = bytes(e[3] for e in elements[run_start:i])
+            if atom is None or len(run) > len(atom[0]):
+                atom = (run, run_offsets[0], run_offsets[1])
+            run_start = None
+        min_offset += low
+        max_offset += high
+    if atom is not None and len(atom[0]) < 2:
+        atom = None
+    
+    return b''.join(e[0] for e in elements), max_offset, atom
+
+
+_STRING_ESCAPE = re.compile(r'\\(x[0-9A-Fa-f]{2}|.)')
+_STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}
+
+
+def _decode_string(text: str) -> bytes:
+    """Bytes of a quoted text string body with its escapes resolved"""
+    def escape(match):
+        code = match.group(1)
+        if code[0] == 'x' and len(code) == 3:
+            return chr(int(code[1:], 16))
+        if code not in _STRING_ESCAPES:
+            raise RuleSyntaxError(f"unknown escape '\\{code}'")
+        return _STRING_ESCAPES[code]
+    return _STRING_ESCAPE.sub(escape, text).encode('latin-1')
+
+
+_CONDITION_TOKEN = re.compile(r'\s*(\$[A-Za-z0-9_]*\*?|#[A-Za-z0-9_]*|\d+|>=|<=|==|!=|[<>(),]|[A-Za-z_]\w*)')
+_COMPARISONS = {
+    '>': lambda a, b: a > b, '>=': lambda a, b: a >= b, '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b, '==': lambda a, b: a == b, '!=': lambda a, b: a != b
+}
+
+
+def _parse_condition(text: str, identifiers: List[str]) -> tuple:
+    """Parse a condition into a tuple tree evaluated by _evaluate_condition
+    
+    Supported: string references, #counts compared with numbers, 'any/all/N
+    of them' or of a ($a, $b*) set, and/or/not, parentheses, true/false.
+    """
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _CONDITION_TOKEN.match(text, pos)
+        if match is None:
+            raise UnsupportedRule(f"condition syntax near '{text[pos:pos + 10]}'")
+        tokens.append(match.group(1))
+        pos = match.end()
+    position = 0
+    
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+    
+    def take(expected=None):
+        nonlocal position
+        token = peek()
+        if token is None or expected is not None and token != expected:
+            raise RuleSyntaxError(f"expected '{expected or 'expression'}' in condition, got '{token}'")
+        position += 1
+        return token
+    
+    def reference(name):
+        if name not in identifiers:
+            raise RuleSyntaxError(f"undefined string {name}")
+        return name
+    
+    def string_set():
+        if peek() == 'them':
+            take()
+            return list(identifiers)
+        take('(')
+        names = []
+        while True:
+            name = take()
+            if name.endswith('*'):
+                names.extend(i for i in identifiers if i.startswith(name[:-1]))
+            elif name.startswith('$'):
+                names.append(reference(name))
+            else:
+                raise UnsupportedRule(f"'{name}' in string set")
+            if take() == ')':
+                return names
+    
+    def primary():
+        token = take()
+        if token == '(':
+            node = expression()
+            take(')')
+            return node
+        if token == 'not':
+            return ('not', primary())
+        if token in ('true', 'false'):
+            return ('bool', token == 'true')
+        if token.startswith('$') and not token.endswith('*'):
+            if len(token) == 1:
+                raise UnsupportedRule("bare '$' outside a for loop")
+            return ('string', reference(token))
+        if token.startswith('#'):
+            name = reference('$' + token[1:])
+            operator = take()
+            if operator not in _COMPARISONS:
+                raise UnsupportedRule(f"'{operator}' after {token}")
+            return ('count', name, operator, int(take()))
+        if token in ('any', 'all') or token.isdigit():
+            take('of')
+            return ('of', token, string_set())
+        raise UnsupportedRule(f"'{token}' in condition")
+    
+    def conjunction():
+        node = primary()
+        while peek() == 'and':
+            take()
+            node = ('and', node, primary())
+        return node
+    
+    def expression():
+        node = conjunction()
+        while peek() == 'or':
+            take()
+            node = ('or', node, conjunction())
+        return node
+    
+    node = expression()
+    if position != len(tokens):
+        raise UnsupportedRule(f"'{tokens[position]}' in condition")
+    return node
+
+
+def _evaluate_condition(node: tuple, counts: Dict[str, int]) -> bool:
+    """Evaluate a parsed condition given match counts per string identifier"""
+    kind = node[0]
+    if kind == 'string':
+        return counts.get(node[1], 0) > 0
+    if kind == 'and':
+        return _evaluate_condition(node[1], counts) and _evaluate_condition(node[2], counts)
+    if kind == 'or':
+        return _evaluate_condition(node[1], counts) or _evaluate_condition(node[2], counts)
+    if kind == 'not':
+        return not _evaluate_condition(node[1], counts)
+    if kind == 'count':
+        return _COMPARISONS[node[2]](counts.get(node[1], 0), node[3])
+    if kind == 'of':
+        matched = sum(1 for name in node[2] if counts.get(name, 0))
+        if node[1] == 'all':
+            return matched == len(node[2])
+        return matched >= (1 if node[1] == 'any' else int(node[1]))
+    return node[1]
+
+
+class _RuleParser:
+    """Parser for a YARA-syntax rule file"""
+    
+    _SPACE = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)+', re.S)
+    _IDENTIFIER = re.compile(r'[A-Za-z_]\w*')
+    _STRING = re.compile(r'"((?:\\.|[^"\\\n])*)"')
+    _REGEX = re.compile(r'/((?:\\.|[^/\\\n])+)/([is]*)')
+    _NUMBER = re.compile(r'-?\d+')
+    _MODIFIERS = {'nocase', 'wide', 'ascii', 'fullword', 'private'}
+    _UNSUPPORTED_MODIFIERS = {'xor', 'base64', 'base64wide'}
+    
+    def __init__(self, text: str, source: str):
+        self.text = text
+        self.source = source
+        self.pos = 0
+    
+    def error(self, message: str, cls=RuleSyntaxError):
+        line = self.text.count('\n', 0, self.pos) + 1
+        return cls(f"{self.source}:{line}: {message}")
+    
+    def skip(self):
+        match = self._SPACE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+    
+    def peek(self) -> str:
+        self.skip()
+        return self.text[self.pos:self.pos + 1]
+    
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise self.error(f"expected '{char}'")
+        self.pos += 1
+    
+    def token(self, regex, what: str):
+        self.skip()
+        match = regex.match(self.text, self.pos)
+        if match is None:
+            raise self.error(f"expected {what}")
+        self.pos = match.end()
+        return match
+    
+    def identifier(self) -> str:
+        return self.token(self._IDENTIFIER, 'identifier').group()
+    
+    def peek_identifier(self) -> Optional[str]:
+        self.skip()
+        match = self._IDENTIFIER.match(self.text, self.pos)
+        return match.group() if match else None
+    
+    def parse(self):
+        """Yield rule dictionaries, or UnsupportedRule errors for rules to skip"""
+        while self.peek():
+            word = self.identifier()
+            if word in ('import', 'include'):
+                self.token(self._STRING, 'file name')
+                continue
+            while word in ('private', 'global'):
+                word = self.identifier()
+            if word != 'rule':
+                raise self.error(f"unexpected '{word}'")
+            start = self.pos
+            try:
+                yield self.rule()
+            except UnsupportedRule as e:
+                # Skip to the end of the rule and carry on with the next one
+                self.pos = start
+                self.skip_rule()
+                yield e
+    
+    def skip_rule(self):
+        depth = 0
+        while self.pos < len(self.text):
+            self.skip()
+            char = self.text[self.pos:self.pos + 1]
+            if char == '"':
+                self.token(self._STRING, 'string')
+                continue
+            self.pos += 1
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    return
+        raise self.error("unterminated rule")
+    
+    def rule(self) -> Dict:
+        name = self.identifier()
+        tags = []
+        if self.peek() == ':':
+            self.pos += 1
+            while self.peek() != '{':
+                tags.append(self.identifier())
+        self.expect('{')
+        
+        rule = {'name': name, 'tags': tags, 'meta': {}, 'strings': [], 'condition': None}
+        while self.peek() != '}':
+            section = self.identifier()
+            self.expect(':')
+            if section == 'meta':
+                self.meta(rule['meta'])
+            elif section == 'strings':
+                self.strings(rule['strings'])
+            elif section == 'condition':
+                rule['condition'] = self.condition(rule['strings'])
+            else:
+                raise self.error(f"unknown section '{section}'")
+        self.pos += 1
+        
+        if rule['condition'] is None:
+            raise self.error(f"rule '{name}' has no condition")
+        return rule
+    
+    def meta(self, meta: Dict):
+        while self.peek_identifier():
+            mark = self.pos
+            key = self.identifier()
+            if self.peek() != '=':  # The next section
+                self.pos = mark
+                return
+            self.pos += 1
+            char = self.peek()
+            if char == '"':
+                meta[key] = _decode_string(self.token(self._STRING, 'string').group(1)).decode('latin-1')
+            elif char == '-' or char.isdigit():
+                meta[key] = int(self.token(self._NUMBER, 'number').group())
+            else:
+                value = self.identifier()
+                if value not in ('true', 'false'):
+                    raise self.error(f"invalid meta value '{value}'")
+                meta[key] = value == 'true'
+    
+    def checked(self, identifier: str, function, value):
+        """Call a string compiler, adding the rule location to its errors"""
+        try:
+            return function(value)
+        except RuleSyntaxError as e:
+            raise self.error(f"{identifier}: {e}")
+    
+    def strings(self, strings: List):
+        while self.peek() == '$':
+            identifier = self.token(re.compile(r'\$\w*'), 'string identifier').group()
+            if identifier == '$':
+                identifier = f'$_{len(strings)}'  # Anonymous string
+            self.expect('=')
+            char = self.peek()
+            if char == '"':
+                body = self.token(self._STRING, 'string').group(1)
+                kind, value = 'text', self.checked(identifier, _decode_string, body)
+            elif char == '{':
+                end = self.text.find('}', self.pos)
+                if end == -1:
+                    raise self.error("unterminated hex string")
+                kind, value = 'hex', self.text[self.pos + 1:end]
+                self.checked(identifier, _compile_hex, value)
+                self.pos = end + 1
+            elif char == '/':
+                match = self.token(self._REGEX, 'regular expression')
+                kind, value = 'regex', (match.group(1), match.group(2))
+                try:
+                    re.compile(match.group(1).encode('latin-1'))
+                except re.error as e:  # YARA regex syntax Python does not share
+                    raise self.error(f"{identifier}: {e}", UnsupportedRule)
+            else:
+                raise self.error("expected string, hex string or regular expression")
+            
+            modifiers = set()
+            while self.peek_identifier() in self._MODIFIERS | self._UNSUPPORTED_MODIFIERS:
+                modifier = self.identifier()
+                if modifier in self._UNSUPPORTED_MODIFIERS:
+                    raise self.error(f"modifier '{modifier}'", UnsupportedRule)
+                modifiers.add(modifier)
+            strings.append((identifier, kind, value, modifiers))
+    
+    def condition(self, strings: List) -> tuple:
+        # The condition runs to the closing brace of the rule
+        end = self.text.find('}', self.pos)
+        if end == -1:
+            raise self.error("unterminated rule")
+        text = self._SPACE.sub(' ', self.text[self.pos:end])
+        try:
+            node = _parse_condition(text, [s[0] for s in strings])
+        except UnsupportedRule as e:
+            raise self.error(str(e), UnsupportedRule)
+        except RuleSyntaxError as e:
+            raise self.error(str(e))
+        self.pos = end
+        return node
+
+
+def _string_patterns(kind: str, value, modifiers: set) -> List[Pattern]:
+    """Patterns that implement one rule string"""
+    if kind == 'regex':
+        source, flags = value
+        return [Pattern(f'/{source}/{flags}', regex=source.encode('latin-1'),
+                        flags=int((re.I if 'i' in flags else 0) | (re.S if 's' in flags else 0)),
+                        fullword='fullword' in modifiers, max_length=MAX_REGEX_MATCH)]
+    if kind == 'hex':
+        regex, max_length, atom = _compile_hex(value)
+        label = '{ ' + ' '.join(value.split()) + ' }'
+        return [Pattern(label, regex=regex, flags=int(re.S), max_length=max_length, atom=atom)]
+    
+    label = value.decode('latin-1')
+    encodings = []
+    if 'ascii' in modifiers or 'wide' not in modifiers:
+        encodings.append(value)
+    if 'wide' in modifiers:
+        encodings.append(value.decode('latin-1').encode('utf-16-le'))
+    return [Pattern(label if literal is value else label + ' (wide)', literal=literal,
+                    nocase='nocase' in modifiers, fullword='fullword' in modifiers)
+            for literal in encodings]
+
+
+class RuleSet:
+    """Signature rules compiled into one PatternMatcher
+    
+    Rules use YARA syntax: meta, text strings (nocase, wide, ascii, fullword),
+    hex strings with wildcards, jumps and alternatives, regular expressions,
+    and conditions built from string references, counts, 'of' sets and
+    boolean operators. Rules using other features are skipped and counted.
+    """
+    
+    def __init__(self, rules: List[Dict], patterns: List[Pattern], sources: List[str],
+                 skipped: Optional[List[str]] = None, errors: Optional[List[str]] = None,
+                 compile_time: float = 0.0, expressions: Optional[List[bytes]] = None):
+        self.rules = rules
+        self.patterns = patterns
+        self.sources = sources
+        self.skipped = skipped or []
+        self.errors = errors or []
+        self.compile_time = compile_time
+        self.matcher = PatternMatcher(patterns, expressions)
+        
+        # Set by load() when a cache directory is used
+        self.cache_key = None
+        self.cache_hit = False
+        
+        # Only rules with a matching string need evaluating, except those whose
+        # condition holds with no matches at all
+        self.rules_by_pattern = {}
+        self.unconditional = []
+        for index, rule in enumerate(rules):
+            for pattern_ids in rule['strings'].values():
+                for pattern_id in pattern_ids:
+                    self.rules_by_pattern.setdefault(pattern_id, []).append(index)
+            if _evaluate_condition(rule['condition'], {}):
+                self.unconditional.append(index)
+    
+    @classmethod
+    def parse(cls, sources: List[Tuple[str, str]]) -> 'RuleSet':
+        """Compile (name, text) rule sources"""
+        started = time.time()
+        rules = []
+        patterns = []
+        skipped = []
+        errors = []
+        names = set()
+        for source, text in sources:
+            try:
+                parsed = list(_RuleParser(text, source).parse())
+            except RuleSyntaxError as e:
+                errors.append(str(e))
+                continue
+            
+            for rule in parsed:
+                if isinstance(rule, UnsupportedRule):
+                    skipped.append(str(rule))
+                    continue
+                if rule['name'] in names:
+                    errors.append(f"{source}: duplicate rule '{rule['name']}'")
+                    continue
+                names.add(rule['name'])
+                
+                strings = {}
+                for identifier, kind, value, modifiers in rule['strings']:
+                    strings[identifier] = []
+                    for pattern in _string_patterns(kind, value, modifiers):
+                        strings[identifier].append(len(patterns))
+                        patterns.append(pattern)
+                
+                severity = str(rule['meta'].get('severity', 'medium')).lower()
+                rules.append({
+                    'name': rule['name'],
+                    'tags': rule['tags'],
+                    'severity': severity if severity in RULE_SEVERITIES else 'medium',
+                    'description': rule['meta'].get('description', ''),
+                    'strings': strings,
+                    'condition': rule['condition']
+                })
+        
+        ruleset = cls(rules, patterns, [source for source, _ in sources], skipped, errors)
+        ruleset.compile_time = time.time() - started
+        return ruleset
+    
+    @staticmethod
+    def rule_files(rule_dirs: List[str]) -> List[Path]:
+        """Rule files in the given directories, in a stable order"""
+        files = []
+        for rule_dir in rule_dirs:
+            path = Path(rule_dir)
+            if path.is_dir():
+                files.extend(sorted(p for p in path.rglob('*') if p.suffix in RULE_FILE_SUFFIXES and p.is_file()))
+        return files
+    
+    @classmethod
+    def read_sources(cls, rule_dirs: List[str]) -> List[Tuple[str, str]]:
+        """(name, text) of every rule file, or of the built-in rules if there are none"""
+        sources = [(str(path), path.read_text(encoding='latin-1')) for path in cls.rule_files(rule_dirs)]
+        return sources or [('<builtin>', BUILTIN_RULES)]
+    
+    @classmethod
+    def load(cls, rule_dirs: List[str], cache_dir: Optional[Path] = None, rebuild: bool = False) -> 'RuleSet':
+        """Compile the rule files in rule_dirs, or the built-in rules if there are none
+        
+        With a cache_dir, a compiled copy is reused as long as the rule
+        sources are unchanged; any edit gives a new key and a recompile.
+        """
+        sources = cls.read_sources(rule_dirs)
+        if cache_dir is None:
+            return cls.parse(sources)
+        
+        # Cache files are named <rule dirs>-<sources>, so sandboxes with other
+        # rule dirs can share the cache dir without evicting each other
+        dirs_key = hashlib.sha256('\0'.join(rule_dirs).encode()).hexdigest()[:16]
+        key = cls.cache_key_for(sources)
+        cache_file = Path(cache_dir) / f"{dirs_key}-{key}.rules"
+        ruleset = None
+        if not rebuild and cache_file.exists():
+            try:
+                ruleset = cls.read_cache(cache_file)
+            except (OSError, ValueError, EOFError, TypeError, KeyError):
+                ruleset = None  # Unreadable or stale format: compile again
+        
+        hit = ruleset is not None
+        if not hit:
+            ruleset = cls.parse(sources)
+            try:
+                ruleset.write_cache(cache_file)
+            except OSError as e:
+                print(f"⚠️  Could not cache compiled rules: {e}", file=sys.stderr)
+        ruleset.cache_key = key
+        ruleset.cache_hit = hit
+        # Pool workers load the rules the parent just compiled; only the
+        # parent counts the load
+        if multiprocessing.parent_process() is None:
+            cls._record_cache_use(Path(cache_dir), hit, ruleset)
+        return ruleset
+    
+    @staticmethod
+    def cache_key_for(sources: List[Tuple[str, str]]) -> str:
+        """Hash of the rule sources and everything else the compiled form depends on"""
+        digest = hashlib.sha256()
+        digest.update(f"{RULE_CACHE_VERSION}:{DIRECT_SEARCH_LIMIT}:{sys.version_info[:2]}\n".encode())
+        for source, text in sources:
+            digest.update(source.encode() + b'\0' + text.encode('latin-1') + b'\0')
+        return digest.hexdigest()
+    
+    def dumps(self) -> bytes:
+        """Serialized compiled form for the rule cache"""
+        state = {
+            'rules': self.rules,
+            'patterns': [
+                (p.label, p.literal, p.regex, p.flags, p.nocase, p.fullword, p.max_length, p.atom)
+                for p in self.patterns
+            ],
+            'sources': self.sources,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'compile_time': self.compile_time,
+            'expressions': [group.expression for group in self.matcher.groups]
+        }
+        return RULE_CACHE_MAGIC + bytes([RULE_CACHE_VERSION]) + marshal.dumps(state)
+    
+    @classmethod
+    def loads(cls, data) -> 'RuleSet':
+        """Rebuild a rule set from dumps() output"""
+        header = len(RULE_CACHE_MAGIC) + 1
+        if bytes(data[:header]) != RULE_CACHE_MAGIC + bytes([RULE_CACHE_VERSION]):
+            raise ValueError("not a compiled rule set")
+        state = marshal.loads(memoryview(data)[header:])
+        patterns = []
+        for label, literal, regex, flags, nocase, fullword, max_length, atom in state['patterns']:
+            patterns.append(Pattern(label, literal=literal, regex=regex, flags=flags, nocase=nocase,
+                                    fullword=fullword, max_length=max_length, atom=atom))
+        return cls(state['rules'], patterns, state['sources'], state['skipped'], state['errors'],
+                   state['compile_time'], state['expressions'])
+    
+    @classmethod
+    def read_cache(cls, cache_file: Path) -> 'RuleSet':
+        """Load a compiled rule set"""
+        return cls.loads(cache_file.read_bytes())
+    
+    def write_cache(self, cache_file: Path):
+        """Store the compiled form, replacing entries for older sources of the same rule dirs"""
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=cache_file.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), 0o644)
+            f.write(self.dumps())
+        os.replace(temp_name, cache_file)
+        dirs_key = cache_file.name.split('-', 1)[0]
+        for old in cache_file.parent.glob(f'{dirs_key}-*.rules'):
+            if old != cache_file:
+                try:
+                    old.unlink()
+                except FileNotFoundError:
+                    pass  # Removed by a concurrent writer
+    
+    @staticmethod
+    def cache_stats(cache_dir: Path) -> Dict:
+        """Cache hit/miss counters"""
+        try:
+            with open(cache_dir / 'stats.json', 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'hits': 0, 'misses': 0}
+    
+    @classmethod
+    def _record_cache_use(cls, cache_dir: Path, hit: bool, ruleset: 'RuleSet'):
+        """Count a cache hit or miss in stats.json"""
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # Concurrent sandboxes serialize on the lock file, and readers
+            # only ever see a complete stats.json
+            with open(cache_dir / 'stats.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                stats = cls.cache_stats(cache_dir)
+                stats['hits' if hit else 'misses'] += 1
+                if not hit:
+                    stats['last_compile_time'] = ruleset.compile_time
+                    stats['last_compiled'] = datetime.now().isoformat()
+                fd, temp_name = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    os.fchmod(f.fileno(), 0o644)
+                    json.dump(stats, f, indent=2)
+                os.replace(temp_name, cache_dir / 'stats.json')
+        except OSError:
+            pass
+    
+    def evaluate(self, hits: Dict[int, List]) -> List[Dict]:
+        """Matches for every rule whose condition holds, one entry per matched string"""
+        candidates = set(self.unconditional)
+        for pattern_id in hits:
+            candidates.update(self.rules_by_pattern.get(pattern_id, ()))
+        
+        matches = []
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            counts = {
+                identifier: sum(hits[p][0] for p in pattern_ids if p in hits)
+                for identifier, pattern_ids in rule['strings'].items()
+            }
+            if not _evaluate_condition(rule['condition'], counts):
+                continue
+            
+            matched = [p for pattern_ids in rule['strings'].values() for p in pattern_ids if p in hits]
+            for pattern_id in matched:
+                matches.append({
+                    'rule': rule['name'],
+                    'indicator': self.patterns[pattern_id].label,
+                    'severity': rule['severity'],
+                    'count': hits[pattern_id][0],
+                    'offsets': hits[pattern_id][1]
+                })
+            if not matched:  # Conditions such as 'not $a' hold without any string
+                matches.append({'rule': rule['name'], 'indicator': 'condition', 'severity': rule['severity'],
+                                'count': 0, 'offsets': []})
+        return matches
+
+
+# Keywords marking an extracted string as suspicious, matched case-insensitively
+_KEYWORD_MATCHER = PatternMatcher([Pattern(kw, literal=kw.encode(), nocase=True) for kw in SUSPICIOUS_KEYWORDS])
+
+
+# Output of a detonated sample is streamed into its job directory, at most
+# max_output_bytes per stream; reports keep byte counts and head/tail excerpts
+OUTPUT_READ_SIZE = 64 * 1024
+OUTPUT_EXCERPT_BYTES = 4096
+
+# Behaviour recorded when the sample's stderr contains a marker (any case)
+OUTPUT_BEHAVIORS = [('denied', 'Attempted restricted operation')]
+_OUTPUT_MATCHER = PatternMatcher([Pattern(behavior, literal=marker.encode(), nocase=True)
+                                  for marker, behavior in OUTPUT_BEHAVIORS])
+
+
+class OutputCapture:
+    """One output stream of a sandboxed process, spilled to a size-capped file"""
+    
+    def __init__(self, path: Path, limit: int, matcher: Optional[PatternMatcher] = _OUTPUT_MATCHER):
+        self.path = path
+        self.limit = limit
+        self.size = 0
+        self.head = bytearray()
+        self.tail = b''
+        self.scanner = matcher.scanner() if matcher is not None else None
+        self._file = open(path, 'wb')
+    
+    def write(self, data: bytes):
+        """Take the next piece of output"""
+        if self.size < self.limit:
+            self._file.write(data[:self.limit - self.size])
+        if len(self.head) < OUTPUT_EXCERPT_BYTES:
+            self.head += data[:OUTPUT_EXCERPT_BYTES - len(self.head)]
+        self.tail = (self.tail + data)[-OUTPUT_EXCERPT_BYTES:]
+        self.size += len(data)
+        if self.scanner is not None:
+            self.scanner.feed(data)
+    
+    def behaviors(self) -> List[str]:
+        """Behaviours whose markers appeared in the stream"""
+        if self.scanner is None:
+            return []
+        return [self.scanner.matcher.patterns[pattern_id].label for pattern_id in sorted(self.scanner.hits)]
+    
+    def close(self) -> Dict:
+        """Finish the file; summary for the report"""
+        self._file.close()
+        return {
+            'path': str(self.path),
+            'bytes': self.size,
+            'captured': min(self.size, self.limit),
+            'truncated': self.size > self.limit,
+            'head': self.head.decode('utf-8', errors='replace'),
+            # Empty when the head already holds everything
+            'tail': self.tail.decode('utf-8', errors='replace') if self.size > OUTPUT_EXCERPT_BYTES else ''
+        }
+
+
+# Syscall tracing (optional, firejail only): strace runs inside the sandbox
+# and writes its trace to a pipe, which SyscallTrace parses line by line as
+# it arrives. Counters use the feature names of the AI threat engine
+# (ThreatDetectionEngine.extract_features)
+STRACE_OPTIONS = ['-f', '-qq', '-yy', '-s', '256']
+MAX_TRACE_EVENTS = 500
+
+FILE_SYSCALLS = {
+    b'open', b'openat', b'openat2', b'creat', b'unlink', b'unlinkat', b'rename', b'renameat', b'renameat2',
+    b'mkdir', b'mkdirat', b'rmdir', b'chmod', b'fchmodat', b'chown', b'lchown', b'fchownat', b'truncate',
+    b'link', b'linkat', b'symlink', b'symlinkat'
+}
+SEND_SYSCALLS = {b'write', b'writev', b'send', b'sendto', b'sendmsg'}
+RECEIVE_SYSCALLS = {b'read', b'readv', b'recv', b'recvfrom', b'recvmsg'}
+FORK_SYSCALLS = {b'fork', b'vfork', b'clone', b'clone3'}
+PRIVILEGE_SYSCALLS = {b'setuid', b'setreuid', b'setresuid', b'setgid', b'setregid', b'setresgid', b'capset'}
+
+# Remote ports of services used to spread between hosts (SSH, RPC, SMB, RDP, WinRM)
+LATERAL_MOVEMENT_PORTS = {22, 135, 139, 445, 3389, 5985, 5986}
+PERSISTENCE_PATHS = [
+    '/etc/cron', '/var/spool/cron', '/etc/systemd/', '/lib/systemd/', '/usr/lib/systemd/', '/etc/init.d/',
+    '/etc/rc.local', '/etc/profile', '/etc/ld.so.preload', '/.config/autostart/', '/.config/systemd/',
+    '/.bashrc', '/.bash_profile', '/.profile', '/.ssh/authorized_keys'
+]
+
+_TRACE_STRING = re.compile(rb'"((?:[^"\\]|\\.)*)"')
+_TRACE_PORT = re.compile(rb'sin6?_port=htons\((\d+)\)')
+_TRACE_ADDRESS = re.compile(rb'inet_addr\("([^"]+)"\)|inet_pton\(AF_INET6, "([^"]+)"')
+_TRACE_INET_FD = re.compile(rb'^\d+<(?:TCP|UDP|TCPv6|UDPv6):')
+
+
+def _trace_strings(args: bytes) -> List[str]:
+    """Quoted strings of a traced call's arguments, unescaped"""
+    strings = []
+    for match in _TRACE_STRING.finditer(args):
+        try:
+            strings.append(codecs.escape_decode(match.group(1))[0].decode('utf-8', errors='replace'))
+        except ValueError:
+            strings.append(match.group(1).decode('latin-1'))
+    return strings
+
+
+class SyscallTrace:
+    """Behaviour events and counters from strace -f output, fed as it is produced
+    
+    Only the current partial line and unfinished calls (one per thread) are
+    kept, so memory does not grow with the length of the trace.
+    """
+    
+    def __init__(self):
+        self.counters = {
+            'syscall_count': 0,
+            'file_operations': 0,
+            'network_connections': 0,
+            'process_spawns': 0,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'unique_ips': 0,
+            'failed_connections': 0,
+            'cpu_usage': 0.0,  # Not visible in a syscall trace
+            'memory_usage': 0.0,
+            'child_processes': 0,
+            'elevated_privileges': False,
+            'files_created': 0,
+            'files_modified': 0,
+            'files_deleted': 0,
+            'registry_changes': 0,
+            'suspicious_strings': 0,
+            'encryption_operations': 0,
+            'lateral_movement_indicators': 0,
+            'persistence_indicators': 0
+        }
+        self.network_activity = []
+        self.file_operations = []
+        self.processes = []
+        self.persistence = []
+        self.addresses = set()
+        self._partial = b''
+        self._unfinished = {}  # pid -> start of a call another thread interrupted
+    
+    def feed(self, data: bytes):
+        """Parse the next piece of trace output"""
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+    
+    def finish(self) -> Dict:
+        """Parse any last line; counters and event lists for the report"""
+        if self._partial:
+            self._parse_line(self._partial)
+            self._partial = b''
+        self.counters['unique_ips'] = len(self.addresses)
+        return {
+            'counters': dict(self.counters),
+            'network_activity': self.network_activity,
+            'file_operations': self.file_operations,
+            'processes': self.processes,
+            'persistence': self.persistence
+        }
+    
+    def _parse_line(self, line: bytes):
+        pid, _, call = line.strip().partition(b' ')
+        call = call.lstrip()
+        if not pid.isdigit() or call[:3] in (b'---', b'+++'):
+            return  # Signals and exits
+        
+        # A call interrupted by another thread is split over two lines
+        if call.endswith(b'<unfinished ...>'):
+            self._unfinished[pid] = call[:-len(b'<unfinished ...>')]
+            return
+        if call.startswith(b'<... '):
+            start = self._unfinished.pop(pid, None)
+            resumed = call.find(b' resumed>')
+            if start is None or resumed < 0:
+                return
+            call = start + call[resumed + len(b' resumed>'):]
+        
+        name_end = call.find(b'(')
+        result = call.rfind(b') = ')
+        if name_end <= 0 or result < 0:
+            return
+        name = call[:name_end]
+        args = call[name_end + 1:result]
+        ret = call[result + 4:].split(b' ', 2)
+        failed = ret[0] == b'-1'
+        try:
+            value = int(ret[0], 0)
+        except ValueError:
+            value = 0  # '?' when the process exited during the call
+        
+        counters = self.counters
+        counters['syscall_count'] += 1
+        if name in FILE_SYSCALLS:
+            self._file_call(name, args, failed)
+        elif name == b'connect' or (name == b'sendto' and b'sin_port' in args):
+            self._connect(name, args, failed, ret[1].decode() if failed and len(ret) > 1 else None)
+            if name == b'sendto' and not failed:
+                counters['bytes_sent'] += value  # Datagram with an explicit destination
+        elif name in SEND_SYSCALLS:
+            if not failed and _TRACE_INET_FD.match(args):
+                counters['bytes_sent'] += value
+        elif name in RECEIVE_SYSCALLS:
+            if not failed and _TRACE_INET_FD.match(args):
+                counters['bytes_received'] += value
+        elif name in (b'execve', b'execveat'):
+            if not failed:
+                counters['process_spawns'] += 1
+                self._process(pid, args)
+        elif name in FORK_SYSCALLS:
+            if not failed and value > 0:
+                counters['child_processes'] += 1
+        elif name in PRIVILEGE_SYSCALLS:
+            if not failed and (name == b'capset' or args.split(b',', 1)[0].strip() == b'0'):
+                counters['elevated_privileges'] = True
+        elif name == b'getrandom':
+            counters['encryption_operations'] += 1
+    
+    def _file_call(self, name: bytes, args: bytes, failed: bool):
+        counters = self.counters
+        counters['file_operations'] += 1
+        if failed:
+            return
+        paths = _trace_strings(args)
+        path = paths[0] if paths else ''
+        if name in (b'open', b'openat', b'openat2'):
+            if b'O_CREAT' in args:
+                operation = 'create'
+            elif b'O_WRONLY' in args or b'O_RDWR' in args or b'O_TRUNC' in args:
+                operation = 'modify'
+            else:
+                if path in ('/dev/urandom', '/dev/random'):
+                    counters['encryption_operations'] += 1
+                return  # Plain reads are too frequent to list
+        elif name in (b'creat', b'mkdir', b'mkdirat', b'link', b'linkat', b'symlink', b'symlinkat'):
+            operation = 'create'
+        elif name in (b'unlink', b'unlinkat', b'rmdir'):
+            operation = 'delete'
+        else:
+            operation = 'modify'
+        
+        counters[{'create': 'files_created', 'modify': 'files_modified', 'delete': 'files_deleted'}[operation]] += 1
+        # Renames and links count at their destination too
+        target = next((p for p in paths if any(marker in p for marker in PERSISTENCE_PATHS)), None)
+        if target is not None and operation != 'delete':
+            counters['persistence_indicators'] += 1
+            if len(self.persistence) < MAX_TRACE_EVENTS:
+                self.persistence.append(target)
+        if len(self.file_operations) < MAX_TRACE_EVENTS:
+            event = {'operation': operation, 'syscall': name.decode(), 'path': path}
+            if len(paths) > 1 and name.startswith((b'rename', b'link', b'symlink')):
+                event['target'] = paths[1]
+            self.file_operations.append(event)
+    
+    def _connect(self, name: bytes, args: bytes, failed: bool, error: Optional[str]):
+        address = _TRACE_ADDRESS.search(args)
+        port = _TRACE_PORT.search(args)
+        if not address:
+            return  # Unix sockets and netlink
+        ip = (address.group(1) or address.group(2)).decode()
+        port = int(port.group(1)) if port else None
+        counters = self.counters
+        
+        # A non-blocking connect reports EINPROGRESS and completes later
+        if name == b'connect':
+            if failed and error != 'EINPROGRESS':
+                counters['failed_connections'] += 1
+            else:
+                counters['network_connections'] += 1
+        self.addresses.add(ip)
+        if port in LATERAL_MOVEMENT_PORTS:
+            counters['lateral_movement_indicators'] += 1
+        if len(self.network_activity) < MAX_TRACE_EVENTS:
+            self.network_activity.append({'syscall': name.decode(), 'address': ip, 'port': port,
+                                          'result': error or 'ok'})
+    
+    def _process(self, pid: bytes, args: bytes):
+        command = _trace_strings(args.split(b'], ', 1)[0])  # Path and argv, not the environment
+        for argument in command:
+            if _KEYWORD_MATCHER.search(argument.encode()):
+                self.counters['suspicious_strings'] += 1
+        if len(self.processes) < MAX_TRACE_EVENTS:
+            self.processes.append({'pid': int(pid), 'command': command[1:] or command})
+
+
+def _printable_tail(data: bytes) -> bytes:
+    """Trailing run of printable bytes, at most MAX_STRING_LENGTH long"""
+    start = len(data)
+    limit = max(len(data) - MAX_STRING_LENGTH, 0)
+    while start > limit and (0x20 <= data[start - 1] < 0x7f or data[start - 1] == 0x09):
+        start -= 1
+    return data[start:]
+
+
+# ioctl that makes a file share another file's blocks (copy-on-write filesystems)
+FICLONE = 0x40049409
+
+
+class StageTimer:
+    """Wall time per pipeline stage, accumulated over any number of samples"""
+    
+    def __init__(self):
+        self.seconds = {}
+        self.restart()
+    
+    def restart(self):
+        """Start timing from now, discarding time since the last mark"""
+        self._last = time.perf_counter()
+    
+    def mark(self, stage: str):
+        """Charge the time since the last mark to stage"""
+        now = time.perf_counter()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self._last
+        self._last = now
+
+
+class _NullTimer:
+    """StageTimer that records nothing, for untimed runs"""
+    
+    def restart(self):
+        pass
+    
+    def mark(self, stage: str):
+        pass
+
+
+_NO_TIMER = _NullTimer()
+
+
+class _TeeReader:
+    """Binary stream that writes everything read from it to a copy"""
+    
+    def __init__(self, stream, copy, timer: Optional[StageTimer] = None):
+        self.stream = stream
+        self.copy = copy
+        self.timer = timer or _NO_TIMER
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.timer.mark('read')
+        self.copy.write(data)
+        self.timer.mark('sample_store')
+        return data
+
+
+class SampleStore:
+    """Content-addressed sample files, laid out as <root>/ab/cd/<sha256>
+    
+    Identical samples are stored once, under the sha256 of the bytes
+    actually stored. A new sample is reflinked when the filesystem supports
+    it, hardlinked when it is a read-only file owned by root (its owner
+    could otherwise make it writable and change it under its hash), and
+    copied otherwise. Stored files are read-only and not executable.
+    """
+    
+    def __init__(self, root: Path):
+        self.root = root
+    
+    def path_for(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+    
+    def put(self, source: Path, scan, timer: Optional[StageTimer] = None) -> Tuple[Path, str, Dict]:
+        """Store source while scan reads it; returns (path, how it was stored, scan result)
+        
+        scan is called with a binary stream of the bytes being stored and
+        returns their scan. The sample is filed under the sha256 of that
+        scan, so the key always matches the stored content.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_path = self.root / f".tmp-{os.getpid()}-{time.time_ns()}"
+        try:
+            with open(source, 'rb') as src:
+                method = self._link(src, temp_path)
+                if method:
+                    with open(temp_path, 'rb') as stored:
+                        result = scan(stored)
+                else:
+                    # One read of the source fills both the copy and the scan
+                    method = 'copy'
+                    with open(temp_path, 'wb') as dst:
+                        result = scan(_TeeReader(src, dst, timer))
+                        os.fchmod(dst.fileno(), 0o444)
+            
+            path = self.path_for(result['hashes']['sha256'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, path)  # Also replaces an existing entry with the scanned bytes
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        return path, method, result
+    
+    def _link(self, src, target: Path) -> Optional[str]:
+        """Reflink or hardlink the open source file to target; None when it has to be copied"""
+        with open(target, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                os.fchmod(dst.fileno(), 0o444)
+                return 'reflink'
+            except OSError:
+                pass
+        
+        info = os.fstat(src.fileno())
+        if info.st_uid == 0 and not info.st_mode & 0o222:
+            try:
+                target.unlink()
+                os.link(src.name, target)
+                return 'hardlink'
+            except OSError:
+                pass  # Different filesystem
+        return None
+    
+    def remove(self, sha256: str) -> int:
+        """Delete a stored sample; returns the bytes freed"""
+        path = self.path_for(sha256)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return 0
+        for directory in (path.parent, path.parent.parent):
+            try:
+                directory.rmdir()
+            except OSError:
+                break  # Not empty
+        return size
+    
+    def files(self):
+        """sha256 and path of every stored sample"""
+        for path in self.root.glob('??/??/*'):
+            if len(path.name) == 64 and path.is_file():
+                yield path.name, path
 
 
 class MalwareSandbox:
@@ -26,10 +2368,527 @@ class MalwareSandbox:
         self.reports_dir = self.sandbox_dir / "reports"
         self.reports_dir.mkdir(exist_ok=True)
         
-        self.samples_dir = self.sandbox_dir / "samples"
-        self.samples_dir.mkdir(exist_ok=True)
+        self.samples_dir = self.sandbox_dir / "samples"
+        self.samples_dir.mkdir(exist_ok=True)
+        self.samples = SampleStore(self.samples_dir)
+        
+        # Captured output of dynamic analyses, one directory per analysis
+        self.jobs_dir = self.sandbox_dir / "jobs"
+        
+        self.rule_cache_dir = self.sandbox_dir / "rule-cache"
+        
+        self.db_path = self.sandbox_dir / "sandbox.db"
+        self._init_database()
+        
+        self.config = self._load_config()
+        self._rules = None
+        self._pool = None
+        self.verbose = True
+    
+    @property
+    def rules(self) -> RuleSet:
+        """Signature rules, compiled on first use (or taken from the rule cache)"""
+        if self._rules is None:
+            self.load_rules()
+        return self._rules
+    
+    def load_rules(self, rebuild: bool = False) -> RuleSet:
+        """Load the signature rules, recompiling them if rebuild is set"""
+        if self.config['yara_rules_enabled']:
+            self._rules = RuleSet.load(self.config['rule_dirs'], self.rule_cache_dir, rebuild)
+        else:
+            self._rules = RuleSet.parse([])
+        for error in self._rules.errors:
+            print(f"⚠️  Rule error: {error}", file=sys.stderr)
+        return self._rules
+    
+    def ruleset_version(self) -> str:
+        """Identifies the active rule set: the hash of its sources"""
+        if not self.config['yara_rules_enabled']:
+            return 'disabled'
+        if self._rules is not None and self._rules.cache_key:
+            return self._rules.cache_key
+        return RuleSet.cache_key_for(RuleSet.read_sources(self.config['rule_dirs']))
+    
+    def _init_database(self):
+        """Initialize the sandbox database"""
+        conn = sqlite3.connect(str(self.db_path))
+        cursor = conn.cursor()
+        
+        # Bulk scans record verdicts from several worker processes
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports'")
+        reports_indexed = cursor.fetchone() is not None
+        
+        # Report metadata, so listing never opens report bodies
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reports (
+                analysis_id TEXT PRIMARY KEY,
+                sha256 TEXT,
+                sample_name TEXT,
+                verdict TEXT NOT NULL,
+                threat_score INTEGER NOT NULL,
+                dynamic INTEGER NOT NULL DEFAULT 0,
+                timestamp TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_timestamp ON reports(timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_verdict ON reports(verdict, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_score ON reports(threat_score, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_sha256 ON reports(sha256)')
+        
+        # Similarity digests, and their LSH bands for nearest-neighbour lookups
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fuzzy_hashes (
+                analysis_id TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fuzzy_bands (
+                band INTEGER NOT NULL,
+                analysis_id TEXT NOT NULL,
+                PRIMARY KEY (band, analysis_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Stored samples and the number of reports referring to each
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS samples (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                stored TEXT NOT NULL
+            )
+        ''')
+        
+        # Verdict index: content hash -> latest report for that content
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS verdicts (
+                sha256 TEXT PRIMARY KEY,
+                analysis_id TEXT NOT NULL,
+                ruleset TEXT NOT NULL,
+                engine_version INTEGER NOT NULL,
+                verdict TEXT NOT NULL,
+                threat_score INTEGER NOT NULL,
+                dynamic INTEGER NOT NULL DEFAULT 0,
+                timestamp TEXT NOT NULL
+            )
+        ''')
+        
+        # Dynamic analysis queue, drained by DetonationScheduler
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detonations (
+                analysis_id TEXT PRIMARY KEY,
+                sample TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                timeout INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker_pid INTEGER,
+                submitted TEXT NOT NULL,
+                started TEXT,
+                finished TEXT,
+                error TEXT
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_detonations_queue ON detonations(status, priority, submitted)'
+        )
+        
+        conn.commit()
+        conn.close()
+        
+        # Reports written before the index existed
+        if not reports_indexed:
+            self.reindex_reports()
+    
+    def lookup_verdict(self, sha256: str) -> Optional[Dict]:
+        """Cached verdict for a sample, if it was analyzed with the current engine and rules"""
+        conn = sqlite3.connect(str(self.db_path))
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT analysis_id, ruleset, engine_version, verdict, threat_score, dynamic, timestamp '
+            'FROM verdicts WHERE sha256 = ?', (sha256,)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        
+        if row is None:
+            return None
+        analysis_id, ruleset, engine_version, verdict, threat_score, dynamic, timestamp = row
+        if engine_version != ENGINE_VERSION or ruleset != self.ruleset_version():
+            return None
+        if not (self.reports_dir / f"report_{analysis_id}.json").exists():
+            return None
+        
+        return {
+            'analysis_id': analysis_id,
+            'verdict': verdict,
+            'threat_score': threat_score,
+            'dynamic': bool(dynamic),
+            'timestamp': timestamp
+        }
+    
+    def store_sample(self, file_path: Path, timer: Optional[StageTimer] = None) -> Tuple[Path, Dict]:
+        """Put a sample in the content-addressed store, scanning it on the way in,
+        and count one more report referring to it; returns (stored path, scan)
+        """
+        path, _, scan = self.samples.put(file_path, lambda stream: self._scan_reader(stream, timer), timer)
+        sha256 = scan['hashes']['sha256']
+        
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO samples (sha256, size, refcount, stored) VALUES (?, ?, 1, ?) '
+            'ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1',
+            (sha256, scan['size'], datetime.now().isoformat())
+        )
+        conn.commit()
+        conn.close()
+        return path, scan
+    
+    def delete_report(self, analysis_id: str) -> bool:
+        """Delete a report and release its reference to the stored sample"""
+        report_file = self.reports_dir / f"report_{analysis_id}.json"
+        if not report_file.exists():
+            return False
+        with open(report_file, 'r') as f:
+            report = json.load(f)
+        sha256 = report['static_analysis']['hashes'].get('sha256')
+        
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        self._unindex_fuzzy(cursor, analysis_id)
+        cursor.execute('DELETE FROM reports WHERE analysis_id = ?', (analysis_id,))
+        cursor.execute('DELETE FROM verdicts WHERE analysis_id = ?', (analysis_id,))
+        cursor.execute('DELETE FROM detonations WHERE analysis_id = ?', (analysis_id,))
+        cursor.execute('UPDATE samples SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+        conn.commit()
+        conn.close()
+        
+        # Reports from before the sample store point at their own copy
+        sample_copy = Path(report.get('sample_copy') or
+                           self.samples_dir / f"{analysis_id}_{Path(report['sample']).name}")
+        if sample_copy.parent == self.samples_dir and sample_copy.exists():
+            sample_copy.unlink()
+        shutil.rmtree(self.jobs_dir / analysis_id, ignore_errors=True)
+        report_file.unlink()
+        return True
+    
+    def gc_samples(self, grace_seconds: int = 3600) -> Dict:
+        """Delete stored samples no report refers to
+        
+        Files missing from the samples table are only removed after
+        grace_seconds, so samples being stored right now are left alone.
+        """
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('SELECT sha256 FROM samples WHERE refcount <= 0')
+        unreferenced = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT sha256 FROM samples')
+        known = {row[0] for row in cursor.fetchall()}
+        
+        result = {'removed': 0, 'bytes_freed': 0}
+        for sha256 in unreferenced:
+            result['bytes_freed'] += self.samples.remove(sha256)
+            result['removed'] += 1
+            cursor.execute('DELETE FROM samples WHERE sha256 = ? AND refcount <= 0', (sha256,))
+        conn.commit()
+        conn.close()
+        
+        cutoff = time.time() - grace_seconds
+        for sha256, path in self.samples.files():
+            if sha256 not in known and path.stat().st_mtime < cutoff:
+                result['bytes_freed'] += self.samples.remove(sha256)
+                result['removed'] += 1
+        return result
+    
+    def save_report(self, report: Dict) -> Path:
+        """Write a report and index it by analysis ID and by the sample's sha256"""
+        report_file = self.reports_dir / f"report_{report['analysis_id']}.json"
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        self._index_report(cursor, report)
+        cursor.execute(
+            'INSERT OR REPLACE INTO verdicts '
+            '(sha256, analysis_id, ruleset, engine_version, verdict, threat_score, dynamic, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (report['static_analysis']['hashes']['sha256'], report['analysis_id'], report['ruleset'],
+             report['engine_version'], report['verdict'], report['threat_score'],
+             int(report['dynamic_analysis'] is not None), report['timestamp'])
+        )
+        conn.commit()
+        conn.close()
+        return report_file
+    
+    def _index_report(self, cursor, report: Dict):
+        cursor.execute(
+            'INSERT OR REPLACE INTO reports '
+            '(analysis_id, sha256, sample_name, verdict, threat_score, dynamic, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (report['analysis_id'], report.get('static_analysis', {}).get('hashes', {}).get('sha256'),
+             Path(report['sample']).name, report['verdict'], report['threat_score'],
+             int(report.get('dynamic_analysis') is not None), report['timestamp'])
+        )
+        
+        # Reports from before similarity digests have none
+        digest = report.get('static_analysis', {}).get('hashes', {}).get('fuzzy')
+        if digest:
+            self._unindex_fuzzy(cursor, report['analysis_id'])
+            cursor.execute('INSERT INTO fuzzy_hashes (analysis_id, digest) VALUES (?, ?)',
+                           (report['analysis_id'], digest))
+            cursor.executemany('INSERT OR IGNORE INTO fuzzy_bands (band, analysis_id) VALUES (?, ?)',
+                               [(band, report['analysis_id']) for band in _fuzzy_bands(digest)])
+    
+    def _unindex_fuzzy(self, cursor, analysis_id: str):
+        cursor.execute('SELECT digest FROM fuzzy_hashes WHERE analysis_id = ?', (analysis_id,))
+        row = cursor.fetchone()
+        if row:
+            cursor.executemany('DELETE FROM fuzzy_bands WHERE band = ? AND analysis_id = ?',
+                               [(band, analysis_id) for band in _fuzzy_bands(row[0])])
+            cursor.execute('DELETE FROM fuzzy_hashes WHERE analysis_id = ?', (analysis_id,))
+    
+    def reindex_reports(self) -> int:
+        """Rebuild the report index from the report files"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        indexed = 0
+        for report_file in self.reports_dir.glob("report_*.json"):
+            try:
+                with open(report_file, 'r') as f:
+                    self._index_report(cursor, json.load(f))
+                indexed += 1
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️  Skipping unreadable report {report_file.name}: {e}", file=sys.stderr)
+        conn.commit()
+        conn.close()
+        return indexed
+    
+    def query_reports(self, page: int = 1, page_size: int = 20, verdict: Optional[str] = None,
+                      min_score: Optional[int] = None, max_score: Optional[int] = None,
+                      sort: str = 'newest') -> Tuple[int, List[Dict]]:
+        """One page of report metadata from the index, and the number of matching reports"""
+        conditions = []
+        params = []
+        if verdict:
+            conditions.append('verdict = ?')
+            params.append(verdict)
+        if min_score is not None:
+            conditions.append('threat_score >= ?')
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append('threat_score <= ?')
+            params.append(max_score)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        order = {
+            'newest': 'timestamp DESC',
+            'oldest': 'timestamp ASC',
+            'score': 'threat_score DESC, timestamp DESC'
+        }[sort]
+        
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT COUNT(*) FROM reports{where}', params)
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            'SELECT analysis_id, sha256, sample_name, verdict, threat_score, dynamic, timestamp '
+            f'FROM reports{where} ORDER BY {order} LIMIT ? OFFSET ?',
+            params + [page_size, (page - 1) * page_size]
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        columns = ['analysis_id', 'sha256', 'sample_name', 'verdict', 'threat_score', 'dynamic', 'timestamp']
+        return total, [dict(zip(columns, row)) for row in rows]
+    
+    def similar_reports(self, analysis_id: str, top: int = 10) -> Optional[List[Dict]]:
+        """Nearest samples to a report's sample by similarity digest, closest first
+        
+        Only reports sharing an LSH band with the digest are compared, so the
+        cost grows with the number of close candidates, not the report store.
+        Each other sample appears once, with its latest report. None when the
+        report has no digest.
+        """
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT f.digest, r.sha256 FROM fuzzy_hashes f JOIN reports r USING (analysis_id) '
+            'WHERE analysis_id = ?', (analysis_id,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            return None
+        digest, sha256 = row
+        
+        bands = _fuzzy_bands(digest)
+        cursor.execute(
+            'SELECT r.analysis_id, r.sha256, r.sample_name, r.verdict, r.threat_score, r.timestamp, f.digest '
+            'FROM (SELECT DISTINCT analysis_id FROM fuzzy_bands '
+            f'WHERE band IN ({", ".join("?" * len(bands))})) c '
+            'JOIN fuzzy_hashes f USING (analysis_id) JOIN reports r USING (analysis_id)',
+            bands
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        nearest = {}
+        columns = ['analysis_id', 'sha256', 'sample_name', 'verdict', 'threat_score', 'timestamp']
+        for row in rows:
+            if row[1] == sha256:
+                continue
+            match = dict(zip(columns, row[:6]))
+            match['distance'] = fuzzy_distance(digest, row[6])
+            known = nearest.get(match['sha256'])
+            if known is None or match['timestamp'] > known['timestamp']:
+                nearest[match['sha256']] = match
+        return sorted(nearest.values(), key=lambda m: (m['distance'], m['timestamp']))[:top]
+    
+    def sandbox_pool(self, size: Optional[int] = None) -> 'SandboxPool':
+        """The warm environment pool, grown to at least size environments"""
+        size = size or self.detonation_slots()
+        if self._pool is None:
+            self._pool = SandboxPool(Path(self.config['pool_dir']), size, self.config)
+        elif self._pool.size < size:
+            self._pool.size = size
+        return self._pool
+    
+    def detonation_slots(self) -> int:
+        """Dynamic analyses the host can run at once under the per-sample CPU and memory limits"""
+        if self.config['max_detonations']:
+            return self.config['max_detonations']
+        cpu_slots = (os.cpu_count() or 1) * 100 // max(self.config['cpu_limit_percent'], 1)
+        memory_slots = _available_memory_mb() // max(self.config['memory_limit_mb'], 1)
+        return max(1, min(cpu_slots, memory_slots))
+    
+    def queue_detonation(self, analysis_id: str, priority: Optional[int] = None,
+                         timeout: Optional[int] = None) -> bool:
+        """Queue an analyzed sample for dynamic analysis; priority defaults to its static threat score"""
+        with open(self.reports_dir / f"report_{analysis_id}.json", 'r') as f:
+            report = json.load(f)
+        
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR IGNORE INTO detonations (analysis_id, sample, priority, timeout, submitted) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (analysis_id, report.get('sample_copy') or
+             str(self.samples_dir / f"{analysis_id}_{Path(report['sample']).name}"),
+             report['threat_score'] if priority is None else priority,
+             timeout or self.config['execution_timeout'], datetime.now().isoformat())
+        )
+        queued = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        return queued
+    
+    def claim_detonation(self) -> Optional[Dict]:
+        """Take the highest-priority queued job, oldest first among equals"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        cursor = conn.cursor()
+        # IMMEDIATE makes select-and-mark atomic between competing schedulers
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(
+            "SELECT analysis_id, sample, priority, timeout FROM detonations WHERE status = 'queued' "
+            "ORDER BY priority DESC, submitted LIMIT 1"
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            cursor.execute(
+                "UPDATE detonations SET status = 'running', worker_pid = ?, started = ? WHERE analysis_id = ?",
+                (os.getpid(), datetime.now().isoformat(), row[0])
+            )
+        cursor.execute('COMMIT')
+        conn.close()
+        
+        if row is None:
+            return None
+        return {'analysis_id': row[0], 'sample': row[1], 'priority': row[2], 'timeout': row[3]}
+    
+    def finish_detonation(self, job: Dict, analysis: Optional[Dict], error: Optional[str] = None) -> Dict:
+        """Store a detonation result in its report and rescore it"""
+        report_file = self.reports_dir / f"report_{job['analysis_id']}.json"
+        report = None
+        if analysis is not None:
+            with open(report_file, 'r') as f:
+                report = json.load(f)
+            report['dynamic_analysis'] = analysis
+            self._score_report(report)
+            self.save_report(report)
+        
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE detonations SET status = ?, finished = ?, error = ? WHERE analysis_id = ?',
+            ('failed' if error else 'done', datetime.now().isoformat(), error, job['analysis_id'])
+        )
+        conn.commit()
+        conn.close()
+        return report
+    
+    def recover_detonations(self) -> int:
+        """Requeue jobs left running by schedulers that no longer exist"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT worker_pid FROM detonations WHERE status = 'running'")
+        dead = [pid for (pid,) in cursor.fetchall() if pid is None or not _pid_alive(pid)]
+        recovered = 0
+        for pid in dead:
+            cursor.execute(
+                "UPDATE detonations SET status = 'queued', worker_pid = NULL, started = NULL "
+                "WHERE status = 'running' AND worker_pid IS ?", (pid,)
+            )
+            recovered += cursor.rowcount
+        conn.commit()
+        conn.close()
+        return recovered
+    
+    def detonation_queue_stats(self) -> Dict[str, int]:
+        """Number of jobs per queue status"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM detonations GROUP BY status')
+        stats = dict(cursor.fetchall())
+        conn.close()
+        return stats
+    
+    def _hash_file(self, file_path: Path) -> str:
+        """sha256 of a file, read in chunks"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(SCAN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def rule_stats(self, rebuild: bool = False) -> Dict:
+        """Rule set and rule cache statistics"""
+        started = time.time()
+        rules = self.load_rules(rebuild)
+        load_time = time.time() - started
         
-        self.config = self._load_config()
+        patterns = rules.patterns
+        return {
+            'rule_files': [source for source in rules.sources if source != '<builtin>'],
+            'rules': len(rules.rules),
+            'skipped_rules': len(rules.skipped),
+            'errors': len(rules.errors),
+            'patterns': len(patterns),
+            'literal_patterns': sum(1 for p in patterns if p.literal is not None),
+            'hex_patterns': sum(1 for p in patterns if p.literal is None and p.label.startswith('{')),
+            'regex_patterns': sum(1 for p in patterns if p.literal is None and p.label.startswith('/')),
+            'compile_time': rules.compile_time,
+            'load_time': load_time,
+            'cache_key': rules.cache_key,
+            'cache_hit': rules.cache_hit,
+            'cache': RuleSet.cache_stats(self.rule_cache_dir)
+        }
     
     def _load_config(self) -> dict:
         """Load sandbox configuration"""
@@ -41,18 +2900,119 @@ class MalwareSandbox:
             'memory_limit_mb': 2048,
             'cpu_limit_percent': 50,
             'auto_submit_threats': True,
-            'yara_rules_enabled': True
+            'yara_rules_enabled': True,
+            'max_detonations': 0,  # Concurrent dynamic analyses; 0 = derive from CPU and memory
+            # Warm isolation environments; must be private to this user (no
+            # shared location such as /dev/shm another user could plant in)
+            'pool_dir': str(self.sandbox_dir / 'pool'),
+            'container_image': 'alpine:latest',
+            'max_output_bytes': 16 * 1024 * 1024,  # Per output stream of a detonated sample
+            'syscall_trace': False,  # Run firejail samples under strace (needs --allow-debuggers)
+            'rule_dirs': DEFAULT_RULE_DIRS + [str(self.sandbox_dir / 'rules')]
+        }
+    
+    def _scan_stream(self, file_path: Path, timer: Optional[StageTimer] = None) -> Dict:
+        """Hash, histogram, extract strings and match indicators in one pass over the file"""
+        with open(file_path, 'rb') as f:
+            return self._scan_reader(f, timer)
+    
+    def _scan_reader(self, f, timer: Optional[StageTimer] = None) -> Dict:
+        """_scan_stream over an open binary stream (a file or an archive member)"""
+        timer = timer or _NO_TIMER
+        digests = [hashlib.md5(), hashlib.sha1(), hashlib.sha256()]
+        fuzzy = FuzzyHash()
+        entropy_profile = EntropyProfile()
+        size = 0
+        
+        strings = []
+        suspicious_strings = []
+        string_count = 0
+        
+        scanner = self.rules.matcher.scanner()
+        
+        def emit(raw: bytes):
+            nonlocal string_count
+            string_count += 1
+            text = raw.decode('ascii')
+            if len(strings) < 100:
+                strings.append(text)
+            if len(suspicious_strings) < 50 and _KEYWORD_MATCHER.search(raw):
+                suspicious_strings.append(text)
+        
+        partial = b''  # Printable run still open at the end of the previous chunk
+        head = b''
+        while True:
+            chunk = f.read(SCAN_CHUNK_SIZE)
+            timer.mark('read')
+            if not chunk:
+                break
+            if not size:
+                head = chunk[:65536]
+            size += len(chunk)
+            
+            for digest in digests:
+                digest.update(chunk)
+            timer.mark('hashing')
+            fuzzy.update(chunk)
+            timer.mark('fuzzy_hash')
+            entropy_profile.update(chunk)
+            timer.mark('entropy')
+            
+            # A printable run touching the end of the chunk may continue
+            # in the next one, so it is held back until the run ends
+            data = partial + chunk
+            partial = _printable_tail(data)
+            for match in _PRINTABLE_RUN.finditer(data, 0, len(data) - len(partial)):
+                emit(match.group())
+            timer.mark('strings')
+            
+            scanner.feed(chunk)
+            timer.mark('rule_matching')
+        
+        if partial and len(partial) >= MIN_STRING_LENGTH:
+            emit(partial)
+        timer.mark('strings')
+        
+        yara_matches = self.rules.evaluate(scanner.hits)
+        timer.mark('rule_matching')
+        
+        profile = entropy_profile.finish()
+        timer.mark('entropy')
+        fuzzy_digest = fuzzy.hexdigest()
+        timer.mark('fuzzy_hash')
+        return {
+            'size': size,
+            'hashes': {
+                'md5': digests[0].hexdigest(),
+                'sha1': digests[1].hexdigest(),
+                'sha256': digests[2].hexdigest(),
+                'fuzzy': fuzzy_digest
+            },
+            'entropy': profile.pop('entropy'),
+            'entropy_profile': profile,
+            'strings': strings,
+            'string_count': string_count,
+            'suspicious_strings': suspicious_strings,
+            'yara_matches': yara_matches,
+            'head': head
         }
     
-    def static_analysis(self, file_path: Path) -> Dict:
+    def static_analysis(self, file_path: Path, scan: Optional[Dict] = None, name: Optional[str] = None) -> Dict:
         """Perform static analysis on file"""
-        print(f"Performing static analysis on {file_path.name}...")
+        name = name or file_path.name
+        if self.verbose:
+            print(f"Performing static analysis on {name}...")
+        
+        # One streaming pass provides hashes, strings and entropy
+        if scan is None:
+            scan = self._scan_stream(file_path)
         
         analysis = {
             'file_info': {},
             'hashes': {},
             'strings': [],
             'pe_info': None,
+            'elf_info': None,
             'signatures': [],
             'entropy': 0.0
         }
@@ -60,91 +3020,70 @@ class MalwareSandbox:
         # File info
         stat_info = os.stat(file_path)
         analysis['file_info'] = {
-            'name': file_path.name,
+            'name': name,
             'size': stat_info.st_size,
             'created': datetime.fromtimestamp(stat_info.st_ctime).isoformat(),
             'modified': datetime.fromtimestamp(stat_info.st_mtime).isoformat()
         }
         
-        # Calculate hashes
-        with open(file_path, 'rb') as f:
-            content = f.read()
-            analysis['hashes'] = {
-                'md5': hashlib.md5(content).hexdigest(),
-                'sha1': hashlib.sha1(content).hexdigest(),
-                'sha256': hashlib.sha256(content).hexdigest()
-            }
-        
-        # Extract strings
-        try:
-            result = subprocess.run(
-                ['strings', str(file_path)],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            strings = [s for s in result.stdout.split('\n') if len(s) > 4]
-            analysis['strings'] = strings[:100]  # First 100 strings
-            
-            # Look for suspicious strings
-            suspicious_keywords = [
-                'password', 'admin', 'cmd.exe', 'powershell', 'http://',
-                'https://', 'eval', 'exec', 'system', 'shell', 'exploit',
-                'payload', 'backdoor', 'rootkit', 'keylog'
-            ]
-            
-            analysis['suspicious_strings'] = [
-                s for s in strings 
-                if any(kw in s.lower() for kw in suspicious_keywords)
-            ][:50]
-        except:
-            pass
+        analysis['hashes'] = scan['hashes']
+        analysis['strings'] = scan['strings']  # First 100 strings
+        analysis['string_count'] = scan['string_count']
+        analysis['suspicious_strings'] = scan['suspicious_strings']
         
-        # Calculate entropy (high entropy = possibly packed/encrypted)
-        try:
-            analysis['entropy'] = self._calculate_entropy(content)
-            if analysis['entropy'] > 7.0:
-                analysis['signatures'].append('High entropy - possibly packed or encrypted')
-        except:
-            pass
+        # High entropy = possibly packed/encrypted; the windowed profile also
+        # catches packed payloads inside an otherwise normal file
+        analysis['entropy'] = scan['entropy']
+        analysis['entropy_profile'] = scan['entropy_profile']
+        regions = scan['entropy_profile']['high_entropy_region_count']
+        if analysis['entropy'] > 7.0:
+            analysis['signatures'].append('High entropy - possibly packed or encrypted')
+        elif regions:
+            analysis['signatures'].append(f'{regions} high-entropy region(s) - possibly packed payload')
         
-        # File type detection
+        # File type detection and executable headers, without spawning file(1)
         try:
-            result = subprocess.run(
-                ['file', '-b', str(file_path)],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            analysis['file_type'] = result.stdout.strip()
-        except:
-            pass
+            analysis['file_type'], executable = inspect_executable(file_path)
+        except OSError:
+            executable = None
+        if executable is not None:
+            analysis['pe_info' if executable['format'] == 'PE' else 'elf_info'] = executable
+            self._executable_signatures(executable, analysis)
         
         return analysis
     
-    def _calculate_entropy(self, data: bytes) -> float:
-        """Calculate Shannon entropy of data"""
-        import math
+    def _executable_signatures(self, executable: Dict, analysis: Dict):
+        """Flag suspicious traits of parsed ELF/PE headers"""
+        signatures = analysis['signatures']
+        if 'error' in executable:
+            signatures.append(f"Malformed {executable['format']} headers")
+            return
         
-        if not data:
-            return 0.0
+        writable_code = [s['name'] for s in executable['sections'] if s['permissions'][1:] == 'wx']
+        if writable_code:
+            signatures.append(f"Writable and executable section(s): {', '.join(writable_code)}")
         
-        # Count byte frequencies
-        freq = {}
-        for byte in data:
-            freq[byte] = freq.get(byte, 0) + 1
+        packed = [s['name'] for s in executable['sections']
+                  if s['size'] >= 1024 and s['entropy'] >= HIGH_ENTROPY_THRESHOLD]
+        if packed:
+            signatures.append(f"High-entropy section(s): {', '.join(packed)}")
         
-        # Calculate entropy
-        entropy = 0.0
-        data_len = len(data)
-        for count in freq.values():
-            p = count / data_len
-            entropy -= p * math.log2(p)
+        if executable['overlay']:
+            signatures.append(f"Overlay of {executable['overlay']['size']} bytes after the image")
         
-        return entropy
+        imported = set(executable['imports'])
+        analysis['suspicious_imports'] = {}
+        for category, names in SUSPICIOUS_IMPORTS.items():
+            found = [name for name in names if name in imported]
+            if found:
+                analysis['suspicious_imports'][category] = found
+                signatures.append(f"Imports {category.replace('_', ' ')} APIs: {', '.join(found)}")
     
-    def dynamic_analysis(self, file_path: Path) -> Dict:
+    def dynamic_analysis(self, file_path: Path, timeout: Optional[int] = None,
+                         analysis_id: Optional[str] = None) -> Dict:
         """Perform dynamic analysis (execute in sandbox)"""
+        timeout = timeout or self.config['execution_timeout']
+        job_dir = self.jobs_dir / (analysis_id or f"adhoc-{time.time_ns()}")
         print(f"Performing dynamic analysis on {file_path.name}...")
         
         analysis = {
@@ -159,31 +3098,115 @@ class MalwareSandbox:
             'behavior': []
         }
         
-        # Create isolated sandbox environment
-        sandbox_id = hashlib.md5(f"{file_path.name}{time.time()}".encode()).hexdigest()[:16]
-        sandbox_vm = self.sandbox_dir / f"sandbox-{sandbox_id}"
-        sandbox_vm.mkdir(exist_ok=True)
+        # Take a prepared isolated environment from the warm pool; it is
+        # reset and handed back afterwards
+        pool = self.sandbox_pool()
+        try:
+            environment = pool.acquire(timeout)
+        except (OSError, TimeoutError) as e:
+            analysis['error'] = f"No sandbox environment: {e}"
+            print(f"❌ Dynamic analysis failed: {e}")
+            analysis['end_time'] = datetime.now().isoformat()
+            return analysis
+        analysis['environment'] = {'slot': environment.index, 'setup_ms': round(environment.setup_ms, 2)}
         
         try:
+            # Stored samples are read-only; the sample runs from an executable
+            # copy in the environment, which is wiped when it is reset
+            sample = environment.path / 'sample'
+            shutil.copyfile(file_path, sample)
+            os.chmod(sample, 0o700)
+            
             # Execute in sandbox based on isolation type
             if self.config['isolation_type'] == 'firejail':
-                analysis = self._execute_in_firejail(file_path, sandbox_vm)
+                analysis.update(self._execute_in_firejail(sample, environment.path, timeout, job_dir))
             elif self.config['isolation_type'] == 'container':
-                analysis = self._execute_in_container(file_path, sandbox_vm)
+                analysis.update(self._execute_in_container(sample, environment, timeout, job_dir))
             else:
-                analysis = self._execute_in_vm(file_path, sandbox_vm)
+                analysis.update(self._execute_in_vm(sample, environment.path))
             
             analysis['executed'] = True
-            
+        
         except Exception as e:
             analysis['error'] = str(e)
             print(f"❌ Dynamic analysis failed: {e}")
+        finally:
+            pool.release(environment)
         
         analysis['end_time'] = datetime.now().isoformat()
         
         return analysis
     
-    def _execute_in_firejail(self, file_path: Path, sandbox_dir: Path) -> Dict:
+    def _run_captured(self, command: List[str], timeout: int, job_dir: Path,
+                      trace: Optional[SyscallTrace] = None) -> Dict:
+        """Run a sandboxed command, streaming its output into job_dir instead of memory
+        
+        With a trace, '{trace_fd}' in the command is replaced by the write end
+        of a pipe whose contents are fed to the trace as they arrive.
+        """
+        job_dir.mkdir(parents=True, exist_ok=True)
+        limit = self.config['max_output_bytes']
+        captures = {
+            'stdout': OutputCapture(job_dir / 'stdout.log', limit),
+            'stderr': OutputCapture(job_dir / 'stderr.log', limit)
+        }
+        pass_fds = ()
+        if trace is not None:
+            trace_read, trace_write = os.pipe()
+            captures['trace'] = OutputCapture(job_dir / 'trace.log', limit, matcher=None)
+            command = [arg.replace('{trace_fd}', str(trace_write)) for arg in command]
+            pass_fds = (trace_write,)
+        
+        # Own session, so a timeout kills everything the sample started
+        try:
+            proc = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, start_new_session=True, pass_fds=pass_fds)
+        finally:
+            for fd in pass_fds:
+                os.close(fd)
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(proc.stdout, selectors.EVENT_READ, 'stdout')
+                selector.register(proc.stderr, selectors.EVENT_READ, 'stderr')
+                if trace is not None:
+                    selector.register(trace_read, selectors.EVENT_READ, 'trace')
+                while selector.get_map():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(command, timeout)
+                    for key, _ in selector.select(remaining):
+                        data = os.read(key.fd, OUTPUT_READ_SIZE)
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            continue
+                        captures[key.data].write(data)
+                        # A slow parser slows the tracer down rather than buffering the trace
+                        if key.data == 'trace':
+                            trace.feed(data)
+            proc.wait(max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+        finally:
+            proc.stdout.close()
+            proc.stderr.close()
+            if trace is not None:
+                os.close(trace_read)
+        
+        return {
+            'exit_code': None if timed_out else proc.returncode,
+            'timed_out': timed_out,
+            'behavior': captures['stderr'].behaviors(),
+            **{name: capture.close() for name, capture in captures.items()}
+        }
+    
+    def _execute_in_firejail(self, file_path: Path, sandbox_dir: Path, timeout: int, job_dir: Path) -> Dict:
         """Execute file in Firejail sandbox"""
         result = {
             'method': 'firejail',
@@ -204,33 +3227,62 @@ class MalwareSandbox:
             str(file_path)
         ]
         
-        try:
-            # Execute with timeout
-            proc = subprocess.run(
-                firejail_cmd,
-                capture_output=True,
-                text=True,
-                timeout=self.config['execution_timeout']
-            )
-            
-            result['exit_code'] = proc.returncode
-            result['stdout'] = proc.stdout
-            result['stderr'] = proc.stderr
-            
-            # Analyze behavior
-            if 'denied' in proc.stderr.lower():
-                result['behavior'].append('Attempted restricted operation')
-            
-            if proc.returncode != 0:
-                result['behavior'].append(f'Abnormal exit code: {proc.returncode}')
-            
-        except subprocess.TimeoutExpired:
+        # strace runs inside the sandbox and writes the trace to an inherited pipe
+        trace = None
+        if self.config['syscall_trace']:
+            trace = SyscallTrace()
+            firejail_cmd[-1:] = ['--allow-debuggers', '--keep-fd={trace_fd}', 'strace', *STRACE_OPTIONS,
+                                 '-o', '/dev/fd/{trace_fd}', str(file_path)]
+        
+        # Execute with timeout; output markers are checked as it streams
+        run = self._run_captured(firejail_cmd, timeout, job_dir, trace)
+        result['stdout'] = run['stdout']
+        result['stderr'] = run['stderr']
+        result['behavior'].extend(run['behavior'])
+        
+        if trace is not None:
+            events = trace.finish()
+            result['network_activity'] = events['network_activity']
+            result['file_operations'] = events['file_operations']
+            result['syscall_trace'] = {
+                'counters': events['counters'],
+                'processes': events['processes'],
+                'persistence': events['persistence'],
+                'log': run['trace']
+            }
+            result['behavior'].extend(self._trace_behaviors(events))
+        
+        if run['timed_out']:
             result['behavior'].append('Execution timeout - possible infinite loop')
+        else:
+            result['exit_code'] = run['exit_code']
+            if run['exit_code'] != 0:
+                result['behavior'].append(f"Abnormal exit code: {run['exit_code']}")
         
         return result
     
-    def _execute_in_container(self, file_path: Path, sandbox_dir: Path) -> Dict:
-        """Execute file in Docker container"""
+    def _trace_behaviors(self, events: Dict) -> List[str]:
+        """Behaviour notes from syscall trace counters"""
+        counters = events['counters']
+        behaviors = []
+        if counters['network_connections'] or counters['failed_connections']:
+            behaviors.append(f"Network connections: {counters['network_connections']} made, "
+                             f"{counters['failed_connections']} failed, {counters['unique_ips']} address(es)")
+        if counters['lateral_movement_indicators']:
+            behaviors.append('Connected to remote administration/file sharing ports')
+        if counters['process_spawns'] > 1:  # The first execve starts the sample itself
+            behaviors.append(f"Executed {counters['process_spawns'] - 1} other program(s)")
+        if counters['elevated_privileges']:
+            behaviors.append('Changed to elevated privileges')
+        if events['persistence']:
+            behaviors.append(f"Wrote to persistence location(s): {', '.join(events['persistence'][:3])}")
+        if counters['files_deleted']:
+            behaviors.append(f"Deleted {counters['files_deleted']} file(s)")
+        return behaviors
+    
+    def _execute_in_container(self, file_path: Path, environment: 'SandboxEnvironment', timeout: int,
+                              job_dir: Path) -> Dict:
+        """Execute file in a pooled Docker container"""
         result = {
             'method': 'docker',
             'network_activity': [],
@@ -238,34 +3290,30 @@ class MalwareSandbox:
             'behavior': []
         }
         
-        # Use minimal Alpine Linux container for isolation
-        docker_cmd = [
-            'docker', 'run',
-            '--rm',
-            '--network', 'none' if not self.config['network_enabled'] else 'bridge',
-            '--memory', f'{self.config["memory_limit_mb"]}m',
-            '--cpus', str(self.config['cpu_limit_percent'] / 100),
-            '--security-opt', 'no-new-privileges',
-            '--cap-drop', 'ALL',
-            '-v', f'{file_path}:/sample:ro',
-            'alpine:latest',
-            '/sample'
-        ]
+        # The pool's container is already running (created with the isolation
+        # options, see SandboxPool); copy the sample in and execute it there
+        container = environment.container
+        docker_cmd = ['docker', 'exec', container, '/sample']
         
         try:
-            proc = subprocess.run(
-                docker_cmd,
-                capture_output=True,
-                text=True,
-                timeout=self.config['execution_timeout']
-            )
-            
-            result['exit_code'] = proc.returncode
-            result['stdout'] = proc.stdout
-            result['stderr'] = proc.stderr
+            copy = subprocess.run(['docker', 'cp', str(file_path), f'{container}:/sample'],
+                                  capture_output=True, text=True, timeout=60)
+            if copy.returncode != 0:
+                result['error'] = f"Could not copy sample into container: {copy.stderr.strip()}"
+                return result
             
+            run = self._run_captured(docker_cmd, timeout, job_dir)
+            result['stdout'] = run['stdout']
+            result['stderr'] = run['stderr']
+            result['behavior'].extend(run['behavior'])
+            if run['timed_out']:
+                # Releasing the environment replaces the container, stopping the sample
+                result['behavior'].append('Execution timeout')
+            else:
+                result['exit_code'] = run['exit_code']
+        
         except subprocess.TimeoutExpired:
-            result['behavior'].append('Execution timeout')
+            result['error'] = 'Timed out copying the sample into the container'
         except FileNotFoundError:
             result['error'] = 'Docker not available'
         
@@ -289,37 +3337,22 @@ class MalwareSandbox:
         
         return result
     
-    def yara_scan(self, file_path: Path) -> List[Dict]:
+    def yara_scan(self, file_path: Path, scan: Optional[Dict] = None) -> List[Dict]:
         """Scan file with YARA rules"""
-        matches = []
-        
-        # Sample YARA rules (in production, load from file)
-        sample_rules = {
-            'suspicious_api': ['CreateRemoteThread', 'WriteProcessMemory', 'VirtualAllocEx'],
-            'network_indicators': ['URLDownloadToFile', 'InternetOpen', 'HttpSendRequest'],
-            'persistence': ['RegSetValue', 'CreateService', 'WinExec'],
-            'credential_theft': ['LsaEnumerateLogonSessions', 'SamConnect', 'mimikatz']
-        }
-        
-        try:
-            with open(file_path, 'rb') as f:
-                content = f.read().decode('utf-8', errors='ignore')
-            
-            for rule_name, indicators in sample_rules.items():
-                for indicator in indicators:
-                    if indicator in content:
-                        matches.append({
-                            'rule': rule_name,
-                            'indicator': indicator,
-                            'severity': 'high' if rule_name in ['credential_theft', 'persistence'] else 'medium'
-                        })
-        except:
-            pass
-        
-        return matches
+        # Matching happens during the streaming pass
+        if scan is None:
+            try:
+                scan = self._scan_stream(file_path)
+            except OSError:
+                return []
+        return scan['yara_matches']
     
-    def analyze(self, file_path: str) -> str:
-        """Complete malware analysis pipeline"""
+    def analyze(self, file_path: str, force: bool = False, dynamic: Optional[bool] = None) -> str:
+        """Complete malware analysis pipeline
+        
+        dynamic=None asks whether to execute the sample, or skips dynamic
+        analysis when there is no terminal to ask on.
+        """
         file_path = Path(file_path)
         
         if not file_path.exists():
@@ -330,46 +3363,230 @@ class MalwareSandbox:
         print(f"SecureOS Malware Sandbox - Analyzing: {file_path.name}")
         print("=" * 70)
         
+        report, cached = self.analyze_sample(file_path, force, dynamic)
+        if cached:
+            print(f"\n✅ Known sample, analyzed {report['timestamp']} (use --force to re-analyze)")
+        
+        self._print_summary(report, self.reports_dir / f"report_{report['analysis_id']}.json")
+        return report['analysis_id']
+    
+    def analyze_sample(self, file_path: Path, force: bool = False, dynamic: Optional[bool] = False,
+                       timer: Optional[StageTimer] = None) -> Tuple[Dict, bool]:
+        """Analyze one sample and save its report; returns (report, taken from the verdict cache)"""
+        timer = timer or _NO_TIMER
+        timer.restart()
+        
+        # Samples seen before with the same engine and rules keep their verdict
+        if not force:
+            cached = self.lookup_verdict(self._hash_file(file_path))
+            if cached and not (dynamic and not cached['dynamic']):
+                with open(self.reports_dir / f"report_{cached['analysis_id']}.json", 'r') as f:
+                    return json.load(f), True
+        
         # Generate analysis ID
-        analysis_id = hashlib.sha256(f"{file_path.name}{time.time()}".encode()).hexdigest()[:16]
+        analysis_id = hashlib.sha256(f"{file_path}{time.time()}{os.getpid()}".encode()).hexdigest()[:16]
+        
+        timer.mark('cache_lookup')
         
-        # Copy sample to sandbox
-        sample_copy = self.samples_dir / f"{analysis_id}_{file_path.name}"
-        subprocess.run(['cp', str(file_path), str(sample_copy)])
+        # One read of the sample fills the content-addressed store (identical
+        # samples share one file) and the full scan static analysis and YARA share
+        sample_copy, scan = self.store_sample(file_path, timer)
+        timer.mark('sample_store')
         
-        # Full analysis
         report = {
             'analysis_id': analysis_id,
             'timestamp': datetime.now().isoformat(),
             'sample': str(file_path),
-            'static_analysis': self.static_analysis(sample_copy),
-            'yara_matches': self.yara_scan(sample_copy),
+            'static_analysis': self.static_analysis(sample_copy, scan, file_path.name),
+            'yara_matches': self.yara_scan(sample_copy, scan),
             'dynamic_analysis': None,
             'threat_score': 0,
-            'verdict': 'unknown'
+            'verdict': 'unknown',
+            'engine_version': ENGINE_VERSION,
+            'ruleset': self.ruleset_version(),
+            'sample_copy': str(sample_copy)
         }
+        timer.mark('static_checks')
+        
+        # Archives: every member goes through the same static checks
+        report['archive'] = self.unpack_archive(sample_copy, file_path.name)
+        if report['archive'] and report['archive']['limit_exceeded']:
+            report['static_analysis']['signatures'].append(
+                f"Archive exceeds unpacking limits ({report['archive']['limit_exceeded']}) - possible decompression bomb"
+            )
+        timer.mark('archive')
         
         # Dynamic analysis (optional - can be dangerous)
-        perform_dynamic = input("\nPerform dynamic analysis? This will EXECUTE the sample. (yes/no): ")
-        if perform_dynamic.lower() == 'yes':
-            report['dynamic_analysis'] = self.dynamic_analysis(sample_copy)
+        if dynamic is None:
+            if sys.stdin.isatty():
+                perform_dynamic = input("\nPerform dynamic analysis? This will EXECUTE the sample. (yes/no): ")
+                dynamic = perform_dynamic.lower() == 'yes'
+            else:
+                print("Non-interactive session: skipping dynamic analysis")
+                dynamic = False
+        if dynamic:
+            report['dynamic_analysis'] = self.dynamic_analysis(sample_copy, analysis_id=analysis_id)
+            timer.mark('dynamic_analysis')
+        
+        self._score_report(report)
+        
+        self.save_report(report)
+        timer.mark('report_write')
+        
+        return report, False
+    
+    def unpack_archive(self, file_path: Path, name: Optional[str] = None) -> Optional[Dict]:
+        """Scan the members of an archive sample, recursively, without extracting them
+        
+        None when the sample is not an archive. Each member gets its own
+        verdict; unpacking stops at the first limit exceeded.
+        """
+        with open(file_path, 'rb') as f:
+            kind = _archive_kind(f.read(512))
+            if kind is None:
+                return None
+            f.seek(0)
+            
+            budget = ArchiveBudget()
+            limit = None
+            try:
+                self._unpack(f, kind, name or file_path.name, os.fstat(f.fileno()).st_size, 1, budget)
+            except ArchiveLimitExceeded as e:
+                limit = str(e)
+        
+        return {
+            'type': kind,
+            'members': budget.members,
+            'member_count': len(budget.members),
+            'bytes_unpacked': budget.bytes,
+            'limit_exceeded': limit,
+            'errors': budget.errors
+        }
+    
+    def _unpack(self, stream, kind: str, path: str, size: int, depth: int, budget: ArchiveBudget):
+        """Feed each member of one archive layer to _unpack_member"""
+        try:
+            if kind == 'zip':
+                archive = zipfile.ZipFile(stream)  # Needs a seekable stream
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > max(ARCHIVE_MAX_RATIO * info.compress_size, ARCHIVE_RATIO_GRACE):
+                        raise ArchiveLimitExceeded(f"{path}/{info.filename} expands more than {ARCHIVE_MAX_RATIO}x")
+                    try:
+                        with archive.open(info) as member:
+                            self._unpack_member(member, f"{path}/{info.filename}", info.compress_size, depth, budget)
+                    except ARCHIVE_ERRORS as e:
+                        budget.errors.append(f"{path}/{info.filename}: {e}")
+            
+            elif kind == 'tar':
+                with tarfile.open(fileobj=stream, mode='r|') as archive:
+                    for info in archive:
+                        if info.isfile():
+                            self._unpack_member(archive.extractfile(info), f"{path}/{info.name}", info.size,
+                                                depth, budget)
+            
+            else:
+                # One compressed stream: a tarball, or a single compressed file
+                decompress, suffixes = ARCHIVE_DECOMPRESSORS[kind]
+                reader = io.BufferedReader(
+                    _BoundedReader(decompress(stream), max(ARCHIVE_MAX_RATIO * size, ARCHIVE_RATIO_GRACE), path),
+                    SCAN_CHUNK_SIZE
+                )
+                if reader.peek(512)[257:262] == b'ustar':
+                    self._unpack(reader, 'tar', path, size, depth, budget)
+                else:
+                    name = path.rsplit('/', 1)[-1]
+                    name = next((name[:-len(s)] for s in suffixes if name.lower().endswith(s)), name + '.out')
+                    self._unpack_member(reader, f"{path}/{name}", size, depth, budget)
+        except ARCHIVE_ERRORS as e:
+            budget.errors.append(f"{path}: {e}")
+    
+    def _unpack_member(self, stream, path: str, compressed_size: int, depth: int, budget: ArchiveBudget):
+        """Scan one member, or unpack it when it is an archive itself"""
+        record = {'path': path}
+        budget.add_member(record)
+        reader = io.BufferedReader(
+            _BoundedReader(stream, max(ARCHIVE_MAX_RATIO * compressed_size, ARCHIVE_RATIO_GRACE), path, budget),
+            SCAN_CHUNK_SIZE
+        )
+        
+        kind = _archive_kind(reader.peek(512)[:512])
+        if kind is not None and depth < ARCHIVE_MAX_DEPTH:
+            record['archive'] = kind
+            if kind == 'zip':
+                with tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_BYTES, dir=self.sandbox_dir) as spool:
+                    shutil.copyfileobj(reader, spool, SCAN_CHUNK_SIZE)
+                    record['size'] = spool.tell()
+                    spool.seek(0)
+                    self._unpack(spool, kind, path, record['size'], depth + 1, budget)
+            else:
+                self._unpack(reader, kind, path, compressed_size, depth + 1, budget)
+            return
+        if kind is not None:
+            record['note'] = f"archive nested deeper than {ARCHIVE_MAX_DEPTH} levels, scanned as a blob"
         
+        scan = self._scan_reader(reader)
+        member = {
+            'static_analysis': {
+                'entropy': scan['entropy'],
+                'entropy_profile': scan['entropy_profile'],
+                'suspicious_strings': scan['suspicious_strings']
+            },
+            'yara_matches': scan['yara_matches'],
+            'dynamic_analysis': None
+        }
+        self._score_report(member)
+        record.update({
+            'size': scan['size'],
+            'sha256': scan['hashes']['sha256'],
+            'file_type': _describe_head(scan['head']),
+            'entropy': round(scan['entropy'], 3),
+            'rules': sorted({match['rule'] for match in scan['yara_matches']}),
+            'threat_score': member['threat_score'],
+            'verdict': member['verdict']
+        })
+    
+    def _score_report(self, report: Dict):
+        """Set the threat score and verdict of a report from its analysis results"""
         # Calculate threat score
         score = 0
         
         # Static analysis scoring
         if report['static_analysis']['entropy'] > 7.0:
             score += 20
+        elif report['static_analysis']['entropy_profile']['high_entropy_region_count']:
+            score += 15
         
         if len(report['static_analysis'].get('suspicious_strings', [])) > 10:
             score += 30
         
+        executable = report['static_analysis'].get('pe_info') or report['static_analysis'].get('elf_info')
+        if executable:
+            if 'error' in executable:
+                score += 10
+            elif any(s['permissions'][1:] == 'wx' for s in executable['sections']):
+                score += 10
+            score += min(10 * len(report['static_analysis'].get('suspicious_imports', {})), 30)
+        
         # YARA matches scoring
         for match in report['yara_matches']:
-            if match['severity'] == 'high':
+            if match['severity'] == 'critical':
+                score += 35
+            elif match['severity'] == 'high':
                 score += 25
             elif match['severity'] == 'medium':
                 score += 15
+            elif match['severity'] == 'low':
+                score += 5
+        
+        # An archive is as dangerous as its worst member
+        archive = report.get('archive')
+        if archive:
+            if archive['limit_exceeded']:
+                score += 40
+            score = max([score] + [member['threat_score'] for member in archive['members']
+                                   if 'threat_score' in member])
         
         # Dynamic analysis scoring
         if report['dynamic_analysis']:
@@ -385,13 +3602,100 @@ class MalwareSandbox:
             report['verdict'] = 'suspicious'
         else:
             report['verdict'] = 'likely_benign'
+    
+    def triage(self, file_path: Path, force: bool = False) -> Dict:
+        """Static analysis of one file for bulk scans, as a compact result record"""
+        try:
+            report, cached = self.analyze_sample(file_path, force, dynamic=False)
+        except OSError as e:
+            return {'file': str(file_path), 'error': str(e)}
         
-        # Save report
-        report_file = self.reports_dir / f"report_{analysis_id}.json"
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2)
+        return {
+            'file': str(file_path),
+            'size': report['static_analysis']['file_info']['size'],
+            'sha256': report['static_analysis']['hashes']['sha256'],
+            'analysis_id': report['analysis_id'],
+            'verdict': report['verdict'],
+            'threat_score': report['threat_score'],
+            'rules': sorted({match['rule'] for match in report['yara_matches']}),
+            'archive_members': report['archive']['member_count'] if report.get('archive') else None,
+            'cached': cached,
+            'dynamic': report['dynamic_analysis'] is not None
+        }
+    
+    @staticmethod
+    def _iter_files(directory: Path, recursive: bool):
+        """Regular files in directory (not following symlinks), in a stable order"""
+        if not recursive:
+            for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+                if entry.is_file(follow_symlinks=False):
+                    yield Path(entry.path)
+            return
+        
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = Path(root) / name
+                if not path.is_symlink() and path.is_file():
+                    yield path
+    
+    def scan_directory(self, directory: str, recursive: bool = False, jobs: int = 1,
+                       force: bool = False, output=None, queue_dynamic: bool = False) -> Dict:
+        """Static analysis of every file in a directory across a process pool
+        
+        One JSON line per file is written to output as results arrive;
+        returns a summary of the whole scan. With queue_dynamic, samples not
+        yet executed are queued for the DetonationScheduler.
+        """
+        output = output or sys.stdout
+        started = time.time()
+        summary = {'files': 0, 'bytes': 0, 'errors': 0, 'cached': 0, 'queued': 0, 'verdicts': {}}
         
-        # Display summary
+        def record(result: Dict):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            summary['files'] += 1
+            if 'error' in result:
+                summary['errors'] += 1
+                return
+            summary['bytes'] += result['size']
+            summary['cached'] += result['cached']
+            summary['verdicts'][result['verdict']] = summary['verdicts'].get(result['verdict'], 0) + 1
+            if queue_dynamic and not result['dynamic']:
+                summary['queued'] += self.queue_detonation(result['analysis_id'])
+        
+        files = self._iter_files(Path(directory), recursive)
+        if jobs <= 1:
+            self.verbose = False
+            for path in files:
+                record(self.triage(path, force))
+        else:
+            # Compile the rules once here so every worker loads them from the rule cache
+            self.load_rules()
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_scan_worker,
+                                     initargs=(str(self.sandbox_dir),)) as pool:
+                # Bounded submission: memory stays flat however many files there are
+                pending = set()
+                for path in files:
+                    pending.add(pool.submit(_scan_worker, str(path), force))
+                    if len(pending) >= jobs * 4:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record(future.result())
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+        
+        elapsed = time.time() - started
+        summary['elapsed'] = round(elapsed, 3)
+        summary['files_per_second'] = round(summary['files'] / elapsed, 1) if elapsed else 0.0
+        summary['mb_per_second'] = round(summary['bytes'] / (1 << 20) / elapsed, 2) if elapsed else 0.0
+        return summary
+    
+    def _print_summary(self, report: Dict, report_file: Path):
+        """Display the summary of a report"""
+        analysis_id = report['analysis_id']
         print("\n" + "=" * 70)
         print("ANALYSIS SUMMARY")
         print("=" * 70)
@@ -400,54 +3704,602 @@ class MalwareSandbox:
         print(f"Verdict: {report['verdict'].upper()}")
         print(f"\nFile Hashes:")
         for hash_type, hash_value in report['static_analysis']['hashes'].items():
-            print(f"  {hash_type.upper()}: {hash_value}")
+            if hash_value:
+                print(f"  {hash_type.upper()}: {hash_value}")
         
         if report['yara_matches']:
             print(f"\nYARA Matches: {len(report['yara_matches'])}")
             for match in report['yara_matches'][:5]:
                 print(f"  - {match['rule']}: {match['indicator']}")
         
+        archive = report.get('archive')
+        if archive:
+            print(f"\nArchive ({archive['type']}): {archive['member_count']} members, "
+                  f"{archive['bytes_unpacked'] / (1 << 20):.1f} MB unpacked")
+            if archive['limit_exceeded']:
+                print(f"  ⚠️  Unpacking stopped: {archive['limit_exceeded']}")
+            flagged = [m for m in archive['members'] if m.get('verdict') not in (None, 'likely_benign')]
+            for member in flagged[:5]:
+                print(f"  - [{member['verdict'].upper()}] {member['path']} ({member['threat_score']}/100)")
+        
         print(f"\nFull report: {report_file}")
         print("=" * 70)
-        
-        return analysis_id
     
-    def list_reports(self):
-        """List all analysis reports"""
-        reports = list(self.reports_dir.glob("report_*.json"))
+    def list_reports(self, page: int = 1, page_size: int = 20, verdict: Optional[str] = None,
+                     min_score: Optional[int] = None, max_score: Optional[int] = None, sort: str = 'newest'):
+        """List analysis reports, one page at a time"""
+        total, reports = self.query_reports(page, page_size, verdict, min_score, max_score, sort)
         
-        if not reports:
+        if not total:
             print("No analysis reports found.")
             return
         
-        print(f"\nFound {len(reports)} analysis reports:\n")
+        pages = (total + page_size - 1) // page_size
+        print(f"\nFound {total} analysis reports (page {page} of {pages}):\n")
         
-        for report_file in sorted(reports, reverse=True)[:20]:
-            with open(report_file, 'r') as f:
-                report = json.load(f)
-            
+        for report in reports:
             print(f"[{report['verdict'].upper()}] {report['analysis_id']}")
-            print(f"  Sample: {Path(report['sample']).name}")
+            print(f"  Sample: {report['sample_name']}")
             print(f"  Timestamp: {report['timestamp']}")
             print(f"  Threat Score: {report['threat_score']}/100\n")
 
 
+class SandboxEnvironment:
+    """One isolation environment of a SandboxPool"""
+    
+    def __init__(self, index: int, path: Path, container: str, lock_file):
+        self.index = index
+        self.path = path  # Private directory (firejail home, scratch space)
+        self.container = container  # Container name (container isolation)
+        self.lock_file = lock_file
+        self.setup_ms = 0.0
+
+
+class SandboxPool:
+    """Pre-provisioned isolation environments reused across detonations
+    
+    Environments are numbered slots under the pool directory. A job takes a
+    free slot under an exclusive file lock, so several scheduler processes
+    can share one pool, and the slot is reset before it is released. With
+    container isolation each slot keeps a paused container ready to go.
+    """
+    
+    def __init__(self, root: Path, size: int, config: Dict):
+        self.root = root
+        self.size = size
+        self.config = config
+        self.containers = config['isolation_type'] == 'container'
+    
+    def _slot_path(self, index: int) -> Path:
+        return self.root / f"env-{index}"
+    
+    def _container_name(self, index: int) -> str:
+        return f"secureos-pool-{index}"
+    
+    def provision(self) -> int:
+        """Prepare every free slot ahead of use; returns the number prepared"""
+        prepared = 0
+        for index in range(self.size):
+            environment = self._try_lock(index)
+            if environment is None:
+                continue
+            try:
+                self._prepare(environment)
+                if self.containers:
+                    self._docker('pause', environment.container)
+                prepared += 1
+            finally:
+                self._unlock(environment)
+        return prepared
+    
+    def acquire(self, timeout: Optional[float] = None) -> SandboxEnvironment:
+        """Take a free environment, waiting up to timeout seconds for one"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            for index in range(self.size):
+                environment = self._try_lock(index)
+                if environment is None:
+                    continue
+                started = time.time()
+                try:
+                    self._prepare(environment)
+                    if self.containers:
+                        self._docker('unpause', environment.container)
+                except Exception:
+                    self._unlock(environment)
+                    raise
+                environment.setup_ms = (time.time() - started) * 1000
+                return environment
+            
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError(f"all {self.size} sandbox environments busy")
+            time.sleep(0.05)
+    
+    def release(self, environment: SandboxEnvironment):
+        """Reset an environment and return it to the pool"""
+        try:
+            self._reset(environment)
+        finally:
+            self._unlock(environment)
+    
+    def drain(self) -> int:
+        """Remove every idle environment (and its container); returns the number removed"""
+        removed = 0
+        for index in range(max(self.size, self._existing_slots())):
+            environment = self._try_lock(index)
+            if environment is None:
+                continue
+            if self.containers:
+                subprocess.run(['docker', 'rm', '-f', environment.container], capture_output=True)
+            shutil.rmtree(environment.path, ignore_errors=True)
+            self._unlock(environment)
+            removed += 1
+        return removed
+    
+    def status(self) -> List[Dict]:
+        """State of each slot: ready, busy or not provisioned"""
+        slots = []
+        for index in range(max(self.size, self._existing_slots())):
+            environment = self._try_lock(index)
+            if environment is None:
+                state = 'busy'
+            else:
+                state = 'ready' if environment.path.exists() else 'empty'
+                self._unlock(environment)
+            slots.append({'slot': index, 'state': state, 'path': str(self._slot_path(index))})
+        return slots
+    
+    def _existing_slots(self) -> int:
+        if not self.root.exists():
+            return 0
+        indices = [int(p.name[4:]) for p in self.root.glob('env-*') if p.name[4:].isdigit()]
+        return max(indices) + 1 if indices else 0
+    
+    def _check_private(self, path: Path):
+        """Refuse a directory another user could have planted or swapped for a symlink"""
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode):
+            raise OSError(f"{path} is not a directory")
+        if info.st_uid != os.geteuid() or info.st_mode & 0o022:
+            raise OSError(f"{path} is not private to this user")
+    
+    def _try_lock(self, index: int) -> Optional[SandboxEnvironment]:
+        self.root.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self._check_private(self.root)
+        fd = os.open(self.root / f"env-{index}.lock",
+                     os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW | os.O_CLOEXEC, 0o600)
+        lock_file = os.fdopen(fd, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return SandboxEnvironment(index, self._slot_path(index), self._container_name(index), lock_file)
+    
+    def _unlock(self, environment: SandboxEnvironment):
+        fcntl.flock(environment.lock_file, fcntl.LOCK_UN)
+        environment.lock_file.close()
+    
+    def _prepare(self, environment: SandboxEnvironment):
+        """Make sure the slot exists; cheap when it is already provisioned"""
+        environment.path.mkdir(mode=0o700, exist_ok=True)
+        self._check_private(environment.path)
+        if self.containers and not self._container_exists(environment.container):
+            self._create_container(environment.container)
+    
+    def _reset(self, environment: SandboxEnvironment):
+        """Wipe everything the sample left behind"""
+        self._check_private(environment.path)
+        for child in environment.path.iterdir():
+            if child.is_dir() and not child.is_symlink():
+                shutil.rmtree(child, ignore_errors=True)
+            else:
+                child.unlink()
+        if self.containers:
+            # A container's filesystem cannot be rolled back: replace it with a
+            # fresh one and park it paused for the next job
+            subprocess.run(['docker', 'rm', '-f', environment.container], capture_output=True)
+            self._create_container(environment.container)
+            self._docker('pause', environment.container)
+    
+    def _container_exists(self, name: str) -> bool:
+        result = subprocess.run(['docker', 'inspect', '--format', '{{.State.Status}}', name],
+                                capture_output=True, text=True)
+        return result.returncode == 0
+    
+    def _create_container(self, name: str):
+        # Minimal Alpine Linux container, idling until a sample is copied in
+        config = self.config
+        self._docker(
+            'run', '--detach',
+            '--name', name,
+            '--network', 'none' if not config['network_enabled'] else 'bridge',
+            '--memory', f'{config["memory_limit_mb"]}m',
+            '--cpus', str(config['cpu_limit_percent'] / 100),
+            '--security-opt', 'no-new-privileges',
+            '--cap-drop', 'ALL',
+            config['container_image'],
+            'sleep', 'infinity'
+        )
+    
+    def _docker(self, *args: str):
+        result = subprocess.run(['docker', *args], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise OSError(f"docker {args[0]} failed: {result.stderr.strip()}")
+
+
+class DetonationScheduler:
+    """Runs queued dynamic analyses concurrently, highest static threat score first
+    
+    Each running job holds one slot; a job is claimed from the queue only
+    when a slot frees up, so samples queued meanwhile still run in priority
+    order. Results are written into the reports as each job finishes.
+    """
+    
+    def __init__(self, sandbox: MalwareSandbox, slots: Optional[int] = None, on_result=None):
+        self.sandbox = sandbox
+        self.slots = slots or sandbox.detonation_slots()
+        self.on_result = on_result  # Called with (job, report or None, error or None)
+    
+    def run(self) -> Dict:
+        """Drain the queue; returns counts of completed and failed jobs"""
+        summary = {'slots': self.slots, 'recovered': self.sandbox.recover_detonations(),
+                   'completed': 0, 'failed': 0}
+        started = time.time()
+        
+        # One warm environment per slot, prepared before the first job
+        if self.sandbox.detonation_queue_stats().get('queued'):
+            self.sandbox.sandbox_pool(self.slots).provision()
+        
+        with ThreadPoolExecutor(max_workers=self.slots) as pool:
+            running = set()
+            while True:
+                while len(running) < self.slots:
+                    job = self.sandbox.claim_detonation()
+                    if job is None:
+                        break
+                    running.add(pool.submit(self._run_job, job))
+                if not running:
+                    break
+                
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, report, error = future.result()
+                    summary['failed' if error else 'completed'] += 1
+                    if self.on_result:
+                        self.on_result(job, report, error)
+        
+        summary['elapsed'] = round(time.time() - started, 3)
+        return summary
+    
+    def _run_job(self, job: Dict):
+        try:
+            if not Path(job['sample']).exists():
+                raise FileNotFoundError(f"sample missing: {job['sample']}")
+            analysis = self.sandbox.dynamic_analysis(Path(job['sample']), job['timeout'], job['analysis_id'])
+            return job, self.sandbox.finish_detonation(job, analysis), None
+        except Exception as e:
+            self.sandbox.finish_detonation(job, None, str(e))
+            return job, None, str(e)
+
+
+def _available_memory_mb() -> int:
+    """Memory available for new processes"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1 << 20)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Benchmark corpus: every sample size combined with every kind of content.
+# The kinds span the entropy range (zeros, text, random, text with a random
+# payload) plus text seeded with strings the built-in rules and the
+# suspicious-keyword list match
+BENCHMARK_SIZES = [4 << 10, 64 << 10, 1 << 20, 8 << 20]
+BENCHMARK_KINDS = ['zeros', 'text', 'random', 'mixed', 'seeded']
+BENCHMARK_INDICATORS = [b'CreateRemoteThread', b'URLDownloadToFile', b'RegSetValueExA', b'mimikatz',
+                        b'powershell -nop -enc', b'http://update.example.invalid/payload.bin']
+
+
+def _synthetic_corpus(directory: Path, files: int, seed: int = 42) -> List[Dict]:
+    """Write the benchmark samples to directory; returns name, kind and size of each"""
+    rng = random.Random(seed)
+    words = ['kernel', 'module', 'config', 'update', 'service', 'network', 'buffer', 'thread',
+             'library', 'version', 'request', 'handler', 'session', 'system', 'process', 'memory',
+             'the', 'of', 'and', 'to', 'in', 'is', 'for', 'with', 'on', 'at', 'by', 'from']
+    text = ' '.join(rng.choice(words) for _ in range(32768)).encode()
+    
+    def text_bytes(size: int) -> bytes:
+        offset = rng.randrange(len(text))
+        return (text * (size // len(text) + 2))[offset:offset + size]
+    
+    def random_bytes(size: int) -> bytes:
+        return rng.getrandbits(8 * size).to_bytes(size, 'little')
+    
+    corpus = []
+    for n in range(files):
+        size = BENCHMARK_SIZES[n % len(BENCHMARK_SIZES)]
+        kind = BENCHMARK_KINDS[n // len(BENCHMARK_SIZES) % len(BENCHMARK_KINDS)]
+        if kind == 'zeros':
+            data = bytes(size)
+        elif kind == 'random':
+            data = random_bytes(size)
+        elif kind == 'mixed':
+            data = bytearray(text_bytes(size))
+            data[size // 2:size // 2 + size // 4] = random_bytes(size // 4)
+        else:
+            data = bytearray(text_bytes(size))
+            if kind == 'seeded':
+                for indicator in BENCHMARK_INDICATORS:
+                    offset = rng.randrange(size - len(indicator))
+                    data[offset:offset + len(indicator)] = indicator
+        
+        name = f"sample-{n:05d}-{kind}-{size >> 10}k.bin"
+        (directory / name).write_bytes(data)
+        corpus.append({'name': name, 'kind': kind, 'size': size})
+    return corpus
+
+
+def run_benchmark(files: int = 100, max_workers: int = 0, baseline: Optional[Dict] = None,
+                  seed: int = 42) -> Dict:
+    """Benchmark the static analysis pipeline on a synthetic corpus in a temporary directory"""
+    max_workers = max(max_workers or os.cpu_count() or 1, 1)
+    worker_counts = sorted({1 << i for i in range(max_workers.bit_length()) if 1 << i <= max_workers}
+                           | {max_workers})
+    
+    results = {
+        'benchmark': 'secureos-sandbox',
+        'timestamp': datetime.now().isoformat(),
+        'parameters': {
+            'files': files,
+            'max_workers': max_workers,
+            'worker_counts': worker_counts,
+            'sizes': BENCHMARK_SIZES,
+            'kinds': BENCHMARK_KINDS,
+            'chunk_size': SCAN_CHUNK_SIZE,
+            'numpy': np is not None,
+            'seed': seed
+        }
+    }
+    
+    with tempfile.TemporaryDirectory(prefix='secureos-bench-') as tmp_dir:
+        corpus_dir = Path(tmp_dir) / 'corpus'
+        corpus_dir.mkdir()
+        started = time.perf_counter()
+        corpus = _synthetic_corpus(corpus_dir, files, seed)
+        total_bytes = sum(sample['size'] for sample in corpus)
+        results['corpus'] = {
+            'files': len(corpus),
+            'bytes': total_bytes,
+            'generate_seconds': time.perf_counter() - started
+        }
+        
+        # Per-stage time of one in-process analysis of every sample; the
+        # stage split comes from the StageTimer marks in the pipeline itself
+        sandbox = MalwareSandbox(str(Path(tmp_dir) / 'stages'))
+        sandbox.verbose = False
+        sandbox.load_rules()
+        timer = StageTimer()
+        kinds = {kind: {'files': 0, 'bytes': 0, 'seconds': 0.0} for kind in BENCHMARK_KINDS}
+        for sample in corpus:
+            before = sum(timer.seconds.values())
+            sandbox.analyze_sample(corpus_dir / sample['name'], force=True, dynamic=False, timer=timer)
+            kind = kinds[sample['kind']]
+            kind['files'] += 1
+            kind['bytes'] += sample['size']
+            kind['seconds'] += sum(timer.seconds.values()) - before
+        
+        pipeline_seconds = sum(timer.seconds.values())
+        results['stages'] = {
+            stage: {
+                'seconds': seconds,
+                'share_pct': seconds / pipeline_seconds * 100 if pipeline_seconds else 0.0,
+                'mb_per_sec': total_bytes / (1 << 20) / seconds if seconds else 0.0
+            }
+            for stage, seconds in sorted(timer.seconds.items(), key=lambda item: -item[1])
+        }
+        results['pipeline'] = {
+            'seconds': pipeline_seconds,
+            'files_per_sec': len(corpus) / pipeline_seconds if pipeline_seconds else 0.0,
+            'mb_per_sec': total_bytes / (1 << 20) / pipeline_seconds if pipeline_seconds else 0.0
+        }
+        results['by_kind'] = {
+            name: {**kind, 'mb_per_sec': kind['bytes'] / (1 << 20) / kind['seconds'] if kind['seconds'] else 0.0}
+            for name, kind in kinds.items() if kind['files']
+        }
+        
+        # Throughput of a directory scan with 1..max_workers processes, each
+        # run into a fresh sandbox so no run benefits from another's store
+        scaling = {}
+        with open(os.devnull, 'w') as devnull:
+            for workers in worker_counts:
+                sandbox = MalwareSandbox(str(Path(tmp_dir) / f'workers-{workers}'))
+                summary = sandbox.scan_directory(str(corpus_dir), jobs=workers, force=True, output=devnull)
+                scaling[f'workers_{workers}'] = {
+                    'workers': workers,
+                    'seconds': summary['elapsed'],
+                    'files_per_sec': len(corpus) / summary['elapsed'] if summary['elapsed'] else 0.0,
+                    'mb_per_sec': total_bytes / (1 << 20) / summary['elapsed'] if summary['elapsed'] else 0.0,
+                    'errors': summary['errors']
+                }
+        single = scaling['workers_1']['seconds']
+        for run in scaling.values():
+            run['speedup'] = single / run['seconds'] if run['seconds'] else 0.0
+        results['scaling'] = scaling
+    
+    # ru_maxrss is reported in KB on Linux; the children are the scan workers
+    results['memory'] = {
+        'current_rss_kb': _resident_kb(),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_worker_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    }
+    
+    if baseline:
+        results['baseline_comparison'] = _compare_metrics(results, baseline)
+    
+    return results
+
+
+def _resident_kb() -> int:
+    """Resident memory of this process in KB, from /proc/self/statm (0 where there is none)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _benchmark_figures(results: Dict, path: str = '') -> Dict[str, float]:
+    """Numeric figures of benchmark results by dotted path, e.g. 'stages.hashing.seconds'"""
+    figures = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            figures.update(_benchmark_figures(value, f"{path}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            figures[path + key] = value
+    return figures
+
+
+def _compare_metrics(current: Dict, baseline: Dict) -> Dict:
+    """Change of each stage, throughput and memory figure against an earlier run
+    
+    Figures only one of the runs has are skipped. Parameters that differ
+    (corpus size, chunk size, numpy) are listed, since they make the
+    figures not directly comparable.
+    """
+    previous = _benchmark_figures(baseline)
+    figures = {}
+    for name, value in _benchmark_figures(current).items():
+        if name.startswith('parameters.') or name not in previous:
+            continue
+        before = previous[name]
+        figures[name] = {
+            'baseline': before,
+            'current': value,
+            'change_pct': (value - before) / before * 100 if before else None
+        }
+    
+    baseline_parameters = baseline.get('parameters', {})
+    return {
+        'parameters_differ': sorted(name for name, value in current['parameters'].items()
+                                    if name in baseline_parameters and baseline_parameters[name] != value),
+        'figures': figures
+    }
+
+
+# Per-process sandbox of the bulk scan workers
+_worker_sandbox = None
+
+
+def _init_scan_worker(sandbox_dir: str):
+    global _worker_sandbox
+    _worker_sandbox = MalwareSandbox(sandbox_dir)
+    _worker_sandbox.verbose = False
+
+
+def _scan_worker(path: str, force: bool) -> Dict:
+    return _worker_sandbox.triage(Path(path), force)
+
+
 def main():
     parser = argparse.ArgumentParser(description='SecureOS Malware Sandbox')
-    parser.add_argument('command', choices=['analyze', 'report', 'list', 'clean'])
+    parser.add_argument('command', choices=['analyze', 'report', 'list', 'clean', 'rules', 'detonate', 'pool',
+                                            'delete', 'gc', 'similar', 'benchmark'])
+    parser.add_argument('action', nargs='?',
+                        help='rules: compile|stats (default stats); pool: status|provision|drain (default status)')
     parser.add_argument('--file', type=str, help='File to analyze')
     parser.add_argument('--id', type=str, help='Analysis ID for report')
+    parser.add_argument('--force', action='store_true', help='Re-analyze samples with a cached verdict')
+    parser.add_argument('--dir', type=str, help='Directory to scan (static analysis, NDJSON output)')
+    parser.add_argument('--recursive', action='store_true', help='Scan subdirectories of --dir')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes for --dir')
+    parser.add_argument('--static-only', action='store_true', help='Never execute the sample')
+    parser.add_argument('--queue-dynamic', action='store_true',
+                        help='Queue the samples of --dir for dynamic analysis (run by detonate)')
+    parser.add_argument('--slots', type=int, help='Concurrent detonations (detonate command)')
+    parser.add_argument('--page', type=int, default=1, help='Page of the report list')
+    parser.add_argument('--page-size', type=int, default=20, help='Reports per page')
+    parser.add_argument('--verdict', choices=['malicious', 'suspicious', 'likely_benign'],
+                        help='Only list reports with this verdict')
+    parser.add_argument('--min-score', type=int, help='Only list reports scoring at least this')
+    parser.add_argument('--max-score', type=int, help='Only list reports scoring at most this')
+    parser.add_argument('--sort', choices=['newest', 'oldest', 'score'], default='newest',
+                        help='Report list order')
+    parser.add_argument('--top', type=int, default=10, help='Number of similar samples to show')
+    parser.add_argument('--files', type=int, default=100, help='Synthetic samples in the benchmark corpus')
+    parser.add_argument('--output', type=str, help='Write benchmark results to this JSON file')
+    parser.add_argument('--baseline', type=str, help='Previous benchmark JSON to compare against')
     
     args = parser.parse_args()
     
+    actions = {'rules': ['stats', 'compile'], 'pool': ['status', 'provision', 'drain']}
+    if args.command in actions:
+        args.action = args.action or actions[args.command][0]
+        if args.action not in actions[args.command]:
+            parser.error(f"{args.command} action must be one of: {', '.join(actions[args.command])}")
+    elif args.action:
+        parser.error(f"unexpected argument: {args.action}")
+    
+    # The benchmark analyzes its own corpus in a temporary sandbox directory
+    if args.command == 'benchmark':
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        
+        results = run_benchmark(files=args.files, max_workers=args.jobs, baseline=baseline)
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+            print(f"✅ Benchmark results written to {args.output}")
+        else:
+            print(output)
+        return
+    
     sandbox = MalwareSandbox()
     
     if args.command == 'analyze':
+        if args.dir:
+            if not Path(args.dir).is_dir():
+                print(f"❌ Not a directory: {args.dir}", file=sys.stderr)
+                sys.exit(1)
+            if args.queue_dynamic and args.static_only:
+                print("❌ --queue-dynamic and --static-only exclude each other", file=sys.stderr)
+                sys.exit(1)
+            summary = sandbox.scan_directory(args.dir, args.recursive, args.jobs, args.force,
+                                             queue_dynamic=args.queue_dynamic)
+            
+            # stdout carries only the NDJSON records
+            verdicts = ', '.join(f"{v}: {n}" for v, n in sorted(summary['verdicts'].items()))
+            print(f"✅ Scanned {summary['files']} files ({summary['bytes'] / (1 << 20):.1f} MB) in "
+                  f"{summary['elapsed']:.1f}s - {summary['files_per_second']} files/s, "
+                  f"{summary['mb_per_second']} MB/s", file=sys.stderr)
+            print(f"   Verdicts: {verdicts or 'none'}", file=sys.stderr)
+            print(f"   Cached: {summary['cached']}, Errors: {summary['errors']}", file=sys.stderr)
+            if summary['queued']:
+                print(f"   Queued for dynamic analysis: {summary['queued']} (run 'detonate')", file=sys.stderr)
+            sys.exit(1 if summary['errors'] else 0)
+        
         if not args.file:
-            print("Error: --file required")
+            print("Error: --file or --dir required")
             sys.exit(1)
         
-        sandbox.analyze(args.file)
+        sandbox.analyze(args.file, force=args.force, dynamic=False if args.static_only else None)
     
     elif args.command == 'report':
         if not args.id:
@@ -461,13 +4313,95 @@ def main():
         else:
             print(f"Report not found: {args.id}")
     
+    elif args.command == 'delete':
+        if not args.id:
+            print("Error: --id required")
+            sys.exit(1)
+        
+        if sandbox.delete_report(args.id):
+            print(f"✅ Deleted report {args.id}")
+        else:
+            print(f"Report not found: {args.id}")
+    
+    elif args.command == 'gc':
+        result = sandbox.gc_samples()
+        print(f"✅ Removed {result['removed']} unreferenced sample(s), "
+              f"freed {result['bytes_freed'] / (1 << 20):.1f} MB")
+    
+    elif args.command == 'similar':
+        if not args.id:
+            print("Error: --id required")
+            sys.exit(1)
+        
+        matches = sandbox.similar_reports(args.id, args.top)
+        if matches is None:
+            print(f"No similarity digest for {args.id} (unknown report, or sample too small or uniform)")
+        elif not matches:
+            print(f"No similar samples found for {args.id}")
+        else:
+            print(f"\nSamples similar to {args.id} (distance 0 = identical, under ~50 = close variant):\n")
+            for match in matches:
+                print(f"[{match['verdict'].upper()}] {match['analysis_id']}  distance {match['distance']}")
+                print(f"  Sample: {match['sample_name']}")
+                print(f"  SHA256: {match['sha256']}")
+                print(f"  Threat Score: {match['threat_score']}/100\n")
+    
     elif args.command == 'list':
-        sandbox.list_reports()
+        if args.page < 1 or args.page_size < 1:
+            parser.error("--page and --page-size must be positive")
+        sandbox.list_reports(args.page, args.page_size, args.verdict, args.min_score, args.max_score, args.sort)
+    
+    elif args.command == 'pool':
+        pool = sandbox.sandbox_pool(args.slots)
+        try:
+            if args.action == 'provision':
+                print(f"✅ Prepared {pool.provision()} of {pool.size} environment(s) in {pool.root}")
+            elif args.action == 'drain':
+                removed = pool.drain()
+                # Per-sample directories left behind by versions without the pool
+                for leftover in sandbox.sandbox_dir.glob('sandbox-*'):
+                    shutil.rmtree(leftover, ignore_errors=True)
+                    removed += 1
+                print(f"✅ Removed {removed} idle environment(s)")
+            else:
+                for slot in pool.status():
+                    print(f"  env-{slot['slot']}: {slot['state']}")
+        except OSError as e:
+            print(f"❌ Sandbox pool unusable: {e}")
+            sys.exit(1)
+    
+    elif args.command == 'detonate':
+        def show(job, report, error):
+            if error:
+                print(f"❌ {job['analysis_id']}: {error}")
+            else:
+                print(f"✅ {job['analysis_id']}: {report['verdict']} ({report['threat_score']}/100)")
+        
+        scheduler = DetonationScheduler(sandbox, args.slots, on_result=show)
+        queued = sandbox.detonation_queue_stats().get('queued', 0)
+        print(f"Running {queued} queued detonation(s) with {scheduler.slots} slot(s)...")
+        summary = scheduler.run()
+        print(f"Completed: {summary['completed']}, Failed: {summary['failed']} in {summary['elapsed']:.1f}s")
+    
+    elif args.command == 'rules':
+        stats = sandbox.rule_stats(rebuild=args.action == 'compile')
+        if args.action == 'compile':
+            print(f"✅ Compiled {stats['rules']} rules ({stats['patterns']} patterns) "
+                  f"in {stats['compile_time']:.3f}s")
+        else:
+            print(f"Rule files:    {len(stats['rule_files']) or 'built-in rules'}")
+            print(f"Rules:         {stats['rules']} ({stats['skipped_rules']} skipped, {stats['errors']} errors)")
+            print(f"Patterns:      {stats['patterns']} ({stats['literal_patterns']} literal, "
+                  f"{stats['hex_patterns']} hex, {stats['regex_patterns']} regex)")
+            print(f"Compile time:  {stats['compile_time']:.3f}s")
+            print(f"Load time:     {stats['load_time']:.3f}s ({'cached' if stats['cache_hit'] else 'compiled'})")
+            print(f"Cache hits:    {stats['cache']['hits']} (misses: {stats['cache']['misses']})")
+        for skipped in sandbox.rules.skipped:
+            print(f"  skipped: {skipped}")
     
     elif args.command == 'clean':
         confirm = input("Delete all sandbox data? (yes/no): ")
         if confirm.lower() == 'yes':
-            import shutil
             shutil.rmtree(sandbox.sandbox_dir)
             print("Sandbox data cleaned.")
 